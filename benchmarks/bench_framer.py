@@ -0,0 +1,90 @@
+# benchmarks/bench_framer.py
+#
+# Uso: python -m benchmarks.bench_framer [--tramas 50000] [--repeticiones 3]
+#
+# Mide tramas/s al separar y decodificar tramas con forma real (todos los tipos de HEADERS_SPECIFIC,
+# con un 1 % de tramas truncadas) usando cada decodificador JSON disponible, y lo compara con el
+# método anterior (json.loads sobre trama[:-2] y reintento agregando '"}').
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import data_extractor
+from benchmarks.synthetic import generar_tramas
+
+
+def decodificar_legado(json_str):
+    """Decodificación anterior a frame_json_span: hasta dos json.loads por trama."""
+    start_json = json_str.find('{')
+    if start_json == -1:
+        return None
+    try:
+        return json.loads(json_str[start_json:-2])
+    except json.JSONDecodeError:
+        try:
+            return json.loads(json_str[start_json:] + '"}')
+        except ValueError:
+            return None
+
+
+def medir(funcion, tramas, repeticiones):
+    """Mejor tiempo de `repeticiones` pasadas; devuelve (tramas/s, tramas decodificadas)."""
+    mejor = float("inf")
+    decodificadas = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            decodificadas = sum(1 for trama in tramas if funcion(trama) is not None)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return len(tramas) / mejor, decodificadas
+
+
+def medir_archivo(ruta, repeticiones):
+    """Tramas/s leyendo un .log UTF-16 completo con iter_json_objects."""
+    mejor = float("inf")
+    total = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            total = sum(1 for _ in data_extractor.iter_json_objects(ruta))
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return total / mejor, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tramas por segundo del separador y los decodificadores JSON.')
+    parser.add_argument('--tramas', type=int, default=50000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--truncadas', type=float, default=0.01, help='Proporción de tramas truncadas.')
+    args = parser.parse_args()
+
+    tramas = generar_tramas(args.tramas, proporcion_truncadas=args.truncadas)
+    print(f"{len(tramas)} tramas sintéticas, {args.repeticiones} repeticiones (mejor tiempo).")
+
+    tasa, ok = medir(decodificar_legado, tramas, args.repeticiones)
+    print(f"{'legado (json)':<22} {tasa:>12,.0f} tramas/s  {ok} decodificadas")
+    base = tasa
+
+    for nombre in data_extractor.JSON_DECODERS:
+        data_extractor.set_json_decoder(nombre)
+        tasa, ok = medir(data_extractor.decode_frame, tramas, args.repeticiones)
+        print(f"{'una pasada (' + nombre + ')':<22} {tasa:>12,.0f} tramas/s  {ok} decodificadas  x{tasa / base:.2f}")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, 'bench.log')
+        with open(ruta, 'w', encoding='utf-16') as archivo:
+            archivo.write(''.join(tramas))
+        for nombre in data_extractor.JSON_DECODERS:
+            data_extractor.set_json_decoder(nombre)
+            tasa, ok = medir_archivo(ruta, args.repeticiones)
+            print(f"{'archivo (' + nombre + ')':<22} {tasa:>12,.0f} tramas/s  {ok} decodificadas")
+    data_extractor.set_json_decoder(None)
+
+
+if __name__ == "__main__":
+    main()
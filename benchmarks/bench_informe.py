@@ -0,0 +1,88 @@
+# benchmarks/bench_informe.py
+#
+# Uso: python -m benchmarks.bench_informe [--buses 100] [--anios 3]
+#
+# Compara el informe semanal escrito en una pasada con openpyxl en modo de solo escritura contra el
+# método anterior (pd.ExcelWriter, load_workbook, recorrer todas las celdas y guardar de nuevo), sobre
+# una flota y un número de años sintéticos. Informa segundos y memoria máxima (tracemalloc).
+# Ejecutar desde la raíz del proyecto.
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+
+from benchmarks.synthetic import generar_cobertura
+from utils.genetate_resume import escribir_informe_excel, DIAS_ORDENADOS
+
+
+def escribir_informe_legado(datos, output_file):
+    """crear_informe_excel antes del modo de solo escritura: dos serializaciones y el libro completo en memoria."""
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        for año in datos['Año'].unique():
+            pivot_table = pd.pivot_table(datos[datos['Año'] == año], index=['Semana', 'bus'], columns='DíaSemana',
+                                         values='info', aggfunc=lambda x: '\n'.join(x), fill_value='')
+            pivot_table = pivot_table.reindex(columns=DIAS_ORDENADOS)
+            pivot_table.dropna(how='all', inplace=True)
+            pivot_table.to_excel(writer, sheet_name=str(año))
+
+    workbook = load_workbook(output_file)
+    for sheet_name in workbook.sheetnames:
+        sheet = workbook[sheet_name]
+        color_naranja = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")
+        color_amarillo = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+        color_verde = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
+        for row in sheet.iter_rows(min_row=2, min_col=2):
+            for cell in row:
+                if cell.value:
+                    contains_txt = '[TXT]' in cell.value
+                    contains_log = '[LOG]' in cell.value
+                    if contains_txt and contains_log:
+                        cell.fill = color_verde
+                    elif contains_txt:
+                        cell.fill = color_naranja
+                    elif contains_log:
+                        cell.fill = color_amarillo
+    workbook.save(output_file)
+
+
+def medir(funcion, datos, ruta):
+    """Segundos de una ejecución normal y memoria máxima de otra con tracemalloc (que la hace más lenta)."""
+    inicio = time.perf_counter()
+    funcion(datos, ruta)
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcion(datos, ruta)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return segundos, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiempo y memoria del informe semanal en Excel.')
+    parser.add_argument('--buses', type=int, default=100)
+    parser.add_argument('--anios', type=int, default=3)
+    parser.add_argument('--sin_legado', action='store_true', help='No medir el método anterior.')
+    args = parser.parse_args()
+
+    datos = generar_cobertura(args.buses, args.anios)
+    print(f"{len(datos)} filas de cobertura: {args.buses} buses, {args.anios} años.")
+
+    metodos = [("una pasada", escribir_informe_excel)]
+    if not args.sin_legado:
+        metodos.append(("legado", escribir_informe_legado))
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre, funcion in metodos:
+            ruta = os.path.join(carpeta, f"{nombre}.xlsx")
+            segundos, pico = medir(funcion, datos, ruta)
+            print(f"{nombre:<12} {segundos:>8.2f} s  {pico / 1e6:>8.1f} MB pico  "
+                  f"{os.path.getsize(ruta) / 1e6:.1f} MB en disco")
+
+
+if __name__ == "__main__":
+    main()
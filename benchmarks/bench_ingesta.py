@@ -0,0 +1,275 @@
+# benchmarks/bench_ingesta.py
+#
+# Uso: python -m benchmarks.bench_ingesta [--buses 3] [--tramas 5000] [--filas_txt 50000]
+#                                         [--salida resultados.json] [--comparar anterior.json]
+#
+# Mide de punta a punta la ingesta sobre un árbol sintético de carpetas de bus (benchmarks.synthetic):
+# cada etapa (separación de tramas, decodificación, construcción de filas, inserción, process_file,
+# sensores, informe y estadísticas) se ejecuta en un proceso nuevo y se informa registros/s y el pico de
+# RSS de ese proceso. Los resultados se guardan en JSON para comparar entre commits: con --comparar se
+# imprime la razón contra un resultado anterior. Ejecutar desde la raíz del proyecto.
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.synthetic import generar_arbol
+
+
+def pico_rss_mb():
+    """Pico de memoria residente del proceso actual en MB, o None si la plataforma no lo informa."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memoria = psutil.Process().memory_info()
+    return getattr(memoria, "peak_wset", memoria.rss) / (1024 * 1024)
+
+
+def _tramas(rutas):
+    from data_extractor import iter_log_frames
+    return [frame for ruta in rutas["log"] for _, _, frame in iter_log_frames(ruta)]
+
+
+def _objetos(rutas):
+    from data_extractor import decode_frame
+    return [obj for obj in map(decode_frame, _tramas(rutas)) if obj is not None]
+
+
+def _lotes(rutas):
+    from config import BATCH_ROWS
+    from file_processor import prepare_batches
+    objetos = iter(_objetos(rutas))
+    return [prepare_batches(bloque) for bloque in iter(lambda: list(itertools.islice(objetos, BATCH_ROWS)), [])]
+
+
+def _bus(ruta):
+    return os.path.basename(os.path.dirname(ruta)).split('-')[0]
+
+
+# Cada etapa recibe las rutas del árbol y una carpeta de trabajo, prepara lo que necesita fuera del
+# tiempo medido y devuelve (registros, segundos)
+
+def etapa_separacion(rutas, carpeta):
+    from data_extractor import iter_log_frames
+    inicio = time.perf_counter()
+    registros = sum(1 for ruta in rutas["log"] for _ in iter_log_frames(ruta))
+    return registros, time.perf_counter() - inicio
+
+
+def etapa_extract_json_objects(rutas, carpeta):
+    from data_extractor import extract_json_objects
+    textos = []
+    for ruta in rutas["log"]:
+        with open(ruta, encoding='utf-16') as archivo:
+            textos.append(archivo.read())
+    inicio = time.perf_counter()
+    registros = sum(len(extract_json_objects(texto)) for texto in textos)
+    return registros, time.perf_counter() - inicio
+
+
+def etapa_decodificacion(rutas, carpeta):
+    from data_extractor import decode_frame
+    tramas = _tramas(rutas)
+    inicio = time.perf_counter()
+    registros = sum(1 for trama in tramas if decode_frame(trama) is not None)
+    return registros, time.perf_counter() - inicio
+
+
+def etapa_filas(rutas, carpeta):
+    from config import BATCH_ROWS
+    from file_processor import prepare_batches
+    objetos = _objetos(rutas)
+    inicio = time.perf_counter()
+    registros = sum(prepare_batches(objetos[i:i + BATCH_ROWS])["registros"] for i in range(0, len(objetos), BATCH_ROWS))
+    return registros, time.perf_counter() - inicio
+
+
+def etapa_insercion(rutas, carpeta):
+    from database import create_connection
+    from schema import ensure_schema
+    from file_processor import write_batches
+    lotes = _lotes(rutas)
+    conn = create_connection(os.path.join(carpeta, "insercion.db"))
+    ensure_schema(conn)
+    inicio = time.perf_counter()
+    conn.execute("BEGIN")
+    for lote in lotes:
+        write_batches(conn, lote)
+    conn.commit()
+    segundos = time.perf_counter() - inicio
+    conn.close()
+    return sum(lote["registros"] for lote in lotes), segundos
+
+
+def etapa_process_file(rutas, carpeta):
+    import sqlite3
+    from config import HEADERS_SPECIFIC
+    from file_processor import process_file
+    db_path = os.path.join(carpeta, "process_file.db")
+    inicio = time.perf_counter()
+    for ruta in rutas["log"]:
+        process_file(ruta, None, db_path)
+    segundos = time.perf_counter() - inicio
+    conn = sqlite3.connect(db_path)
+    registros = sum(conn.execute(f"SELECT count(*) FROM {tipo}").fetchone()[0] for tipo in HEADERS_SPECIFIC)
+    conn.close()
+    return registros, segundos
+
+
+def etapa_sensor(rutas, carpeta):
+    from sensor_data_processor import sensor
+    inicio = time.perf_counter()
+    registros = sum(len(sensor(ruta, _bus(ruta))) for ruta in rutas["txt"])
+    return registros, time.perf_counter() - inicio
+
+
+def _guardar_sensores(rutas, db_path):
+    from save_to_database import guardar_sensores_por_bloques
+    from sensor_data_processor import sensor_por_bloques
+    return sum(guardar_sensores_por_bloques(sensor_por_bloques(ruta, _bus(ruta)), db_path) for ruta in rutas["txt"])
+
+
+def etapa_sensor_insercion(rutas, carpeta):
+    inicio = time.perf_counter()
+    registros = _guardar_sensores(rutas, os.path.join(carpeta, "sensores.db"))
+    return registros, time.perf_counter() - inicio
+
+
+def etapa_informe(rutas, carpeta):
+    import shutil
+    from utils.genetate_resume import obtener_datos_por_semana, escribir_informe_excel
+    # Reutiliza la base de process_file y le agrega los sensores para que el informe tenga ambas fuentes
+    db_path = os.path.join(carpeta, "informe.db")
+    shutil.copyfile(os.path.join(carpeta, "process_file.db"), db_path)
+    _guardar_sensores(rutas, db_path)
+    inicio = time.perf_counter()
+    datos = obtener_datos_por_semana(db_path)
+    escribir_informe_excel(datos, os.path.join(carpeta, "informe.xlsx"))
+    return len(datos), time.perf_counter() - inicio
+
+
+def etapa_estadisticas(rutas, carpeta):
+    from processors.data_processor import DataProcessor
+    # Estadísticas por día de P60 sobre la base de process_file, con cuantiles (una pasada por bloques)
+    procesador = DataProcessor(os.path.join(carpeta, "process_file.db"))
+    inicio = time.perf_counter()
+    resultado = procesador.calcular_estadisticas("P60", agrupar_por="dia")
+    segundos = time.perf_counter() - inicio
+    return int(resultado.xs("count", axis=1, level=1).max(axis=1).sum()), segundos
+
+
+# Nombre -> función, en el orden de ejecución (informe y estadisticas usan la base que deja process_file)
+ETAPAS = {
+    "separacion": etapa_separacion,
+    "extract_json_objects": etapa_extract_json_objects,
+    "decodificacion": etapa_decodificacion,
+    "filas": etapa_filas,
+    "insercion": etapa_insercion,
+    "process_file": etapa_process_file,
+    "sensor": etapa_sensor,
+    "sensor_insercion": etapa_sensor_insercion,
+    "informe": etapa_informe,
+    "estadisticas": etapa_estadisticas,
+}
+
+
+def ejecutar_etapa(nombre, rutas, carpeta):
+    """Se ejecuta en un proceso nuevo: corre la etapa sin salida por consola y mide su pico de RSS."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        registros, segundos = ETAPAS[nombre](rutas, carpeta)
+    return {
+        "registros": registros,
+        "segundos": round(segundos, 4),
+        "registros_s": round(registros / segundos, 1) if segundos else None,
+        "pico_rss_mb": pico_rss_mb(),
+    }
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir_comparacion(resultado, anterior):
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')}):")
+    for nombre, etapa in resultado["etapas"].items():
+        previa = anterior.get("etapas", {}).get(nombre)
+        if not previa or not previa.get("registros_s") or not etapa.get("registros_s"):
+            continue
+        print(f"  {nombre:<22} x{etapa['registros_s'] / previa['registros_s']:.2f} registros/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Registros/s y pico de RSS de cada etapa de la ingesta.')
+    parser.add_argument('--buses', type=int, default=3)
+    parser.add_argument('--logs_por_bus', type=int, default=2)
+    parser.add_argument('--tramas', type=int, default=5000, help='Tramas por archivo .log.')
+    parser.add_argument('--txt_por_bus', type=int, default=1)
+    parser.add_argument('--filas_txt', type=int, default=50000, help='Líneas por archivo .txt.')
+    parser.add_argument('--truncadas', type=float, default=0.01, help='Proporción de tramas truncadas.')
+    parser.add_argument('--etapas', nargs='+', choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument('--salida', type=str, default=None, help='Archivo JSON donde guardar los resultados.')
+    parser.add_argument('--comparar', type=str, default=None, help='Resultado JSON anterior para comparar.')
+    args = parser.parse_args()
+
+    seleccion = set(args.etapas)
+    if seleccion & {"informe", "estadisticas"}:
+        seleccion.add("process_file")
+    etapas = [nombre for nombre in ETAPAS if nombre in seleccion]
+
+    resultado = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar", "etapas")},
+        "etapas": {},
+    }
+    with tempfile.TemporaryDirectory() as carpeta:
+        rutas = generar_arbol(os.path.join(carpeta, "entrada"), args.buses, args.logs_por_bus, args.tramas,
+                              args.txt_por_bus, args.filas_txt, args.truncadas)
+        print(f"Árbol sintético: {len(rutas['log'])} .log, {len(rutas['txt'])} .txt.")
+        contexto = multiprocessing.get_context("spawn")
+        for nombre in etapas:
+            # Un proceso por etapa, para que el pico de RSS sea solo el de esa etapa
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                etapa = executor.submit(ejecutar_etapa, nombre, rutas, carpeta).result()
+            resultado["etapas"][nombre] = etapa
+            rss = f"{etapa['pico_rss_mb']:.0f} MB" if etapa["pico_rss_mb"] is not None else "-"
+            print(f"{nombre:<22} {etapa['registros']:>9} registros {etapa['segundos']:>8.2f} s "
+                  f"{etapa['registros_s'] or 0:>12,.0f} registros/s  RSS {rss}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.salida}.")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            imprimir_comparacion(resultado, json.load(archivo))
+
+
+if __name__ == "__main__":
+    main()
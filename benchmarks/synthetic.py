@@ -0,0 +1,168 @@
+# benchmarks/synthetic.py
+
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from config import HEADERS_SPECIFIC
+
+
+def clave_tipo(tipo):
+    """Clave JSON que identifica el tipo de trama (la misma que usa prepare_batches)."""
+    if tipo.startswith("P"):
+        return "codigoPeriodica"
+    if tipo.startswith("ALA"):
+        return "codigoAlarma"
+    return "codigoEvento"
+
+
+def generar_objeto(i, tipo, id_vehiculo, momento, rng=random):
+    """Objeto JSON de una trama `tipo` con los campos de COMMON_HEADERS y HEADERS_SPECIFIC."""
+    lectura = momento.strftime('%d/%m/%Y %H:%M:%S.') + f"{momento.microsecond // 1000:03d}"
+    envio = (momento + timedelta(milliseconds=rng.randint(50, 900)))
+    obj = {
+        "versionTrama": "E.1.0.0",
+        "idRegistro": i,
+        "idOperador": "OP01",
+        "idVehiculo": f"Z63-{id_vehiculo:04d}",
+        "idRuta": str(rng.choice([128, 230, 512, 731, 1044])),
+        "idConductor": rng.choice(["No Disponible", "10233", "10871", "11402"]),
+        "fechaHoraLecturaDato": lectura,
+        "fechaHoraEnvioDato": envio.strftime('%d/%m/%Y %H:%M:%S.') + f"{envio.microsecond // 1000:03d}",
+        "tipoBus": "Padron",
+        "localizacionVehiculo": {"latitud": round(4.6 + rng.random() / 10, 6),
+                                 "longitud": round(-74.1 + rng.random() / 10, 6)},
+        "tipoTrama": tipo,
+        # La clave del tipo va antes de los campos de texto, para que una trama truncada (ver generar_trama)
+        # la conserve
+        clave_tipo(tipo): tipo,
+        "tecnologiaMotor": "2",
+        "tramaRetransmitida": rng.random() < 0.02,
+        "tipoFreno": "1",
+    }
+    for header, dtype in HEADERS_SPECIFIC[tipo]:
+        if header in obj:
+            continue
+        obj[header] = round(rng.uniform(0, 120), 2) if dtype == "REAL" else rng.choice(["0", "1", "2"])
+    return obj
+
+
+def generar_trama(i, tipo, id_vehiculo, momento, truncada=False, rng=random):
+    """
+    Texto de una trama tal como aparece en los .log: marca de fecha, prefijo y JSON.
+    Con truncada=True el JSON se corta dentro del último valor de texto, como las tramas que el
+    equipo deja a medio escribir (las que `frame_json_span` cierra con '"}'); ese valor siempre está
+    después de la clave del tipo, así que la trama reparada se inserta y no va a la cuarentena.
+    """
+    texto = json.dumps(generar_objeto(i, tipo, id_vehiculo, momento, rng), ensure_ascii=False)
+    if truncada:
+        texto = texto[:texto.rfind('": "') + 5]
+    return f"[{momento:%Y/%m/%d %H:%M:%S}] Trama enviada: {texto}\r\n\r\n"
+
+
+def generar_tramas(n, id_vehiculo=1, inicio=None, proporcion_truncadas=0.01, semilla=0, primer_registro=0):
+    """
+    Lista de `n` tramas con la mezcla de tipos de una jornada real: sobre todo P20/P60 y
+    algunos eventos y alarmas de cada tipo de HEADERS_SPECIFIC. idRegistro empieza en `primer_registro`.
+    """
+    rng = random.Random(semilla)
+    momento = inicio or datetime(2024, 5, 6, 5, 0, 0)
+    tipos = list(HEADERS_SPECIFIC)
+    eventos = [tipo for tipo in tipos if tipo not in ("P20", "P60")]
+    tramas = []
+    for i in range(n):
+        r = rng.random()
+        tipo = "P20" if r < 0.6 else ("P60" if r < 0.85 else rng.choice(eventos))
+        momento += timedelta(milliseconds=rng.randint(200, 1500))
+        truncada = rng.random() < proporcion_truncadas
+        tramas.append(generar_trama(primer_registro + i, tipo, id_vehiculo, momento, truncada, rng))
+    return tramas
+
+
+def escribir_log(ruta, n, id_vehiculo=1, inicio=None, proporcion_truncadas=0.01, semilla=0, primer_registro=0):
+    """Escribe un .log UTF-16 con `n` tramas de generar_tramas. Devuelve el tamaño en bytes."""
+    with open(ruta, 'w', encoding='utf-16', newline='') as archivo:
+        archivo.write(''.join(generar_tramas(n, id_vehiculo, inicio, proporcion_truncadas, semilla, primer_registro)))
+    return os.path.getsize(ruta)
+
+
+def generar_lineas_sensor(n, inicio=None, semilla=0):
+    """
+    Líneas de un .txt de sensores a 100 Hz: fecha con milisegundos, aceleración, campo magnético,
+    giroscopio, orientación y posición, en el orden de `sensor_data_processor.NOMBRES_COLUMNAS`.
+    """
+    rng = random.Random(semilla)
+    momento = inicio or datetime(2024, 5, 6, 5, 0, 0)
+    lat, lon = 4.6 + rng.random() / 10, -74.1 + rng.random() / 10
+    lineas = []
+    for _ in range(n):
+        momento += timedelta(milliseconds=10)
+        lat += rng.uniform(-1e-5, 1e-5)
+        lon += rng.uniform(-1e-5, 1e-5)
+        valores = [rng.gauss(0, 0.3), rng.gauss(0, 0.3), rng.gauss(9.8, 0.3)]
+        valores += [rng.uniform(-50, 50) for _ in range(6)] + [rng.uniform(0, 360) for _ in range(3)]
+        lineas.append(f"{momento:%Y-%m-%d %H:%M:%S}.{momento.microsecond // 1000:03d},"
+                      + ",".join(f"{v:.4f}" for v in valores) + f",{lat:.6f},{lon:.6f}\n")
+    return lineas
+
+
+def escribir_txt(ruta, n, inicio=None, semilla=0):
+    """Escribe un .txt de sensores con `n` líneas de generar_lineas_sensor. Devuelve el tamaño en bytes."""
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        archivo.writelines(generar_lineas_sensor(n, inicio, semilla))
+    return os.path.getsize(ruta)
+
+
+def generar_arbol(raiz, buses=3, logs_por_bus=2, tramas_por_log=5000, txt_por_bus=1, filas_por_txt=50000,
+                  proporcion_truncadas=0.01, semilla=0):
+    """
+    Árbol de entrada como el que recorre `main.procesar_archivos`: una carpeta '<bus>-Z63' por bus con
+    sus .log (un día por archivo, con idRegistro distintos en todo el árbol) y sus .txt de sensores.
+    Devuelve {'log': [...], 'txt': [...]} con las rutas creadas.
+    """
+    rutas = {"log": [], "txt": []}
+    for b in range(buses):
+        id_vehiculo = 1001 + b
+        carpeta = os.path.join(raiz, f"{id_vehiculo}-Z63")
+        os.makedirs(carpeta, exist_ok=True)
+        for d in range(logs_por_bus):
+            inicio = datetime(2024, 5, 6, 5, 0, 0) + timedelta(days=d)
+            ruta = os.path.join(carpeta, f"{inicio:%Y%m%d}.log")
+            escribir_log(ruta, tramas_por_log, id_vehiculo, inicio, proporcion_truncadas, semilla + 1000 * b + d,
+                         len(rutas["log"]) * tramas_por_log)
+            rutas["log"].append(ruta)
+        for d in range(txt_por_bus):
+            inicio = datetime(2024, 5, 6, 5, 0, 0) + timedelta(days=d)
+            ruta = os.path.join(carpeta, f"sensores_{inicio:%Y%m%d}.txt")
+            escribir_txt(ruta, filas_por_txt, inicio, semilla + 1000 * b + d)
+            rutas["txt"].append(ruta)
+    return rutas
+
+
+def generar_cobertura(buses=100, anios=3, inicio=None, semilla=0):
+    """
+    Filas del informe semanal (como las devuelve `genetate_resume.obtener_datos_por_semana`) para una
+    flota de `buses` durante `anios` años: casi todos los días con LOG, y TXT en parte de ellos.
+    """
+    import pandas as pd
+
+    rng = random.Random(semilla)
+    inicio = inicio or datetime(2022, 1, 1)
+    filas = []
+    for dia in range(365 * anios):
+        fecha = inicio + timedelta(days=dia)
+        for bus in range(1, buses + 1):
+            fuentes = []
+            if rng.random() < 0.9:
+                fuentes.append("LOG")
+            if rng.random() < 0.3:
+                fuentes.append("TXT")
+            for fuente in fuentes:
+                desde = fecha + timedelta(minutes=rng.randint(240, 480))
+                hasta = desde + timedelta(minutes=rng.randint(60, 900))
+                info = f"({desde:%H:%M} - {hasta:%H:%M}) [TXT]" if fuente == "TXT" else "[LOG]"
+                filas.append((fecha.strftime('%Y'), fecha.strftime('%U'), fecha.strftime('%A'), f"{bus:04d}",
+                              fuente, desde, hasta, info))
+    return pd.DataFrame(filas, columns=['Año', 'Semana', 'DíaSemana', 'bus', 'source', 'HoraInicio', 'HoraFin',
+                                        'info'])
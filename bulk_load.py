@@ -0,0 +1,94 @@
+# bulk_load.py
+
+import time
+
+from config import CHECKPOINT_ROWS
+from dedup import get_duplicate_filter
+from database import create_connection, create_indexes, drop_indexes
+from dimension_cache import get_dimension_cache
+from schema import ensure_schema
+from sensor_store import commit_sensor_store, rollback_sensor_store
+from shards import get_shard_router, release_shard_router
+
+
+class SesionCarga:
+    """
+    Conexión de escritura compartida por todos los archivos de una ejecución.
+
+    Aplica un perfil de PRAGMAs (ver SQLITE_PROFILES en config), prepara las tablas una sola vez y
+    mantiene una única transacción que solo se confirma en los checkpoints, cada `checkpoint_filas`
+    filas, y al cerrar la sesión.
+
+    `indices` indica cuándo se crean los índices declarados: "al_inicio" los mantiene durante la carga,
+    "al_final" los elimina al empezar y los reconstruye al cerrar (recomendado para cargas históricas)
+    y "no" no los toca.
+    """
+
+    def __init__(self, db_path, perfil="normal", checkpoint_filas=CHECKPOINT_ROWS, indices="al_inicio"):
+        self.db_path = db_path
+        self.perfil = perfil
+        self.checkpoint_filas = checkpoint_filas
+        self.indices = indices
+        self.conn = create_connection(db_path, perfil)
+        ensure_schema(self.conn)
+        if indices == "al_inicio":
+            create_indexes(self.conn)
+        elif indices == "al_final":
+            drop_indexes(self.conn)
+        self.dimensiones = get_dimension_cache(self.conn)
+        self.duplicados = get_duplicate_filter(self.conn)
+
+        self.filas = 0
+        self.filas_sin_confirmar = 0
+        self.checkpoints = 0
+        self.inicio = time.perf_counter()
+
+    def registrar_filas(self, filas):
+        """
+        Suma filas escritas en la transacción abierta y confirma si se alcanzó el checkpoint o si hay
+        demasiadas particiones mensuales adjuntas (ver shards.ShardRouter.crowded). Se llama entre archivos.
+        """
+        self.filas += filas
+        self.filas_sin_confirmar += filas
+        particiones = get_shard_router(self.conn)
+        if self.filas_sin_confirmar >= self.checkpoint_filas or (particiones is not None and particiones.crowded()):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Confirma la transacción abierta y, sin cambios pendientes, suelta las particiones si son demasiadas."""
+        self.conn.commit()
+        # El almacén columnar de sensores se confirma después de la base, con las mismas filas
+        commit_sensor_store()
+        self.filas_sin_confirmar = 0
+        self.checkpoints += 1
+        particiones = get_shard_router(self.conn)
+        if particiones is not None and particiones.crowded():
+            particiones.detach_all()
+
+    def cerrar(self):
+        """Confirma lo pendiente, cierra la conexión e informa las filas por segundo de la ejecución."""
+        self.checkpoint()
+        particiones = release_shard_router(self.conn)
+        if self.indices != "no":
+            # Con "al_final" reconstruye los índices eliminados al empezar
+            create_indexes(self.conn)
+        self.conn.close()
+        segundos = time.perf_counter() - self.inicio
+        print(f"Carga terminada: {self.filas} filas en {segundos:.1f} s "
+              f"({self.filas / (segundos or 1e-9):.0f} filas/s, perfil '{self.perfil}', "
+              f"{self.checkpoints} confirmaciones).")
+        print(f"Caché de dimensiones: {self.dimensiones.resumen()}.")
+        print(f"Tramas duplicadas: {self.duplicados.resumen()}.")
+        if particiones is not None:
+            print(f"Particiones mensuales: {particiones.resumen()}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # Un error o Ctrl+C a mitad de un archivo: se descarta lo no confirmado desde el último checkpoint,
+            # que se volverá a leer porque el manifiesto confirmado tampoco lo registra
+            self.conn.rollback()
+            rollback_sensor_store()
+        self.cerrar()
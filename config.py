@@ -3,14 +3,112 @@
 
 import re
 
-# Crear listas globales para mantener los identificadores únicos
-inserted_vehiculos = set()
-inserted_conductores = set()
-inserted_versiones = set()
-
 # Patrón para identificar el inicio de cada log, basado en la fecha/hora
 LOG_PATTERN = re.compile(r'\[\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}]')
 
+# Lectura por bloques de los .log: bytes leídos por bloque y filas acumuladas antes de escribir en SQLite
+LOG_CHUNK_SIZE = 1 << 20
+BATCH_ROWS = 5000
+
+# Un .log modificado hace menos de estos segundos puede estar a mitad de escribirse: si su última trama está
+# cortada se deja para la próxima ingesta (ver file_processor.hold_back_partial_tail). En un archivo más antiguo,
+# terminado o archivado, la trama cortada se repara como siempre (ver data_extractor.frame_json_span)
+PARTIAL_TAIL_SECONDS = 10
+
+# Filas por bloque al importar los .txt de sensores en streaming
+SENSOR_CHUNK_ROWS = 100000
+
+# Decodificador JSON de las tramas ("json", "orjson"); None usa el más rápido que esté instalado
+JSON_DECODER = None
+
+# Formato en que se guardan fechaHoraLecturaDato y fechaHoraEnvioDato: "iso" ('YYYY-mm-dd HH:MM:SS.fff', texto
+# ordenable) o "epoch_ms" (entero de milisegundos, tomando la hora local del equipo como si fuera UTC)
+TIMESTAMP_MODE = "iso"
+TIMESTAMP_FIELDS = ("fechaHoraLecturaDato", "fechaHoraEnvioDato")
+
+# Perfiles de PRAGMAs para la conexión de escritura. "normal" conserva los valores por defecto de SQLite;
+# "carga_masiva" está pensado para cargas históricas, donde el límite debe ser el análisis y no los fsync
+SQLITE_PROFILES = {
+    "normal": {},
+    "carga_masiva": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262144,      # 256 MB (valores negativos en KiB)
+        "mmap_size": 1 << 30,       # 1 GB
+        "temp_store": "MEMORY",
+    },
+}
+
+# Filas escritas entre confirmaciones cuando una ejecución comparte una sola transacción
+CHECKPOINT_ROWS = 200000
+
+# Catálogo de esquema (ver schema.py): con True las tablas nuevas se crean como STRICT (tipos verificados por
+# SQLite, requiere SQLite 3.37 o superior). No cambia las tablas que ya existen
+SCHEMA_STRICT = False
+
+# Deduplicación de tramas (ver dedup.py). SQLite solo hace cumplir la clave primaria idRegistro de cada tabla,
+# así que TRAMA_INSERT_CONFLICT decide qué pasa con una fila cuyo idRegistro ya existe: "IGNORE" conserva la
+# primera (también si es una retransmisión corregida u otro vehículo que repite el idRegistro) y "REPLACE" la
+# última, como antes, a costa de borrar y volver a insertar. Solo con "IGNORE", antes de llegar a SQLite, un
+# filtro en memoria descarta las filas cuya clave TRAMA_DEDUP_KEY ya se escribió en la ejecución, hasta
+# DEDUP_MAX_KEYS claves por tabla (unos 70 bytes por clave). Es la misma clave que SQLite deduplica (idRegistro
+# en cada tabla, o codigo e idRegistro en Eventos, ver events.py), así que el filtro solo se adelanta a SQLite
+TRAMA_DEDUP_KEY = ("idRegistro",)
+TRAMA_INSERT_CONFLICT = "IGNORE"
+DEDUP_MAX_KEYS = 1000000
+
+# Almacenamiento de eventos y alarmas (ver events.py): "tablas" crea una tabla por tipo (EV1, ALA1, ...);
+# "consolidada" los guarda en una sola tabla Eventos (columnas comunes, código y los campos propios del tipo
+# como JSON) con vistas de compatibilidad con los nombres de las tablas por tipo. Solo se aplica al crear la
+# base; las existentes conservan su formato hasta consolidarlas con main.py --consolidar_eventos
+EVENT_STORAGE = "tablas"
+
+# Particiones mensuales (ver shards.py): con True las tramas y los sensores se guardan en un archivo por mes,
+# <db_path sin extensión>_meses/YYYY-MM.db, según fechaHoraLecturaDato o la columna time de los sensores. La base
+# principal conserva las dimensiones, el manifiesto, la cobertura, los agregados y los catálogos, y las filas
+# sin fecha; las de meses ya cerrados se descartan. SHARD_MAX_ATTACHED es el máximo de particiones adjuntas a la
+# vez a una conexión (SQLite admite 10 por defecto)
+SHARD_BY_MONTH = False
+SHARD_MAX_ATTACHED = 10
+
+# Motor de estadísticas (processors/data_processor.py): filas por bloque al recorrer los datos para los
+# cuantiles, tamaño k de cada resumen de cuantiles (error de rango ~1.7/k y unos 3·k valores en memoria por
+# columna y grupo) y número de resultados guardados en caché
+STATS_CHUNK_ROWS = 50000
+STATS_SKETCH_K = 200
+STATS_CACHE_SIZE = 32
+
+# Índices secundarios declarados: (sufijo, columnas). Los de TRAMA_INDEXES se crean en cada tabla de
+# HEADERS_SPECIFIC con el nombre idx_<tabla>_<sufijo>; TABLE_INDEXES es para tablas puntuales
+TRAMA_INDEXES = [
+    ("vehiculo_fecha", ("idVehiculo", "fechaHoraLecturaDato")),
+    ("ruta", ("idRuta",)),
+]
+TABLE_INDEXES = {
+    "sensores": [("bus_time", ("bus", "time"))],
+    "Paradas": [("nombre", ("nombreParada",))],
+    "Eventos": [
+        ("vehiculo_fecha", ("idVehiculo", "fechaHoraLecturaDato")),
+        ("codigo_fecha", ("codigo", "fechaHoraLecturaDato")),
+    ],
+}
+
+# Almacén columnar opcional de los datos de sensores (ver sensor_store.py): carpeta raíz, o None para
+# guardarlos solo en la tabla 'sensores'. time se guarda como int64 (ns desde 1970)
+SENSOR_STORE_PATH = None
+SENSOR_STORE_COLUMNS = [("time", "int64")] + [
+    (columna, "float64") for columna in
+    ["ax", "ay", "az", "mx", "my", "mz", "gx", "gy", "gz", "orx", "oy", "or", "lat", "lon"]
+]
+
+# Agregados de la tabla 'sensores' mantenidos durante la ingesta (ver sensor_rollups.py): (tabla, frecuencia
+# de pandas). Una lista vacía los desactiva
+SENSOR_ROLLUPS = [
+    ("sensores_1s", "1s"),
+    ("sensores_1min", "1min"),
+    ("sensores_1h", "1h"),
+]
+
 # Constantes para los encabezados con tipos de datos
 COMMON_HEADERS = [
     ("versionTrama", "TEXT"),
@@ -169,6 +267,76 @@ versiones_trama_headers = [
     ("versionTrama", "TEXT")                    # Versión de la trama (ej. 'E.1.0.0')
 ]
 
+# Manifiesto de ingesta: un registro por archivo procesado para omitir los que no cambiaron
+# y retomar los que crecieron desde el último byte consumido
+manifiesto_headers = [
+    ("ruta", "TEXT PRIMARY KEY"),           # Ruta absoluta del archivo
+    ("tamano", "INTEGER"),                  # Tamaño en bytes al momento de procesarlo
+    ("mtime_ns", "INTEGER"),                # Fecha de modificación (nanosegundos)
+    ("hash_contenido", "TEXT"),             # SHA-256 de los primeros MANIFEST_HASH_BYTES bytes
+    ("offset_bytes", "INTEGER"),            # Último byte consumido
+    ("fecha_ingesta", "TEXT")               # Fecha y hora de la última ingesta
+]
+MANIFEST_HASH_BYTES = 64 * 1024
+
+# Cobertura diaria: primer y último registro de cada bus por día y fuente ('TXT' para sensores, 'LOG' para
+# las tramas P60), mantenida durante la ingesta para el informe semanal
+cobertura_headers = [
+    ("bus", "TEXT"),                        # Últimos 4 caracteres del bus / idVehiculo
+    ("fecha", "TEXT"),                      # 'YYYY-mm-dd'
+    ("fuente", "TEXT"),                     # 'TXT' o 'LOG'
+    ("desde", "TEXT"),                      # Primer registro del día, 'YYYY-mm-dd HH:MM:SS'
+    ("hasta", "TEXT"),                      # Último registro del día
+    ("registros", "INTEGER"),               # Registros recibidos
+    ("pendiente", "INTEGER"),               # 1 si cambió desde la última vez que se generó el informe
+    ("PRIMARY KEY", "(bus, fecha, fuente)")
+]
+
+# Informe semanal precalculado (ver utils/genetate_resume.py), una fila por bus, día y fuente
+informe_headers = [
+    ("Año", "TEXT"),
+    ("Semana", "TEXT"),
+    ("DíaSemana", "TEXT"),
+    ("bus", "TEXT"),
+    ("source", "TEXT"),
+    ("HoraInicio", "TEXT"),
+    ("HoraFin", "TEXT"),
+    ("info", "TEXT"),
+    ("fecha", "TEXT")
+]
+
+# Cuarentena de tramas rechazadas (ver quarantine.py): JSON que no se pudo decodificar o tipo de trama que no
+# está en HEADERS_SPECIFIC. Se guardan con su origen para reingresarlas con main.py --reprocesar_cuarentena
+cuarentena_headers = [
+    ("archivo", "TEXT"),                    # Archivo de origen
+    ("offset", "INTEGER"),                  # Byte de inicio de la trama en el archivo
+    ("motivo", "TEXT"),                     # 'json_invalido' o 'tipo_desconocido'
+    ("tipo", "TEXT"),                       # Tipo de trama, si se pudo leer
+    ("texto", "TEXT"),                      # Trama completa, tal como está en el archivo
+    ("fecha_ingesta", "TEXT"),
+    ("PRIMARY KEY", "(archivo, offset)")
+]
+# Segundos mínimos entre mensajes de consola sobre tramas rechazadas (se informan agregadas por motivo)
+QUARANTINE_REPORT_SECONDS = 10
+
+# Catálogo de rutas descargado por utils/web_scraping.py (ver route_catalog.py). idRuta es el mismo
+# identificador de las tramas, así que los nombres se resuelven con un join sobre la clave primaria
+rutas_headers = [
+    ("idRuta", "TEXT PRIMARY KEY"),         # idRuta de la página de la ruta
+    ("codigoRuta", "TEXT"),                 # Código público (ej. '18-3')
+    ("nombreRuta", "TEXT"),                 # Nombre de la ruta
+    ("fecha_actualizacion", "TEXT")         # Fecha y hora de la última descarga
+]
+
+# Paradas de cada ruta en el orden del recorrido
+paradas_headers = [
+    ("idRuta", "TEXT"),
+    ("orden", "INTEGER"),                   # Posición de la parada en el recorrido (desde 1)
+    ("nombreParada", "TEXT"),
+    ("direccionParada", "TEXT"),
+    ("PRIMARY KEY", "(idRuta, orden)")
+]
+
 foreign_keys = [
     ("FOREIGN KEY(idVehiculo)", "REFERENCES Vehiculos(idVehiculo)"),
     ("FOREIGN KEY(idConductor)", "REFERENCES Conductores(idConductor)"),
@@ -0,0 +1,114 @@
+# coverage.py
+
+import pandas as pd
+
+from config import cobertura_headers
+from row_builders import trama_columns
+
+COVERAGE_TABLE = "CoberturaDiaria"
+
+# Tabla de tramas que cuenta como cobertura 'LOG' (la misma que usaba el informe semanal)
+COVERAGE_TRAMA = "P60"
+
+_UPSERT_SQL = (
+    f"INSERT INTO {COVERAGE_TABLE} (bus, fecha, fuente, desde, hasta, registros, pendiente) "
+    f"VALUES (?, ?, ?, ?, ?, ?, 1) "
+    f"ON CONFLICT (bus, fecha, fuente) DO UPDATE SET desde = min(desde, excluded.desde), "
+    f"hasta = max(hasta, excluded.hasta), registros = registros + excluded.registros, pendiente = 1"
+)
+
+
+def create_coverage_table(conn):
+    """Crea la tabla de cobertura diaria si no existe."""
+    columns = ', '.join(f"{header} {dtype}" for header, dtype in cobertura_headers)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} ({columns})")
+
+
+def update_coverage(conn, buses, tiempos, fuente):
+    """
+    Suma a la cobertura diaria los registros dados por dos series alineadas: bus y fecha/hora
+    (datetime). La agregación por bus y día es vectorizada; los días que ya existen se combinan
+    con UPSERT y quedan marcados como pendientes para el informe. No confirma la transacción.
+    """
+    datos = pd.DataFrame({"bus": buses.astype(str).str[-4:].to_numpy(), "time": tiempos.to_numpy()}).dropna()
+    if datos.empty:
+        return
+    datos["fecha"] = datos["time"].dt.strftime('%Y-%m-%d')
+    agregados = datos.groupby(["bus", "fecha"], sort=False)["time"].agg(["min", "max", "size"]).reset_index()
+    create_coverage_table(conn)
+    conn.executemany(_UPSERT_SQL, zip(
+        agregados["bus"], agregados["fecha"], [fuente] * len(agregados),
+        agregados["min"].dt.strftime('%Y-%m-%d %H:%M:%S'), agregados["max"].dt.strftime('%Y-%m-%d %H:%M:%S'),
+        agregados["size"].astype(int).tolist(),
+    ))
+
+
+def update_sensor_coverage(conn, df):
+    """Cobertura 'TXT' de un DataFrame de `sensor_data_processor`."""
+    if df is not None and not df.empty:
+        update_coverage(conn, df["bus"], df["time"], "TXT")
+
+
+def update_trama_coverage(conn, lotes):
+    """Cobertura 'LOG' de las tramas P60 de un lote de `file_processor.prepare_batches`."""
+    filas = lotes["tramas"].get(COVERAGE_TRAMA)
+    if not filas:
+        return
+    columnas = trama_columns(COVERAGE_TRAMA)
+    i_bus, i_fecha = columnas.index("idVehiculo"), columnas.index("fechaHoraLecturaDato")
+    buses = pd.Series([fila[i_bus] for fila in filas])
+    fechas = pd.Series([fila[i_fecha] for fila in filas])
+    if pd.api.types.is_numeric_dtype(fechas):
+        # TIMESTAMP_MODE = "epoch_ms"
+        tiempos = pd.to_datetime(fechas, unit='ms', errors='coerce')
+    else:
+        tiempos = pd.to_datetime(fechas, format='ISO8601', errors='coerce')
+    update_coverage(conn, buses[tiempos.notna()], tiempos.dropna(), "LOG")
+
+
+def rebuild_coverage(conn, grupos=None):
+    """
+    Recalcula toda la cobertura diaria con un GROUP BY en SQLite sobre 'sensores' y P60, para bases
+    cargadas antes de que existiera la tabla (ver schema.ensure_schema) o con --reconstruir_cobertura.
+    Acepta las fechas de P60 en cualquiera de sus formatos, también las anteriores a --migrar_fechas.
+    `grupos` son listas de esquemas adjuntos a `conn` donde también buscar esas tablas
+    (shards.ShardReader.groups, para las particiones mensuales); por defecto solo la base principal.
+    No confirma la transacción. Devuelve el número de días (bus, fecha, fuente).
+    """
+    create_coverage_table(conn)
+    conn.execute(f"DELETE FROM {COVERAGE_TABLE}")
+    # Un mismo día puede estar en la base principal y en una partición: se combina como en _UPSERT_SQL
+    combinar = ("ON CONFLICT (bus, fecha, fuente) DO UPDATE SET desde = min(desde, excluded.desde), "
+                "hasta = max(hasta, excluded.hasta), registros = registros + excluded.registros")
+    for esquemas in grupos or [["main"]]:
+        for esquema in esquemas:
+            tablas = {row[0] for row in conn.execute(f"SELECT name FROM {esquema}.sqlite_master "
+                                                     f"WHERE type IN ('table', 'view')")}
+            if "sensores" in tablas:
+                conn.execute(f"""
+                    INSERT INTO {COVERAGE_TABLE} (bus, fecha, fuente, desde, hasta, registros, pendiente)
+                    SELECT substr(bus, -4, 4), substr(time, 1, 10), 'TXT', substr(min(time), 1, 19),
+                           substr(max(time), 1, 19), count(*), 1
+                    FROM {esquema}.sensores WHERE time IS NOT NULL
+                    GROUP BY substr(bus, -4, 4), substr(time, 1, 10)
+                    {combinar}
+                """)
+            if COVERAGE_TRAMA in tablas:
+                # Las fechas pueden estar guardadas como texto ISO, como milisegundos (TIMESTAMP_MODE) o, en
+                # bases a las que no se les aplicó database.migrate_timestamps, como 'dd/mm/YYYY HH:MM:SS.fff'
+                fecha = ("CASE WHEN typeof(fechaHoraLecturaDato) = 'integer' "
+                         "THEN datetime(fechaHoraLecturaDato / 1000, 'unixepoch') "
+                         "WHEN fechaHoraLecturaDato LIKE '__/__/____ __:__:__%' "
+                         "THEN substr(fechaHoraLecturaDato, 7, 4) || '-' || substr(fechaHoraLecturaDato, 4, 2) || '-' "
+                         "|| substr(fechaHoraLecturaDato, 1, 2) || substr(fechaHoraLecturaDato, 11, 9) "
+                         "ELSE substr(fechaHoraLecturaDato, 1, 19) END")
+                conn.execute(f"""
+                    INSERT INTO {COVERAGE_TABLE} (bus, fecha, fuente, desde, hasta, registros, pendiente)
+                    SELECT bus, substr(t, 1, 10), 'LOG', min(t), max(t), count(*), 1
+                    FROM (SELECT substr(idVehiculo, -4, 4) AS bus, {fecha} AS t FROM {esquema}.{COVERAGE_TRAMA}
+                          WHERE fechaHoraLecturaDato LIKE '____-__-__%' OR fechaHoraLecturaDato LIKE '__/__/____ %'
+                             OR typeof(fechaHoraLecturaDato) = 'integer')
+                    WHERE true GROUP BY bus, substr(t, 1, 10)
+                    {combinar}
+                """)
+    return conn.execute(f"SELECT count(*) FROM {COVERAGE_TABLE}").fetchone()[0]
@@ -1,7 +1,24 @@
-﻿import json
+import codecs
+import functools
+import json
+import time
 from datetime import datetime
 
-from config import LOG_PATTERN
+import instrumentation
+
+from config import LOG_PATTERN, LOG_CHUNK_SIZE, JSON_DECODER, TIMESTAMP_MODE
+from quarantine import note_reject, MOTIVO_JSON
+
+# Decodificadores JSON disponibles: función texto -> objeto que lanza ValueError si el texto no es válido
+JSON_DECODERS = {"json": json.loads}
+try:
+    import orjson
+    JSON_DECODERS["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+# Longitud de la marca "[YYYY/MM/DD HH:MM:SS]" menos uno: lo que puede quedar cortado al final de un bloque
+_HEADER_TAIL = 20
 
 
 def extract_json_objects(logs):
@@ -13,47 +30,280 @@ def extract_json_objects(logs):
     start_positions.append(len(logs))
 
     for i in range(len(start_positions) - 1):
-        json_str = logs[start_positions[i]:start_positions[i + 1]]
-        start_json = json_str.find('{')
-        if start_json != -1:
-            try:
-                json_obj = json.loads(json_str[start_json:-2])
-                json_objects.append(json_obj)
-            except json.JSONDecodeError:
-                json_str_fixed = json_str[start_json:] + '"}'
-                try:
-                    json_obj = json.loads(json_str_fixed)
-                    json_objects.append(json_obj)
-                except:
-                    print(f"Error al decodificar JSON: - Fragmento: {json_str_fixed}")
-                    pass
+        frame = logs[start_positions[i]:start_positions[i + 1]]
+        json_obj = decode_frame(frame)
+        if json_obj is not None:
+            json_objects.append(json_obj)
 
     return json_objects
 
 
-def format_date(date_str):
-    """
-    Formatea la fecha desde el formato original a uno estándar.
-    """
-    if date_str:
-        date_obj = datetime.strptime(date_str, '%d/%m/%Y %H:%M:%S.%f')
-        return date_obj.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    return ''
-
-
-def extract_values(json_obj, headers):
-    localizacion = json_obj.get('localizacionVehiculo', {})
-    values = []
-    for header in headers:
-        if header in ['fechaHoraLecturaDato', 'fechaHoraEnvioDato']:
-            values.append(format_date(json_obj.get(header, "")))
-        elif header in ['latitud', 'longitud']:
-            values.append(localizacion.get(header, ''))
-        else:
-            value = json_obj.get(header, None)
-            if value is None and header in ['consumoCombustible', 'nivelTanqueCombustible', 'temperaturaMotor',
-                                            'presionAceiteMotor', 'revolucionesMotor', 'estadoDesgasteFrenos',
-                                            'kilometrosOdometro']:
-                value = -1  # O reemplazar con algún valor predeterminado que tenga sentido para tu análisis
-            values.append(value if value is not None else '')  # Convertir None a string vacío
-    return values
+def get_json_decoder(name=None):
+    """
+    Devuelve la función de decodificación JSON `name` de JSON_DECODERS. Sin nombre usa JSON_DECODER
+    de config o, si no está definido, el decodificador más rápido instalado (orjson si existe).
+    """
+    name = name or JSON_DECODER or ("orjson" if "orjson" in JSON_DECODERS else "json")
+    try:
+        return JSON_DECODERS[name]
+    except KeyError:
+        raise ValueError(f"Decodificador JSON no disponible: {name}. Opciones: {', '.join(JSON_DECODERS)}")
+
+
+def set_json_decoder(name):
+    """Cambia el decodificador usado por decode_frame."""
+    global _decode
+    _decode = get_json_decoder(name)
+
+
+_decode = get_json_decoder()
+
+
+def frame_json_span(frame):
+    """
+    Ubica el JSON de una trama en una sola pasada, sin intentar decodificarlo.
+
+    Devuelve (texto_json, truncada): si después de la última '}' solo hay espacios o saltos de línea,
+    el JSON va de la primera '{' a esa llave; si no, la trama quedó cortada (por ejemplo, la última
+    de un archivo que se dejó de escribir) y se cierra la cadena y el objeto con '"}'.
+    Devuelve (None, False) si la trama no contiene JSON.
+    """
+    start = frame.find('{')
+    if start == -1:
+        return None, False
+    end = frame.rfind('}')
+    if end > start and (end == len(frame) - 1 or frame[end + 1:].isspace()):
+        return frame[start:end + 1], False
+    return frame[start:].rstrip() + '"}', True
+
+
+def decode_frame(json_str):
+    """
+    Decodifica el objeto JSON de una trama (texto desde su marca de fecha hasta la siguiente).
+    Devuelve None si la trama no tiene JSON o no se puede decodificar.
+    """
+    if instrumentation.enabled:
+        return _decode_frame_measured(json_str)
+    text, _ = frame_json_span(json_str)
+    if text is None:
+        return None
+    try:
+        return _decode(text)
+    except ValueError:
+        # Se informa agregado y con límite de frecuencia (ver quarantine.ReporteRechazos)
+        note_reject(MOTIVO_JSON)
+        return None
+
+
+def _decode_frame_measured(json_str):
+    """decode_frame con --profile: tiempo de json y conteo de tramas truncadas, sin JSON o inválidas."""
+    inicio = time.perf_counter()
+    text, truncada = frame_json_span(json_str)
+    obj = None
+    if text is None:
+        instrumentation.count("tramas_sin_json")
+    else:
+        if truncada:
+            instrumentation.count("tramas_truncadas")
+        try:
+            obj = _decode(text)
+        except ValueError:
+            instrumentation.count("tramas_invalidas")
+            note_reject(MOTIVO_JSON)
+    instrumentation.add_time("json", time.perf_counter() - inicio)
+    return obj
+
+
+def detect_utf16_encoding(head):
+    """
+    Devuelve el códec sin BOM y el tamaño del BOM según los primeros bytes del archivo.
+    Sin BOM se asume little-endian, igual que el códec 'utf-16' de Python.
+    """
+    if head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16-be', 2
+    if head.startswith(codecs.BOM_UTF16_LE):
+        return 'utf-16-le', 2
+    return 'utf-16-le', 0
+
+
+def _utf16_length(text):
+    """Número de bytes que ocupa `text` en UTF-16 (2 por carácter salvo los pares sustitutos)."""
+    if text.isascii():
+        return 2 * len(text)
+    return len(text.encode('utf-16-le'))
+
+
+def iter_log_frames(file_path, start_offset=0, chunk_size=LOG_CHUNK_SIZE, final=True):
+    """
+    Lee un .log UTF-16 por bloques y genera sus tramas como tuplas (inicio, fin, texto),
+    donde inicio y fin son posiciones en bytes dentro del archivo.
+
+    Las tramas se separan con LOG_PATTERN aunque la marca de fecha quede partida entre dos bloques,
+    y solo se mantiene en memoria la trama en curso. Con final=False la última trama del archivo
+    no se genera, porque puede estar todavía incompleta; el llamador puede retomar desde su inicio.
+    """
+    with open(file_path, 'rb') as file:
+        encoding, bom = detect_utf16_encoding(file.read(2))
+        offset = max(start_offset, bom)
+        file.seek(offset)
+        decoder = codecs.getincrementaldecoder(encoding)()
+
+        buffer = ''
+        has_header = False
+        scan_pos = 0
+        medir = instrumentation.enabled
+        while True:
+            chunk = file.read(chunk_size)
+            if medir:
+                t0 = time.perf_counter()
+            buffer += decoder.decode(chunk, final=not chunk)
+            if medir:
+                t1 = time.perf_counter()
+                instrumentation.add_time("utf16", t1 - t0)
+
+            starts = [match.start() for match in LOG_PATTERN.finditer(buffer, scan_pos)]
+            if medir:
+                instrumentation.add_time("log_pattern", time.perf_counter() - t1)
+            if not has_header:
+                if not starts:
+                    # Descartar el texto previo a la primera marca, salvo una posible marca cortada
+                    junk = buffer[:-_HEADER_TAIL]
+                    offset += _utf16_length(junk)
+                    buffer = buffer[len(junk):]
+                    if not chunk:
+                        return
+                    continue
+                offset += _utf16_length(buffer[:starts[0]])
+                buffer = buffer[starts[0]:]
+                starts = [start - starts[0] for start in starts[1:]]
+                has_header = True
+
+            # Emitir las tramas completas: las que van de una marca a la siguiente
+            previous = 0
+            for start in starts:
+                frame = buffer[previous:start]
+                size = _utf16_length(frame)
+                yield offset, offset + size, frame
+                offset += size
+                previous = start
+            buffer = buffer[previous:]
+            scan_pos = max(len(buffer) - _HEADER_TAIL, 1)
+
+            if not chunk:
+                if final and buffer:
+                    yield offset, offset + _utf16_length(buffer), buffer
+                return
+
+
+def iter_json_objects(file_path, start_offset=0, chunk_size=LOG_CHUNK_SIZE):
+    """
+    Genera uno a uno los objetos JSON de un .log UTF-16 sin cargar el archivo completo en memoria.
+    Las tramas que no se pueden decodificar se omiten (ver iter_log_frames para conocer sus offsets).
+    """
+    for _, _, frame in iter_log_frames(file_path, start_offset, chunk_size):
+        json_obj = decode_frame(frame)
+        if json_obj is not None:
+            yield json_obj
+
+
+def _is_fixed_width_timestamp(value):
+    """Indica si `value` tiene la forma 'dd/mm/YYYY HH:MM:SS.fff' de las tramas."""
+    return (len(value) == 23 and value[2] == '/' and value[5] == '/' and value[10] == ' '
+            and value[13] == ':' and value[16] == ':' and value[19] == '.')
+
+
+def _parse_timestamp_slow(value):
+    """Fechas que no tienen el ancho fijo (sin milisegundos, con otra precisión): datetime o None."""
+    for fmt in ('%d/%m/%Y %H:%M:%S.%f', '%d/%m/%Y %H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _epoch_days(date_str):
+    """Días desde 1970-01-01 de una fecha 'dd/mm/YYYY', sin pasar por datetime."""
+    day, month, year = int(date_str[0:2]), int(date_str[3:5]), int(date_str[6:10])
+    # Algoritmo days_from_civil (calendario gregoriano proléptico)
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_timestamp_iso(value):
+    """
+    Convierte 'dd/mm/YYYY HH:MM:SS.fff' en 'YYYY-mm-dd HH:MM:SS.fff' reordenando posiciones fijas.
+    Otros formatos pasan por strptime; los valores que no son fechas se devuelven sin cambios.
+    """
+    if not isinstance(value, str):
+        return value
+    if _is_fixed_width_timestamp(value):
+        return f"{value[6:10]}-{value[3:5]}-{value[0:2]}{value[10:]}"
+    date_obj = _parse_timestamp_slow(value)
+    return date_obj.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if date_obj else value
+
+
+def parse_timestamp_epoch_ms(value):
+    """
+    Convierte 'dd/mm/YYYY HH:MM:SS.fff' en milisegundos desde 1970-01-01, tomando la hora como UTC.
+    Otros formatos pasan por strptime; los valores que no son fechas se devuelven sin cambios.
+    """
+    if not isinstance(value, str):
+        return value
+    if _is_fixed_width_timestamp(value):
+        seconds = int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+        return (_epoch_days(value[:10]) * 86400 + seconds) * 1000 + int(value[20:23])
+    date_obj = _parse_timestamp_slow(value)
+    if date_obj is None:
+        return value
+    return parse_timestamp_epoch_ms(date_obj.strftime('%d/%m/%Y %H:%M:%S.%f')[:-3])
+
+
+# Normalizadores de fecha por valor de TIMESTAMP_MODE
+TIMESTAMP_PARSERS = {
+    "iso": parse_timestamp_iso,
+    "epoch_ms": parse_timestamp_epoch_ms,
+}
+
+
+def get_timestamp_parser(mode=None):
+    """Devuelve el normalizador de fechas de TIMESTAMP_PARSERS para `mode` (por defecto TIMESTAMP_MODE)."""
+    mode = mode or TIMESTAMP_MODE
+    try:
+        return TIMESTAMP_PARSERS[mode]
+    except KeyError:
+        raise ValueError(f"Formato de fecha no disponible: {mode}. Opciones: {', '.join(TIMESTAMP_PARSERS)}")
+
+
+def transform_data(header, value):
+    """
+    Realiza transformaciones específicas en los datos según el encabezado.
+    """
+    if header == "idVehiculo" and isinstance(value, str):
+        # Extraer los últimos 4 caracteres numéricos del idVehiculo
+        numeric_part = ''.join(filter(str.isdigit, value[-4:]))  # Extrae solo los últimos 4 caracteres numéricos
+
+        # Convertir la parte numérica a un entero si es posible
+        if numeric_part:
+            try:
+                return int(numeric_part)
+            except ValueError:
+                return value  # Devuelve el valor original si no puede convertirse a int
+
+    elif header == "idConductor":
+        # Si el valor es 'No Disponible', establecer a 0
+        if value == "No Disponible":
+            return 0
+        # Si es otro valor, intenta convertirlo a entero
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            return value  # Devuelve el valor original si no puede convertirse a int
+
+    # Agregar más transformaciones si es necesario
+    return value  # Devuelve el valor sin cambios si no hay transformaciones definidas
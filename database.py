@@ -1,13 +1,15 @@
 import sqlite3
 
 from config import HEADERS_SPECIFIC, COMMON_HEADERS, vehiculos_headers, versiones_trama_headers, conductores_headers, \
-    foreign_keys
+    foreign_keys, SQLITE_PROFILES, TRAMA_INDEXES, TABLE_INDEXES, TIMESTAMP_MODE, TIMESTAMP_FIELDS
+from events import EVENT_TABLE
 
 
-def create_connection(db_path):
-    """Crea una conexión a la base de datos SQLite."""
+def create_connection(db_path, profile="normal"):
+    """Crea una conexión a la base de datos SQLite y le aplica el perfil de PRAGMAs indicado."""
     try:
         conn = sqlite3.connect(db_path)
+        apply_pragmas(conn, profile)
         print(f"Conexión a la base de datos en {db_path} exitosa.")
         return conn
     except sqlite3.Error as e:
@@ -15,20 +17,11 @@ def create_connection(db_path):
         return None
 
 
-def insert_data(conn, table_name, headers, data):
-    """Inserta datos en una tabla específica."""
-    placeholders = ', '.join('?' * len(headers))
-    columns = ', '.join(
-        [header.replace(' ', '_') for header in headers])  # Asegúrate de que los nombres de columnas sean válidos
-
-    sql = f"INSERT OR REPLACE INTO {table_name} ({columns}) VALUES ({placeholders})"
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(sql, data)
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error al insertar datos en la tabla {table_name}: {e} - SQL: {sql} - Datos: {data}")
+def apply_pragmas(conn, profile):
+    """Aplica los PRAGMAs de un perfil de SQLITE_PROFILES (o de un diccionario) a la conexión."""
+    pragmas = SQLITE_PROFILES[profile] if isinstance(profile, str) else profile
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
 
 
 def create_table(conn, table_name, headers):
@@ -102,3 +95,109 @@ def exclude_headers_and_add_foreign_keys(common_headers, foreign_keys, *tables_h
     filtered_headers_with_foreign_keys = filtered_headers + list(foreign_keys)
 
     return filtered_headers_with_foreign_keys
+
+
+def declared_indexes():
+    """Devuelve la lista (tabla, nombre_indice, columnas) de todos los índices declarados en config."""
+    indexes = []
+    for tipo in HEADERS_SPECIFIC:
+        for suffix, columns in TRAMA_INDEXES:
+            indexes.append((tipo, f"idx_{tipo}_{suffix}", columns))
+    for table_name, table_indexes in TABLE_INDEXES.items():
+        for suffix, columns in table_indexes:
+            indexes.append((table_name, f"idx_{table_name}_{suffix}", columns))
+    return indexes
+
+
+def create_indexes(conn):
+    """
+    Crea los índices declarados que falten. Todas las tablas, 'sensores' incluida, las crea
+    schema.ensure_schema; se omiten las declaradas que la base no tiene como tabla: Eventos en una base con
+    una tabla por tipo, y las de cada tipo de evento en una base consolidada, donde son vistas (ver events.py).
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    created = 0
+    for table_name, index_name, columns in declared_indexes():
+        if table_name not in existing_tables:
+            continue
+        try:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})")
+            created += 1
+        except sqlite3.Error as e:
+            print(f"Error al crear el índice {index_name}: {e}")
+    conn.commit()
+    return created
+
+
+def drop_indexes(conn):
+    """Elimina los índices declarados, para reconstruirlos con create_indexes después de una carga masiva."""
+    for _, index_name, _ in declared_indexes():
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.commit()
+
+
+def _timestamp_updates(column, mode):
+    """
+    Sentencias (SET, WHERE) que llevan `column` al formato `mode` desde cualquiera de los otros:
+    el original 'dd/mm/YYYY HH:MM:SS.fff', ISO o milisegundos enteros.
+    """
+    original = f"{column} LIKE '__/__/____ %'"
+    to_iso = f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2) || substr({column}, 11)"
+    if mode == "iso":
+        return [
+            (to_iso, original),
+            (f"strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch')", f"typeof({column}) = 'integer'"),
+        ]
+    if mode == "epoch_ms":
+        to_epoch = "CAST(round((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+        return [
+            (to_epoch.format(to_iso), original),
+            (to_epoch.format(column), f"typeof({column}) = 'text' AND {column} LIKE '____-__-__ %'"),
+        ]
+    raise ValueError(f"Formato de fecha no disponible: {mode}")
+
+
+def migrate_timestamps(conn, mode=TIMESTAMP_MODE):
+    """
+    Migración única de bases creadas antes de normalizar las fechas: convierte TIMESTAMP_FIELDS de
+    todas las tablas de tramas al formato `mode` con UPDATE en SQL. Las filas que ya están en ese
+    formato no se tocan, así que repetirla no tiene efecto. También recorre las particiones mensuales
+    de la base (ver shards.py), adjuntándolas de a una; las cerradas con seal_shards son de solo lectura
+    y se informan sin tocarlas. Devuelve el número de valores convertidos.
+    """
+    # shards importa este módulo
+    from shards import is_sealed, list_shards, schema_name
+
+    converted = _migrate_schema_timestamps(conn, "main", mode)
+    conn.commit()
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    migradas, cerradas = 0, []
+    for mes, ruta in (list_shards(db_path) if db_path else {}).items():
+        if is_sealed(ruta):
+            cerradas.append(mes)
+            continue
+        esquema = schema_name(mes)
+        conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+        converted += _migrate_schema_timestamps(conn, esquema, mode)
+        conn.commit()
+        conn.execute(f"DETACH DATABASE {esquema}")
+        migradas += 1
+    print(f"Fechas migradas al formato '{mode}': {converted} valores convertidos"
+          + (f" (base principal y {migradas} particiones)." if migradas else "."))
+    if cerradas:
+        print(f"Particiones cerradas que no se migraron (son de solo lectura): {', '.join(cerradas)}.")
+    return converted
+
+
+def _migrate_schema_timestamps(conn, esquema, mode):
+    """UPDATE de migrate_timestamps en las tablas de tramas de `esquema`, sin confirmar. Devuelve los convertidos."""
+    existing_tables = {row[0] for row in conn.execute(f"SELECT name FROM {esquema}.sqlite_master WHERE type = 'table'")}
+    converted = 0
+    for tipo in list(HEADERS_SPECIFIC) + [EVENT_TABLE]:
+        if tipo not in existing_tables:
+            continue
+        for column in TIMESTAMP_FIELDS:
+            for expression, condition in _timestamp_updates(column, mode):
+                cursor = conn.execute(f"UPDATE {esquema}.{tipo} SET {column} = {expression} WHERE {condition}")
+                converted += cursor.rowcount
+    return converted
@@ -0,0 +1,97 @@
+# dedup.py
+
+import operator
+import threading
+
+from config import TRAMA_DEDUP_KEY, DEDUP_MAX_KEYS, TRAMA_INSERT_CONFLICT
+from dimension_cache import database_key
+from row_builders import trama_columns
+
+# Filtros ya creados, uno por archivo de base de datos
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+class DuplicateFilter:
+    """
+    Claves (TRAMA_DEDUP_KEY, el idRegistro) de las tramas ya escritas en la ejecución, por tabla.
+
+    Las tramas retransmitidas o que vuelven a aparecer en logs solapados se descartan aquí, antes de
+    llegar a SQLite. La clave es la misma que hace cumplir SQLite (la clave primaria idRegistro, o
+    (codigo, idRegistro) en Eventos, con un filtro por tipo), así que el filtro solo evita el trabajo de
+    INSERT OR IGNORE y nunca descarta una fila que SQLite habría insertado; también descarta la trama de
+    otro vehículo que repite un idRegistro, como haría SQLite. Cuando una tabla llega a `max_claves` su
+    conjunto se vacía y SQLite sigue descartando las repetidas. El filtro solo se aplica con
+    TRAMA_INSERT_CONFLICT = "IGNORE", que conserva la primera versión de cada trama; con "REPLACE" se
+    escriben todas para que la última reemplace a las anteriores.
+    Cuenta las filas descartadas en memoria y las que ignoró SQLite.
+    """
+
+    def __init__(self, max_claves=DEDUP_MAX_KEYS, activo=TRAMA_INSERT_CONFLICT == "IGNORE"):
+        self.max_claves = max_claves
+        self.activo = activo
+        self.lock = threading.Lock()
+        self.claves = {}
+        self.extractores = {}
+        self.descartadas = {}
+        self.ignoradas = {}
+
+    def _extractor(self, tipo):
+        extractor = self.extractores.get(tipo)
+        if extractor is None:
+            columnas = trama_columns(tipo)
+            extractor = self.extractores[tipo] = operator.itemgetter(*(columnas.index(c) for c in TRAMA_DEDUP_KEY))
+        return extractor
+
+    def filter(self, tipo, filas):
+        """Devuelve las filas de `tipo` cuya clave no se ha visto (tampoco repetidas dentro del lote)."""
+        if not self.activo:
+            return filas
+        clave_de = self._extractor(tipo)
+        with self.lock:
+            vistas = self.claves.setdefault(tipo, set())
+            if len(vistas) >= self.max_claves:
+                vistas.clear()
+            nuevas = []
+            for fila in filas:
+                clave = clave_de(fila)
+                if clave not in vistas:
+                    vistas.add(clave)
+                    nuevas.append(fila)
+            self.descartadas[tipo] = self.descartadas.get(tipo, 0) + len(filas) - len(nuevas)
+        return nuevas
+
+    def forget(self):
+        """
+        Olvida las claves vistas, por ejemplo después de deshacer las filas de un archivo: las que sí
+        quedaron en la base las sigue descartando SQLite.
+        """
+        with self.lock:
+            self.claves.clear()
+
+    def record_ignored(self, tipo, filas):
+        """
+        Suma las filas que SQLite no insertó por INSERT OR IGNORE (duplicados de ejecuciones anteriores o
+        que el filtro ya olvidó), según las filas que cambió un executemany que terminó sin error.
+        """
+        if filas:
+            with self.lock:
+                self.ignoradas[tipo] = self.ignoradas.get(tipo, 0) + filas
+
+    def resumen(self):
+        descartadas = sum(self.descartadas.values())
+        ignoradas = sum(self.ignoradas.values())
+        por_tipo = sorted(((self.descartadas.get(t, 0) + self.ignoradas.get(t, 0), t)
+                           for t in set(self.descartadas) | set(self.ignoradas)), reverse=True)
+        detalle = ", ".join(f"{tipo} {n}" for n, tipo in por_tipo[:5] if n)
+        return (f"{descartadas} descartados en memoria, {ignoradas} ignorados por SQLite (idRegistro repetido)"
+                + (f" ({detalle})" if detalle else ""))
+
+
+def get_duplicate_filter(conn):
+    """Devuelve el filtro de duplicados de la base de datos de `conn`, creándolo la primera vez."""
+    key = database_key(conn)
+    with _filters_lock:
+        if key not in _filters:
+            _filters[key] = DuplicateFilter()
+        return _filters[key]
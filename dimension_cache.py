@@ -0,0 +1,97 @@
+# dimension_cache.py
+
+import sqlite3
+import threading
+
+from row_builders import compile_schema
+
+# Cachés ya cargadas, una por archivo de base de datos
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class DimensionCache:
+    """
+    Claves ya presentes en las tablas Vehiculos, Conductores y VersionesTrama de una base de datos.
+
+    Se carga una sola vez y se mantiene al día escribiendo a través de ella: las claves nuevas se
+    insertan con INSERT OR IGNORE y se agregan a la caché en la misma operación. Cuenta aciertos
+    (claves ya conocidas) y fallos (claves nuevas) por tabla, y un candado la hace segura para
+    compartirla entre hilos de un escritor.
+    """
+
+    # Tabla -> (columna clave usada en la caché, atributo de CompiledSchema)
+    TABLAS = {
+        "Vehiculos": ("idVehiculo", "vehiculos"),
+        "Conductores": ("idConductor", "conductores"),
+        "VersionesTrama": ("versionTrama", "versiones"),
+    }
+
+    def __init__(self, conn):
+        self.lock = threading.Lock()
+        self.claves = {}
+        self.aciertos = dict.fromkeys(self.TABLAS, 0)
+        self.fallos = dict.fromkeys(self.TABLAS, 0)
+        self.reload(conn)
+
+    def reload(self, conn):
+        """Vuelve a leer las claves de la base, por ejemplo después de deshacer las filas de un archivo."""
+        with self.lock:
+            for tabla, (columna, _) in self.TABLAS.items():
+                self.claves[tabla] = {row[0] for row in conn.execute(f"SELECT {columna} FROM {tabla}")}
+
+    def write_through(self, conn, lotes):
+        """
+        Inserta las filas de dimensiones de un lote de `prepare_batches` cuyas claves no estén en la caché.
+        Devuelve el número de filas nuevas.
+        """
+        esquema = compile_schema()
+        nuevas = 0
+        with self.lock:
+            for tabla, (_, atributo) in self.TABLAS.items():
+                filas_por_clave = lotes[tabla]
+                if not filas_por_clave:
+                    continue
+                conocidas = self.claves[tabla]
+                filas = [fila for clave, fila in filas_por_clave.items() if clave not in conocidas]
+                self.aciertos[tabla] += len(filas_por_clave) - len(filas)
+                self.fallos[tabla] += len(filas)
+                if filas:
+                    sql = getattr(esquema, atributo).insert_sql
+                    try:
+                        conn.executemany(sql, filas)
+                    except sqlite3.Error as e:
+                        print(f"Error al insertar datos en la tabla {tabla}: {e} - SQL: {sql}")
+                        continue
+                    conocidas.update(filas_por_clave)
+                    nuevas += len(filas)
+        return nuevas
+
+    def estadisticas(self):
+        """Devuelve {tabla: (claves, aciertos, fallos)}."""
+        return {tabla: (len(self.claves[tabla]), self.aciertos[tabla], self.fallos[tabla]) for tabla in self.TABLAS}
+
+    def resumen(self):
+        return ", ".join(f"{tabla} {claves} claves ({aciertos} aciertos / {fallos} fallos)"
+                         for tabla, (claves, aciertos, fallos) in self.estadisticas().items())
+
+
+def database_key(conn):
+    """Ruta del archivo principal de la conexión (o la propia conexión si es una base en memoria)."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return path or id(conn)
+
+
+def get_dimension_cache(conn):
+    """Devuelve la caché de dimensiones de la base de datos de `conn`, cargándola la primera vez."""
+    key = database_key(conn)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = DimensionCache(conn)
+        return _caches[key]
+
+
+def reset_dimension_caches():
+    """Olvida las cachés cargadas (por ejemplo, si se reemplazó el archivo de la base de datos)."""
+    with _caches_lock:
+        _caches.clear()
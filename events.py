@@ -0,0 +1,172 @@
+# events.py
+
+import functools
+import json
+import operator
+import threading
+
+from config import HEADERS_SPECIFIC, COMMON_HEADERS, TRAMA_INSERT_CONFLICT, EVENT_STORAGE, foreign_keys
+from dimension_cache import database_key
+from row_builders import trama_columns
+
+EVENT_TABLE = "Eventos"
+
+# Campo que identifica el tipo de un evento o una alarma (el mismo valor que el nombre de su tabla)
+_CODE_FIELDS = ("codigoEvento", "codigoAlarma")
+
+# Conversiones que reproducen en el JSON la afinidad de tipo que tenían las columnas de las tablas por tipo
+_AFFINITIES = {
+    "REAL": lambda valor: float(valor) if type(valor) is int else valor,
+    "TEXT": lambda valor: str(valor) if type(valor) in (int, float) else valor,
+}
+
+# Formato de las bases nuevas (ver set_event_storage) y formato ya detectado de cada base abierta
+_storage = EVENT_STORAGE
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def set_event_storage(formato):
+    """Define el formato de eventos de las bases nuevas: "tablas" o "consolidada" (por defecto EVENT_STORAGE)."""
+    global _storage
+    if formato not in ("tablas", "consolidada"):
+        raise ValueError(f"Formato de eventos no disponible: {formato}")
+    _storage = formato
+
+
+def default_event_storage():
+    return _storage
+
+
+@functools.lru_cache(maxsize=None)
+def event_types():
+    """Tipos de HEADERS_SPECIFIC que son eventos o alarmas, con el campo que guarda su código."""
+    tipos = {}
+    for tipo, headers in HEADERS_SPECIFIC.items():
+        codigo = next((header for header, _ in headers if header in _CODE_FIELDS), None)
+        if codigo is not None:
+            tipos[tipo] = codigo
+    return tipos
+
+
+@functools.lru_cache(maxsize=None)
+def common_columns():
+    """Columnas de las tablas de tramas que no dependen del tipo, en el orden de `trama_columns`."""
+    especificas = {header for headers in HEADERS_SPECIFIC.values() for header, _ in headers}
+    return [columna for columna in trama_columns(next(iter(HEADERS_SPECIFIC))) if columna not in especificas]
+
+
+def event_headers():
+    """
+    Encabezados de la tabla Eventos: las columnas comunes de las tramas, `codigo` (EV1, ALA3, ...) y `datos`,
+    un objeto JSON con los campos propios del tipo que no son nulos (NULL si no tiene ninguno). idRegistro
+    deja de ser la clave primaria porque solo es único dentro de cada tipo.
+    """
+    tipos = dict(COMMON_HEADERS)
+    headers = [(columna, "INTEGER" if columna == "idRegistro" else tipos.get(columna, "INTEGER"))
+               for columna in common_columns()]
+    headers += [("codigo", "TEXT"), ("datos", "TEXT"), ("UNIQUE", "(codigo, idRegistro)")]
+    return headers + list(foreign_keys)
+
+
+def event_columns():
+    return [header for header, _ in event_headers() if not header.startswith(("UNIQUE", "FOREIGN KEY"))]
+
+
+@functools.lru_cache(maxsize=None)
+def event_insert_sql():
+    columnas = event_columns()
+    return (f"INSERT OR {TRAMA_INSERT_CONFLICT} INTO {EVENT_TABLE} ({', '.join(columnas)}) "
+            f"VALUES ({', '.join('?' * len(columnas))})")
+
+
+@functools.lru_cache(maxsize=None)
+def event_row_converter(tipo):
+    """
+    Función que convierte una fila de la tabla de `tipo` (columnas de `trama_columns`) en una fila de
+    Eventos. Los campos propios se guardan con el tipo de su columna; los tipos que solo tienen el
+    código no generan JSON.
+    """
+    columnas = trama_columns(tipo)
+    comunes = operator.itemgetter(*(columnas.index(columna) for columna in common_columns()))
+    i_codigo = columnas.index(event_types()[tipo])
+    campos = [(columna, columnas.index(columna), _AFFINITIES.get(dtype.split()[0].upper()))
+              for columna, dtype in HEADERS_SPECIFIC[tipo] if columna != event_types()[tipo]]
+
+    if not campos:
+        def convertir(fila):
+            return comunes(fila) + (fila[i_codigo], None)
+        return convertir
+
+    def convertir(fila):
+        datos = {}
+        for columna, i, afinidad in campos:
+            valor = fila[i]
+            if valor is not None:
+                datos[columna] = afinidad(valor) if afinidad else valor
+        return comunes(fila) + (fila[i_codigo], json.dumps(datos, separators=(',', ':')) if datos else None)
+    return convertir
+
+
+def event_view_sql(tipo):
+    """
+    CREATE VIEW con el nombre y las columnas de la antigua tabla de `tipo`, sobre Eventos, en el mismo orden
+    que la tabla (primero los campos propios del tipo, como en schema.schema_catalog).
+    """
+    codigo = event_types()[tipo]
+    expresiones = []
+    for columna, _ in HEADERS_SPECIFIC[tipo]:
+        if columna == codigo:
+            expresiones.append(f"codigo AS {columna}")
+        else:
+            expresiones.append(f"json_extract(datos, '$.{columna}') AS {columna}")
+    expresiones += common_columns()
+    return f"CREATE VIEW {tipo} AS SELECT {', '.join(expresiones)} FROM {EVENT_TABLE} WHERE codigo = '{tipo}'"
+
+
+def create_event_views(conn):
+    """(Re)crea las vistas de compatibilidad de todos los tipos de eventos y alarmas."""
+    for tipo in event_types():
+        conn.execute(f"DROP VIEW IF EXISTS {tipo}")
+        conn.execute(event_view_sql(tipo))
+
+
+def uses_event_table(conn):
+    """Indica si la base de `conn` guarda los eventos en la tabla Eventos (se consulta una vez por base)."""
+    key = database_key(conn)
+    with _layouts_lock:
+        if key not in _layouts:
+            _layouts[key] = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                         (EVENT_TABLE,)).fetchone() is not None
+        return _layouts[key]
+
+
+def forget_event_layout(conn):
+    """Olvida el formato detectado de la base de `conn` (después de crear o consolidar sus tablas)."""
+    with _layouts_lock:
+        _layouts.pop(database_key(conn), None)
+
+
+def event_rows(tramas):
+    """Filas de Eventos de los lotes por tipo de `prepare_batches` (tipo -> filas); ignora los demás tipos."""
+    filas = []
+    for tipo, batch in tramas.items():
+        if batch and tipo in event_types():
+            filas.extend(map(event_row_converter(tipo), batch))
+    return filas
+
+
+def copy_event_table(conn, tipo, batch_rows=50000):
+    """
+    Copia a Eventos las filas de la tabla por tipo `tipo`, por bloques. No elimina la tabla ni confirma la
+    transacción (ver schema.consolidate_events). Devuelve el número de filas copiadas.
+    """
+    convertir = event_row_converter(tipo)
+    cursor = conn.execute(f"SELECT {', '.join(trama_columns(tipo))} FROM {tipo} ORDER BY rowid")
+    copiadas = 0
+    while True:
+        bloque = cursor.fetchmany(batch_rows)
+        if not bloque:
+            return copiadas
+        conn.executemany(event_insert_sql(), map(convertir, bloque))
+        copiadas += len(bloque)
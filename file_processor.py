@@ -1,241 +1,356 @@
 ﻿# file_processor.py
-import re
+import itertools
+import os
 import sqlite3
-
-from config import HEADERS_SPECIFIC, COMMON_HEADERS, versiones_trama_headers, conductores_headers, vehiculos_headers, \
-    inserted_vehiculos, inserted_versiones, inserted_conductores, foreign_keys
-from data_extractor import extract_json_objects, extract_values
-from database import create_connection, insert_data, create_tables
-
-
-def process_file(input_path, output_path, db_path):
+import time
+
+import instrumentation
+from config import BATCH_ROWS, PARTIAL_TAIL_SECONDS
+from coverage import update_trama_coverage
+from data_extractor import iter_log_frames, decode_frame, frame_json_span
+from database import create_connection
+from dedup import get_duplicate_filter
+from dimension_cache import get_dimension_cache
+from events import EVENT_TABLE, event_types, event_rows, event_insert_sql, event_columns, uses_event_table
+from manifest import plan_ingestion, record_ingestion
+from quarantine import note_reject, record_rejects, Rechazo, MOTIVO_JSON, MOTIVO_TIPO, \
+    QUARANTINE_TABLE
+from row_builders import compile_schema
+from schema import ensure_schema
+from shards import get_shard_router, release_shard_router
+
+
+def process_file(input_path, output_path, db_path, batch_rows=BATCH_ROWS, sesion=None):
     """
     Procesa un archivo de entrada y guarda los datos extraídos en una base de datos SQLite.
-    """
-    # Leer el archivo de entrada
-    with open(input_path, 'r', encoding='utf-16') as file:
-        content = file.read()
-
-    # Extraer objetos JSON del contenido del archivo
-    json_objects = extract_json_objects(content)
-    funciones_extraccion = {key: extract_values for key in HEADERS_SPECIFIC}
-
-    # Conectar a la base de datos
-    conn = create_connection(db_path)
-
-    # Crear tablas si no existen
-    create_tables(conn)
-
-    # Cargar datos existentes al inicio
-    load_existing_data(conn)
-
-    # Iniciar una transacción para inserciones por lotes
-    conn.execute('BEGIN')
-
-    # Contenedores para inserciones en lote
-    batch_vehiculos = []
-    batch_conductores = []
-    batch_versiones = []
-    batch_main = {tipo: [] for tipo in HEADERS_SPECIFIC.keys()}
-
-    # Procesar cada objeto JSON extraído
-    for obj in json_objects:
-        # Identificar el tipo del objeto JSON usando las claves disponibles
-        tipo = obj.get("codigoPeriodica") or obj.get("codigoEvento") or obj.get("codigoAlarma")
-
-        # Verificar si el tipo es válido y está en funciones_extraccion
-        if tipo in funciones_extraccion:
-            # Extraer solo los nombres de columnas para la inserción de datos
-            headers = [header for header, _ in COMMON_HEADERS] + [header for header, _ in HEADERS_SPECIFIC[tipo]]
-
-            # Obtener los datos organizados para la inserción
-            main_data, vehiculos_data, conductores_data, versiones_trama_data = prepare_data_for_insertion(
-                obj, headers, vehiculos_headers, conductores_headers, versiones_trama_headers
-            )
-
-            # Insertar datos en las tablas relacionadas antes de insertar en la tabla principal
-            if vehiculos_data['idVehiculo'] and vehiculos_data['idVehiculo'] not in inserted_vehiculos:
-                batch_vehiculos.append((list(vehiculos_data.values())))
-                inserted_vehiculos.add(vehiculos_data['idVehiculo'])  # Añadir a la lista de identificadores insertados
+    El archivo se lee por bloques y se escribe cada `batch_rows` registros, así que la memoria
+    usada no depende del tamaño del archivo.
 
-            if conductores_data['idConductor'] and conductores_data['idConductor'] not in inserted_conductores:
-                batch_conductores.append((list(conductores_data.values())))
-                inserted_conductores.add(conductores_data['idConductor'])
+    Los archivos que no cambiaron desde la última ingesta se omiten, y los que crecieron se leen
+    solo desde el último byte registrado en el manifiesto.
 
-            if versiones_trama_data['versionTrama'] and versiones_trama_data['versionTrama'] not in inserted_versiones:
-                batch_versiones.append((list(versiones_trama_data.values())))
-                inserted_versiones.add(versiones_trama_data['versionTrama'])
-
-            # Insertar los datos en la tabla principal correspondiente
-            batch_main[tipo].append(list(main_data.values()))
+    Con `sesion` (bulk_load.SesionCarga) se reutiliza la conexión y la transacción de la ejecución,
+    y la confirmación queda a cargo de sus checkpoints; las filas del archivo quedan dentro de un SAVEPOINT.
+    Si SQLite rechaza un lote se deshace todo el archivo (el SAVEPOINT o la transacción propia), se informa
+    el error y no se registra en el manifiesto, para que la próxima ingesta lo vuelva a leer completo.
+    """
+    start_offset, stat = plan_ingestion(db_path, input_path)
+    if start_offset is None:
+        print(f"Sin cambios desde la última ingesta: {input_path}")
+        return
+
+    if sesion is None:
+        # Conectar a la base de datos
+        conn = create_connection(db_path)
+
+        # Verificar la versión del esquema (crea las tablas solo en una base nueva)
+        ensure_schema(conn)
+
+        # Iniciar una transacción para inserciones por lotes
+        conn.execute('BEGIN')
+    else:
+        conn = sesion.conn
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        conn.execute('SAVEPOINT archivo_log')
+
+    offset = start_offset
+    registros = 0
+    dimensiones = get_dimension_cache(conn) if sesion is None else sesion.dimensiones
+    try:
+        for lotes in iter_log_batches(input_path, batch_rows, start_offset):
+            write_batches(conn, lotes, dimensiones)
+            offset = lotes["offset"]
+            registros += lotes["registros"]
+    except sqlite3.Error as e:
+        print(f"Error al procesar el archivo {input_path}; se descartan sus filas: {e}")
+        if sesion is None:
+            conn.rollback()
+            forget_written_keys(conn, dimensiones)
+            release_shard_router(conn)
+            conn.close()
         else:
-            # Proporciona un mensaje de depuración más detallado
-            print(f"Tipo desconocido: {tipo} - Objeto JSON: {obj}")
-
-    # Ejecutar inserciones por lotes
-    if batch_vehiculos:
-        insert_data_batch(conn, "Vehiculos", vehiculos_headers, batch_vehiculos)
-    if batch_conductores:
-        insert_data_batch(conn, "Conductores", conductores_headers, batch_conductores)
-    if batch_versiones:
-        insert_data_batch(conn, "VersionesTrama", versiones_trama_headers, batch_versiones)
-
-    for tipo, batch in batch_main.items():
-        if batch:
-            insert_data_batch(conn, tipo, get_headers_for_type_names(tipo, COMMON_HEADERS, HEADERS_SPECIFIC, foreign_keys,vehiculos_headers, conductores_headers, versiones_trama_headers), batch)
-
-    # Confirmar la transacción en lote
-    conn.commit()
-
-    # Cerrar la conexión a la base de datos
-    if conn:
-        conn.close()
+            conn.execute('ROLLBACK TO archivo_log')
+            conn.execute('RELEASE archivo_log')
+            forget_written_keys(conn, dimensiones)
+        return
 
+    if sesion is not None:
+        conn.execute('RELEASE archivo_log')
 
-def insert_data_batch(conn, table_name, headers, data_batch):
-    """Inserta datos en una tabla específica en lote."""
-    placeholders = ', '.join('?' * len(headers))
-    columns = ', '.join(
-        [header.replace(' ', '_') for header, _ in headers])  # Asegúrate de que los nombres de columnas sean válidos
+    # Registrar el avance en el manifiesto, en la misma transacción que los datos
+    record_ingestion(conn, db_path, input_path, stat, offset)
 
-    sql = f"INSERT OR REPLACE INTO {table_name} ({columns}) VALUES ({placeholders})"
-
-    try:
-        cursor = conn.cursor()
-        cursor.executemany(sql, data_batch)
+    if sesion is None:
+        # Confirmar la transacción en lote y cerrar la conexión a la base de datos
         conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error al insertar datos en la tabla {table_name}: {e} - SQL: {sql}")
+        release_shard_router(conn)
+        conn.close()
+    else:
+        sesion.registrar_filas(registros)
 
 
-def prepare_data_for_insertion(obj, headers, vehiculos_headers, conductores_headers, versiones_trama_headers):
+def forget_written_keys(conn, dimensiones):
     """
-    Prepara los datos para la inserción en la base de datos, separando los encabezados de las tablas relacionadas
-    y devolviendo diccionarios con los datos correspondientes.
+    Después de deshacer filas ya escritas, vuelve a cargar la caché de dimensiones y vacía el filtro de
+    duplicados, que las daban por presentes en la base.
     """
-    # Definir las columnas que deben excluirse de la inserción principal
-    exclude_headers = {header for header, _ in vehiculos_headers + conductores_headers + versiones_trama_headers}
-
-    # Inicializar diccionarios para almacenar datos organizados
-    main_data = {}
-    vehiculos_data = {}
-    conductores_data = {}
-    versiones_trama_data = {}
-
-    # Separar los datos para las tablas específicas
-    for header, dtype in vehiculos_headers:
-        if header in obj:
-            vehiculos_data[header] = transform_data(header, obj.get(header))
+    dimensiones.reload(conn)
+    get_duplicate_filter(conn).forget()
 
-    for header, dtype in conductores_headers:
-        if header in obj:
-            conductores_data[header] = transform_data(header, obj.get(header))
 
-    for header, dtype in versiones_trama_headers:
-        if header in obj:
-            versiones_trama_data[header] = transform_data(header, obj.get(header))
-
-    # Extraer los valores de datos para la tabla principal (COMMON_HEADERS + HEADERS_SPECIFIC)
-    for header in headers:
-        if header not in exclude_headers:
-            main_data[header] = transform_data(header, obj.get(header))
-
-    # Extraer los valores de datos para la tabla principal (COMMON_HEADERS + HEADERS_SPECIFIC)
-    for header in headers:
-        if header not in exclude_headers:
-            # Manejar la extracción de datos anidados para latitud y longitud
-            if header == "latitud":
-                # Verificar si 'localizacionVehiculo' está presente y contiene 'latitud'
-                main_data[header] = transform_data(header, obj.get('localizacionVehiculo', {}).get('latitud'))
-            elif header == "longitud":
-                # Verificar si 'localizacionVehiculo' está presente y contiene 'longitud'
-                main_data[header] = transform_data(header, obj.get('localizacionVehiculo', {}).get('longitud'))
-            else:
-                # Extraer los datos normalmente para otros campos
-                main_data[header] = transform_data(header, obj.get(header))
-
-    # Asignar los IDs a la tabla principal después de insertar en las tablas relacionadas
-    main_data['idVehiculo'] = vehiculos_data.get('idVehiculo', None)
-    main_data['idConductor'] = conductores_data.get('idConductor', None)
-    main_data['idVersionTrama'] = versiones_trama_data.get('idVersionTrama', None)
-
-    return main_data, vehiculos_data, conductores_data, versiones_trama_data
-
-
-def transform_data(header, value):
+def iter_log_batches(input_path, batch_rows=BATCH_ROWS, start_offset=0):
     """
-    Realiza transformaciones específicas en los datos según el encabezado.
+    Lee un archivo .log desde `start_offset` y genera lotes de como máximo `batch_rows` tramas
+    listos para insertar, sin tocar la base de datos. Es la parte de `process_file` que puede
+    ejecutarse en un proceso trabajador. Cada lote indica en "offset" el byte hasta el que se leyó.
+    Si el archivo se modificó hace menos de PARTIAL_TAIL_SECONDS segundos, una última trama cortada se deja
+    para la próxima ingesta (ver hold_back_partial_tail); si no, se repara como las demás.
     """
-    if header == "idVehiculo" and isinstance(value, str):
-        # Extraer los últimos 4 caracteres numéricos del idVehiculo
-        numeric_part = ''.join(filter(str.isdigit, value[-4:]))  # Extrae solo los últimos 4 caracteres numéricos
-
-        # Convertir la parte numérica a un entero si es posible
-        if numeric_part:
-            try:
-                return int(numeric_part)
-            except ValueError:
-                return value  # Devuelve el valor original si no puede convertirse a int
-
-    elif header == "idConductor":
-        # Si el valor es 'No Disponible', establecer a 0
-        if value == "No Disponible":
-            return 0
-        # Si es otro valor, intenta convertirlo a entero
-        try:
-            return int(value)
-        except (ValueError, TypeError):
-            return value  # Devuelve el valor original si no puede convertirse a int
-
-    # Agregar más transformaciones si es necesario
-    return value  # Devuelve el valor sin cambios si no hay transformaciones definidas
+    tramas = iter_log_frames(input_path, start_offset)
+    if time.time() - os.stat(input_path).st_mtime < PARTIAL_TAIL_SECONDS:
+        tramas = hold_back_partial_tail(tramas)
+    while True:
+        bloque = list(itertools.islice(tramas, batch_rows))
+        if not bloque:
+            return
+        yield prepare_frames(input_path, bloque)
 
 
-def check_exists(conn, table_name, column_name, value):
-    """Verifica si un valor ya existe en una columna de una tabla."""
-    sql = f"SELECT 1 FROM {table_name} WHERE {column_name} = ? LIMIT 1"
-    cursor = conn.cursor()
-    cursor.execute(sql, (value,))
-    return cursor.fetchone() is not None
-
-
-def load_existing_data(conn):
+def hold_back_partial_tail(tramas):
+    """
+    Genera las tramas (inicio, fin, texto) de `tramas` salvo la última si está cortada (frame_json_span):
+    un .log que se sigue escribiendo puede terminar a mitad de una trama, que en lugar de repararse o ir a
+    cuarentena se retoma completa en la próxima ingesta, porque el offset registrado queda en su inicio.
+    Solo se aplica a los archivos modificados recientemente (ver iter_log_batches); si el archivo deja de
+    crecer, la próxima ingesta posterior a PARTIAL_TAIL_SECONDS repara la trama cortada.
+    """
+    anterior = None
+    for trama in tramas:
+        if anterior is not None:
+            yield anterior
+        anterior = trama
+    if anterior is not None:
+        texto, truncada = frame_json_span(anterior[2])
+        if texto is not None and not truncada:
+            yield anterior
+
+
+def prepare_frames(input_path, tramas):
+    """
+    Decodifica una lista de tramas (inicio, fin, texto) de `iter_log_frames` y las agrupa con
+    `prepare_batches`. Las que no se pueden decodificar o son de un tipo desconocido quedan en
+    lotes["rechazos"] como quarantine.Rechazo, con su archivo y offset; "offset" es el fin de la última.
     """
-    Carga los datos existentes de las tablas Vehiculos, Conductores y VersionesTrama
-    para inicializar los conjuntos de identificadores ya insertados.
+    objetos, origenes, rechazos = [], [], []
+    for inicio, _, frame in tramas:
+        json_obj = decode_frame(frame)
+        if json_obj is not None:
+            objetos.append(json_obj)
+            origenes.append((inicio, frame))
+        elif '{' in frame:
+            rechazos.append(Rechazo(input_path, inicio, MOTIVO_JSON, None, frame))
+    lotes = prepare_batches(objetos)
+    for i, tipo in lotes["rechazados"]:
+        inicio, frame = origenes[i]
+        rechazos.append(Rechazo(input_path, inicio, MOTIVO_TIPO, None if tipo is None else str(tipo), frame))
+    lotes["rechazos"] = rechazos
+    lotes["offset"] = tramas[-1][1] if tramas else None
+    return lotes
+
+
+def prepare_batches(json_objects):
     """
-    global inserted_vehiculos, inserted_conductores, inserted_versiones
+    Agrupa los objetos JSON por tabla de destino usando los constructores de filas de `compile_schema`.
 
-    cursor = conn.cursor()
+    Las tablas de dimensiones se devuelven como diccionarios clave -> fila para que el escritor
+    pueda descartar las claves que ya existen en la base de datos. Los objetos de un tipo que no está
+    en HEADERS_SPECIFIC se cuentan (quarantine.note_reject) y se devuelven en "rechazados" como
+    (posición en json_objects, tipo).
+    """
+    inicio = time.perf_counter() if instrumentation.enabled else None
+    esquema = compile_schema()
+    constructores = esquema.tramas
+    build_vehiculo = esquema.vehiculos.build_row
+    build_conductor = esquema.conductores.build_row
+    build_version = esquema.versiones.build_row
 
-    # Cargar identificadores de Vehiculos existentes
-    cursor.execute("SELECT idVehiculo FROM Vehiculos")
-    inserted_vehiculos = {row[0] for row in cursor.fetchall()}
+    # Contenedores para inserciones en lote
+    vehiculos, conductores, versiones = {}, {}, {}
+    vistos_vehiculos, vistos_conductores, vistos_versiones = set(), set(), set()
+    tramas = {tipo: [] for tipo in constructores}
+    rechazados = []
+    registros = 0
 
-    # Cargar identificadores de Conductores existentes
-    cursor.execute("SELECT idConductor FROM Conductores")
-    inserted_conductores = {row[0] for row in cursor.fetchall()}
+    # Procesar cada objeto JSON extraído
+    for i, obj in enumerate(json_objects):
+        # Identificar el tipo del objeto JSON usando las claves disponibles
+        get = obj.get
+        tipo = get("codigoPeriodica") or get("codigoEvento") or get("codigoAlarma")
+        constructor = constructores.get(tipo)
+
+        if constructor is None:
+            # Se informa agregado por tipo y la trama va a la cuarentena (ver prepare_frames)
+            note_reject(MOTIVO_TIPO, tipo)
+            rechazados.append((i, tipo))
+            continue
+
+        # Registrar las filas de las tablas relacionadas (una por clave); solo se construyen
+        # la primera vez que aparece cada identificador en el lote
+        clave = get("idVehiculo")
+        if clave not in vistos_vehiculos:
+            vistos_vehiculos.add(clave)
+            fila = build_vehiculo(obj)
+            if fila[0]:
+                vehiculos.setdefault(fila[0], fila)
+        clave = get("idConductor")
+        if clave not in vistos_conductores:
+            vistos_conductores.add(clave)
+            fila = build_conductor(obj)
+            if fila[0]:
+                conductores.setdefault(fila[0], fila)
+        clave = get("versionTrama")
+        if clave not in vistos_versiones:
+            vistos_versiones.add(clave)
+            fila = build_version(obj)
+            if fila[1]:
+                versiones.setdefault(fila[1], fila)
+
+        # Fila de la tabla principal correspondiente
+        tramas[tipo].append(constructor.build_row(obj))
+        registros += 1
+
+    if inicio is not None:
+        # Construcción de filas y filas por tipo
+        instrumentation.add_time("filas", time.perf_counter() - inicio)
+        for tipo, filas in tramas.items():
+            if filas:
+                instrumentation.count(f"filas.{tipo}", len(filas))
+        instrumentation.count("tipos_desconocidos", len(rechazados))
+
+    return {
+        "Vehiculos": vehiculos,
+        "Conductores": conductores,
+        "VersionesTrama": versiones,
+        "tramas": tramas,
+        "registros": registros,
+        "desconocidos": len(rechazados),
+        "rechazados": rechazados,
+    }
+
+
+def write_batches(conn, lotes, dimensiones=None):
+    """
+    Inserta en la base de datos los lotes producidos por `prepare_batches`.
+    Las tablas relacionadas se insertan antes que las tablas principales, a través de la caché
+    de dimensiones de la base (`dimension_cache.DimensionCache`); las tramas cuyo idRegistro ya se
+    escribió en la ejecución se descartan con `dedup.DuplicateFilter`. En una base con eventos consolidados
+    (ver events.py) los eventos y alarmas de todos los tipos se insertan en Eventos con un solo executemany.
+    Las filas que ignoró SQLite se cuentan con las que cambió cada executemany terminado sin error; un error
+    de SQLite se propaga sin contarse (ver execute_batch). Al final se actualiza la cobertura diaria
+    (`coverage.update_trama_coverage`) y se guardan en la cuarentena las tramas de lotes["rechazos"] (ver
+    `prepare_frames`).
+    """
+    esquema = compile_schema()
+
+    if dimensiones is None:
+        dimensiones = get_dimension_cache(conn)
+    with instrumentation.stage("dimensiones"):
+        dimensiones.write_through(conn, lotes)
+
+    duplicados = get_duplicate_filter(conn)
+    particiones = get_shard_router(conn)
+    consolidada = uses_event_table(conn)
+    escritas = {}
+    for tipo, batch in lotes["tramas"].items():
+        if batch:
+            nuevas = escritas[tipo] = duplicados.filter(tipo, batch)
+            instrumentation.count("duplicados_memoria", len(batch) - len(nuevas))
+            if nuevas and not (consolidada and tipo in event_types()):
+                insertadas = _insert_rows(conn, particiones, tipo, esquema.tramas[tipo].insert_sql, nuevas,
+                                          esquema.tramas[tipo].columns)
+                duplicados.record_ignored(tipo, len(nuevas) - insertadas)
+                instrumentation.count("duplicados_sqlite", len(nuevas) - insertadas)
+    if consolidada:
+        eventos = event_rows(escritas)
+        if eventos:
+            insertadas = _insert_rows(conn, particiones, EVENT_TABLE, event_insert_sql(), eventos, event_columns())
+            duplicados.record_ignored(EVENT_TABLE, len(eventos) - insertadas)
+            instrumentation.count("duplicados_sqlite", len(eventos) - insertadas)
 
-    # Cargar versiones de trama existentes
-    cursor.execute("SELECT versionTrama FROM VersionesTrama")
-    inserted_versiones = {row[0] for row in cursor.fetchall()}
+    try:
+        with instrumentation.stage("cobertura"):
+            # La cobertura cuenta solo las tramas que no se descartaron como duplicadas
+            update_trama_coverage(conn, dict(lotes, tramas=escritas))
+    except sqlite3.Error as e:
+        print(f"Error al actualizar la cobertura diaria: {e}")
 
+    if lotes.get("rechazos"):
+        with instrumentation.stage("cuarentena"):
+            record_rejects(conn, lotes["rechazos"])
 
-def get_headers_for_type_names(tipo, common_headers, specific_headers, foreign_keys, vehiculos_headers, conductores_headers, versiones_trama_headers):
 
-    # Excluir encabezados que pertenecen a otras tablas (Vehiculos, Conductores, VersionesTrama)
-    exclude_headers = {header for header, _ in vehiculos_headers + conductores_headers + versiones_trama_headers}
+def _insert_rows(conn, particiones, tabla, sql, filas, columnas):
+    """
+    execute_batch de `filas` en `tabla`; con particiones mensuales (shards.ShardRouter) se reparten por
+    el mes de fechaHoraLecturaDato. Devuelve las filas insertadas; las de meses cerrados, que el enrutador
+    descarta y cuenta aparte, se suman como si se hubieran insertado para no informarlas como duplicadas.
+    """
+    if particiones is None:
+        return execute_batch(conn, tabla, sql, filas)
+    i_fecha = columnas.index("fechaHoraLecturaDato")
+    insertadas, enrutadas = 0, 0
+    for esquema, grupo in particiones.route(filas, i_fecha):
+        insertadas += execute_batch(conn, tabla, particiones.qualify(sql, tabla, esquema), grupo)
+        enrutadas += len(grupo)
+    return insertadas + len(filas) - enrutadas
 
-    # Filtrar los nombres de los encabezados comunes excluyendo aquellos que están en el conjunto exclude_headers
-    filtered_common_headers = [(header, dtype) for header, dtype in common_headers if header not in exclude_headers]
 
-    # Añadir los encabezados específicos del tipo de trama
-    headers_for_type = filtered_common_headers + [(header, dtype) for header, dtype in specific_headers.get(tipo, [])]
+def replay_quarantine(db_path, batch_rows=BATCH_ROWS):
+    """
+    Reingresa las tramas en cuarentena, por ejemplo después de agregar un tipo a HEADERS_SPECIFIC o de
+    cambiar el decodificador. Las que ahora se decodifican y tienen un tipo conocido se insertan y se
+    eliminan de la cuarentena, en la misma transacción; las demás se conservan. Devuelve
+    (reingresadas, restantes).
+    """
+    conn = create_connection(db_path)
+    ensure_schema(conn)
+    dimensiones = get_dimension_cache(conn)
+    filas = conn.execute(f"SELECT archivo, offset, texto FROM {QUARANTINE_TABLE} ORDER BY archivo, offset").fetchall()
+    reingresadas = 0
+    for i in range(0, len(filas), batch_rows):
+        bloque = filas[i:i + batch_rows]
+        objetos, claves = [], []
+        for archivo, offset, texto in bloque:
+            json_obj = decode_frame(texto)
+            if json_obj is not None:
+                objetos.append(json_obj)
+                claves.append((archivo, offset))
+        lotes = prepare_batches(objetos)
+        pendientes = {claves[j] for j, _ in lotes["rechazados"]}
+        write_batches(conn, lotes, dimensiones)
+        listas = [clave for clave in claves if clave not in pendientes]
+        conn.executemany(f"DELETE FROM {QUARANTINE_TABLE} WHERE archivo IS ? AND offset = ?", listas)
+        reingresadas += len(listas)
+    conn.commit()
+    restantes = conn.execute(f"SELECT count(*) FROM {QUARANTINE_TABLE}").fetchone()[0]
+    release_shard_router(conn)
+    conn.close()
+    print(f"Cuarentena: {reingresadas} tramas reingresadas, {restantes} siguen en cuarentena.")
+    return reingresadas, restantes
 
-    # Añadir los nombres de columnas referenciadas en claves foráneas si no están ya presentes
-    for fk_column, _ in foreign_keys:
-        column_name = fk_column.split('(')[1].split(')')[0]  # Extraer el nombre de la columna
-        if column_name not in [header for header, _ in headers_for_type]:
-            headers_for_type.append((column_name, "INTEGER"))  # Añadir con un tipo por defecto (p.ej. INTEGER)
 
-    return headers_for_type  # Devolver la lista de tuplas (nombre, tipo)
+def execute_batch(conn, table_name, sql, data_batch):
+    """
+    Ejecuta una sentencia de inserción ya construida sobre un lote de filas. Devuelve las filas
+    insertadas (menos que el lote si la sentencia ignora conflictos). Un error se informa y se propaga:
+    executemany pudo insertar parte del lote, y quien lo llama debe deshacer el archivo completo.
+    """
+    try:
+        cursor = conn.cursor()
+        with instrumentation.stage("executemany"):
+            cursor.executemany(sql, data_batch)
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Error al insertar datos en la tabla {table_name}: {e} - SQL: {sql}")
+        raise
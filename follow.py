@@ -0,0 +1,196 @@
+# follow.py
+
+import os
+import time
+
+from config import BATCH_ROWS
+from data_extractor import iter_log_frames
+from database import create_connection, create_indexes
+from dedup import get_duplicate_filter
+from dimension_cache import get_dimension_cache
+from file_processor import prepare_frames, write_batches
+from manifest import plan_ingestion, record_ingestion, last_line_end
+from parallel_ingest import construir_plan_trabajo
+from save_to_database import guardar_sensores_por_bloques
+from schema import ensure_schema
+from shards import get_shard_router, release_shard_router
+from sensor_data_processor import sensor_por_bloques
+from sensor_store import commit_sensor_store, rollback_sensor_store
+
+
+class SeguidorArchivos:
+    """
+    Sigue los .log y .txt de una ruta e ingiere solo los bytes que se van agregando.
+
+    Cada archivo conserva en memoria el offset ya consumido (inicializado desde el manifiesto de
+    ingesta), así que en cada sondeo basta con un os.stat. Las tramas nuevas se separan con la misma
+    lógica de LOG_PATTERN de `data_extractor.iter_log_frames` y se confirman en micro-lotes cada
+    `lote_ms` milisegundos o cada `lote_filas` filas, lo que ocurra primero.
+    """
+
+    def __init__(self, input_path, db_path, tipo_archivo='ambos', numero_bus=None, intervalo=0.5,
+                 lote_ms=1000, lote_filas=2000, espera_cola=2.0, reescaneo=10.0, perfil="normal"):
+        self.input_path = input_path
+        self.db_path = db_path
+        self.tipo_archivo = tipo_archivo
+        self.numero_bus = numero_bus
+        self.intervalo = intervalo
+        self.lote_ms = lote_ms
+        self.lote_filas = lote_filas
+        self.espera_cola = espera_cola
+        self.reescaneo = reescaneo
+
+        # ruta -> {"tipo", "bus", "offset", "registrado", "tamano", "cambio", "fallido"}; "registrado" es el
+        # offset que tiene el manifiesto, para no volver a escribirlo (ni calcular content_hash) si no avanzó, y
+        # "fallido" el tamaño con el que falló la lectura de un .txt, que no se reintenta hasta que cambie
+        self.archivos = {}
+        self.ultimo_reescaneo = 0.0
+        self.filas_pendientes = 0
+        self.ultimo_commit = time.monotonic()
+        self.filas_totales = 0
+
+        self.conn = create_connection(db_path, perfil)
+        # WAL permite que los tableros lean la base mientras se escriben los micro-lotes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        ensure_schema(self.conn)
+        create_indexes(self.conn)
+        self.dimensiones = get_dimension_cache(self.conn)
+        self.duplicados = get_duplicate_filter(self.conn)
+
+    def descubrir_archivos(self):
+        """Agrega al seguimiento los archivos que aparecieron desde el último recorrido."""
+        for tarea in construir_plan_trabajo(self.input_path, self.tipo_archivo, self.numero_bus):
+            if tarea.ruta not in self.archivos:
+                offset, stat = plan_ingestion(self.db_path, tarea.ruta)
+                offset = stat.st_size if offset is None else offset
+                self.archivos[tarea.ruta] = {
+                    "tipo": tarea.tipo,
+                    "bus": tarea.numero_bus,
+                    "offset": offset,
+                    "registrado": offset,
+                    "tamano": stat.st_size,
+                    "cambio": time.monotonic(),
+                    "fallido": None,
+                }
+        self.ultimo_reescaneo = time.monotonic()
+
+    def sondear(self):
+        """Revisa todos los archivos seguidos e ingiere lo que se les haya agregado."""
+        if time.monotonic() - self.ultimo_reescaneo >= self.reescaneo:
+            self.descubrir_archivos()
+
+        for ruta, estado in self.archivos.items():
+            try:
+                stat = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+
+            ahora = time.monotonic()
+            if stat.st_size != estado["tamano"]:
+                estado["tamano"] = stat.st_size
+                estado["cambio"] = ahora
+            if stat.st_size < estado["offset"]:
+                # El archivo se truncó o se reemplazó: volver a leerlo desde el inicio
+                estado["offset"] = 0
+            if stat.st_size == estado["offset"]:
+                continue
+
+            if estado["tipo"] == 'log':
+                # La última trama solo se consume cuando el archivo deja de crecer por `espera_cola` segundos
+                completo = ahora - estado["cambio"] >= self.espera_cola
+                self.ingerir_log(ruta, estado, stat, completo)
+            else:
+                self.ingerir_txt(ruta, estado, stat)
+
+        if self.filas_pendientes and (time.monotonic() - self.ultimo_commit) * 1000 >= self.lote_ms:
+            self.confirmar()
+
+    def ingerir_log(self, ruta, estado, stat, completo):
+        """Ingiere las tramas agregadas a un .log desde el offset consumido."""
+        tramas = []
+        for trama in iter_log_frames(ruta, estado["offset"], final=completo):
+            tramas.append(trama)
+            estado["offset"] = trama[1]
+            if len(tramas) >= BATCH_ROWS:
+                self.escribir(ruta, estado, stat, tramas)
+                tramas = []
+        self.escribir(ruta, estado, stat, tramas)
+
+    def ingerir_txt(self, ruta, estado, stat):
+        """
+        Ingiere las líneas completas agregadas a un .txt de sensores en la transacción del micro-lote, que se
+        confirma junto con su offset (guardar_sensores_por_bloques con la conexión del seguidor). Si la lectura
+        o la escritura falla no queda ninguna fila y el offset no avanza: el error se informa una vez y las
+        líneas se vuelven a intentar cuando el archivo cambie de tamaño.
+        """
+        fin = last_line_end(ruta, stat.st_size)
+        if fin <= estado["offset"] or estado["fallido"] == stat.st_size:
+            return
+        particiones = get_shard_router(self.conn)
+        if particiones is not None and particiones.crowded():
+            self.confirmar()
+        filas = guardar_sensores_por_bloques(sensor_por_bloques(ruta, estado["bus"], estado["offset"], fin),
+                                             self.db_path, self.conn)
+        if filas is None:
+            estado["fallido"] = stat.st_size
+            return
+        estado["fallido"] = None
+        self.filas_pendientes += filas
+        self.filas_totales += filas
+        estado["offset"] = fin
+        self.registrar(ruta, estado, stat)
+        if self.filas_pendientes >= self.lote_filas:
+            self.confirmar()
+
+    def escribir(self, ruta, estado, stat, tramas):
+        """Escribe un grupo de tramas y confirma si se alcanzó el tamaño del micro-lote."""
+        if tramas:
+            particiones = get_shard_router(self.conn)
+            if particiones is not None and particiones.crowded():
+                # Entre dos grupos la transacción es coherente con el manifiesto: se confirma para soltarlas
+                self.confirmar()
+            lotes = prepare_frames(ruta, tramas)
+            write_batches(self.conn, lotes, self.dimensiones)
+            self.filas_pendientes += lotes["registros"]
+            self.filas_totales += lotes["registros"]
+        self.registrar(ruta, estado, stat)
+        if self.filas_pendientes >= self.lote_filas:
+            self.confirmar()
+
+    def registrar(self, ruta, estado, stat):
+        """Registra el offset consumido en el manifiesto, solo si avanzó (o retrocedió) desde el último registro."""
+        if estado["offset"] != estado["registrado"]:
+            record_ingestion(self.conn, self.db_path, ruta, stat, estado["offset"])
+            estado["registrado"] = estado["offset"]
+
+    def confirmar(self):
+        self.conn.commit()
+        commit_sensor_store()
+        self.filas_pendientes = 0
+        self.ultimo_commit = time.monotonic()
+        particiones = get_shard_router(self.conn)
+        if particiones is not None and particiones.crowded():
+            particiones.detach_all()
+
+    def ejecutar(self):
+        """Sondea indefinidamente hasta que se interrumpa con Ctrl+C."""
+        print(f"Siguiendo {self.input_path} (sondeo cada {self.intervalo} s, micro-lotes de "
+              f"{self.lote_ms} ms o {self.lote_filas} filas). Ctrl+C para terminar.")
+        try:
+            while True:
+                self.sondear()
+                time.sleep(self.intervalo)
+        except KeyboardInterrupt:
+            self.confirmar()
+        except Exception:
+            # Lo que no se confirmó puede ser un grupo de tramas a medio escribir, sin su offset
+            self.conn.rollback()
+            rollback_sensor_store()
+            raise
+        finally:
+            particiones = release_shard_router(self.conn)
+            self.conn.close()
+            print(f"Seguimiento terminado: {self.filas_totales} filas ingeridas.")
+            if particiones is not None:
+                print(f"Particiones mensuales: {particiones.resumen()}.")
+            print(f"Tramas duplicadas: {self.duplicados.resumen()}.")
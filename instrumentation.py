@@ -0,0 +1,119 @@
+# instrumentation.py
+
+import cProfile
+import io
+import pstats
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Activo solo con --profile. Los puntos de medición de los ciclos internos consultan `enabled` antes de
+# tomar tiempos, así que desactivado el costo es una lectura de atributo por trama o por lote.
+enabled = False
+
+_tiempos = defaultdict(float)   # etapa -> segundos acumulados
+_llamadas = Counter()           # etapa -> veces medida
+_contadores = Counter()         # contador -> valor (filas por tipo de trama, errores, ...)
+
+_NULA = nullcontext()
+
+
+def enable(activo=True):
+    """Activa o desactiva la medición. No borra lo ya acumulado (ver reset)."""
+    global enabled
+    enabled = activo
+
+
+def reset():
+    _tiempos.clear()
+    _llamadas.clear()
+    _contadores.clear()
+
+
+def add_time(etapa, segundos, llamadas=1):
+    """Suma `segundos` a una etapa. Para ciclos internos que ya comprobaron `enabled`."""
+    _tiempos[etapa] += segundos
+    _llamadas[etapa] += llamadas
+
+
+def count(contador, n=1):
+    if enabled:
+        _contadores[contador] += n
+
+
+class _Etapa:
+    __slots__ = ("etapa", "inicio")
+
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *exc):
+        add_time(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+def stage(etapa):
+    """Context manager que acumula el tiempo de pared de un bloque en `etapa` (sin efecto si está desactivado)."""
+    return _Etapa(etapa) if enabled else _NULA
+
+
+def snapshot():
+    """Copia serializable de lo acumulado, para enviarla desde un proceso trabajador."""
+    return {"tiempos": dict(_tiempos), "llamadas": dict(_llamadas), "contadores": dict(_contadores)}
+
+
+def merge(datos):
+    """Suma una copia de `snapshot` (por ejemplo, la de un trabajador) a lo acumulado en este proceso."""
+    for etapa, segundos in datos["tiempos"].items():
+        _tiempos[etapa] += segundos
+    _llamadas.update(datos["llamadas"])
+    _contadores.update(datos["contadores"])
+
+
+def summary(segundos_totales=None):
+    """Tabla de texto con las etapas (tiempo, llamadas y % del total) y los contadores."""
+    lineas = [f"{'Etapa':<24} {'Segundos':>10} {'Llamadas':>10} {'ms/llamada':>11} {'%':>6}"]
+    total = segundos_totales or sum(_tiempos.values()) or 1e-9
+    for etapa, segundos in sorted(_tiempos.items(), key=lambda item: -item[1]):
+        llamadas = _llamadas[etapa]
+        lineas.append(f"{etapa:<24} {segundos:>10.3f} {llamadas:>10} {1000 * segundos / (llamadas or 1):>11.3f} "
+                      f"{100 * segundos / total:>6.1f}")
+    if segundos_totales:
+        lineas.append(f"{'total (pared)':<24} {segundos_totales:>10.3f}")
+    if _contadores:
+        lineas.append("")
+        lineas.append(f"{'Contador':<24} {'Valor':>10}")
+        for contador, valor in sorted(_contadores.items()):
+            lineas.append(f"{contador:<24} {valor:>10}")
+    return "\n".join(lineas)
+
+
+@contextmanager
+def profiled(ruta_cprofile=None, lineas=25):
+    """
+    Activa la medición durante el bloque y al final imprime `summary`. Con `ruta_cprofile` además
+    ejecuta el bloque bajo cProfile, guarda las estadísticas en ese archivo (para pstats o snakeviz)
+    e imprime las `lineas` funciones con más tiempo acumulado.
+    """
+    enable()
+    perfilador = cProfile.Profile() if ruta_cprofile else None
+    inicio = time.perf_counter()
+    if perfilador:
+        perfilador.enable()
+    try:
+        yield
+    finally:
+        if perfilador:
+            perfilador.disable()
+        segundos = time.perf_counter() - inicio
+        enable(False)
+        print(summary(segundos))
+        if perfilador:
+            perfilador.dump_stats(ruta_cprofile)
+            salida = io.StringIO()
+            pstats.Stats(perfilador, stream=salida).sort_stats("cumulative").print_stats(lineas)
+            print(salida.getvalue())
+            print(f"Perfil de cProfile guardado en {ruta_cprofile}.")
@@ -1,14 +1,31 @@
 import os
 import argparse
-from sensor_data_processor import sensor  # Importar módulo de procesamiento de sensores
-from save_to_database import guardar_en_base_de_datos
-from file_processor import process_file  # Importar process_file desde file_processor.py
+import sqlite3
+from contextlib import nullcontext
 
+import instrumentation
+from bulk_load import SesionCarga
+from config import SQLITE_PROFILES, CHECKPOINT_ROWS, SENSOR_STORE_PATH, SCHEMA_STRICT, EVENT_STORAGE, SHARD_BY_MONTH
+from coverage import rebuild_coverage
+from database import create_connection, migrate_timestamps
+from manifest import plan_ingestion, record_ingestion, last_line_end
+from sensor_data_processor import sensor_por_bloques  # Importar módulo de procesamiento de sensores
+from save_to_database import guardar_sensores_por_bloques
+from file_processor import process_file, replay_quarantine  # Importar process_file desde file_processor.py
+from follow import SeguidorArchivos
+from parallel_ingest import procesar_en_paralelo
+from quarantine import report_rejects
+from events import set_event_storage
+from schema import ensure_schema, set_strict_tables, consolidate_events
+from sensor_store import set_sensor_store
+from shards import set_monthly_shards, seal_shards, ShardReader
 
-def procesar_archivos(input_path, output_path, db_path, tipo_archivo):
+
+def procesar_archivos(input_path, output_path, db_path, tipo_archivo, sesion=None):
     """
     Procesa archivos individuales, carpetas de archivos, o carpetas con subcarpetas de archivos .log o .txt,
     y guarda los resultados en una base de datos SQLite.
+    Con `sesion` todos los archivos comparten la conexión y la transacción de una SesionCarga.
     """
     # Crear directorio de salida si no existe
     if not os.path.exists(output_path):
@@ -22,29 +39,28 @@ def procesar_archivos(input_path, output_path, db_path, tipo_archivo):
         if subcarpetas:
             # Procesar cada subcarpeta
             for subcarpeta in subcarpetas:
-                procesar_archivos(subcarpeta, output_path, db_path, tipo_archivo)  # Llamada recursiva para subcarpetas
+                procesar_archivos(subcarpeta, output_path, db_path, tipo_archivo, sesion)  # Llamada recursiva para subcarpetas
         elif archivos:
             # Extraer el número de bus del nombre de la carpeta
             nombre_carpeta = os.path.basename(input_path)
             numero_bus = nombre_carpeta.split('-')[0]  # Suponiendo que el número de bus es la primera parte
 
             # Procesar todos los archivos en la carpeta
-            procesar_archivos_en_carpeta(input_path, output_path, db_path, tipo_archivo, numero_bus)
+            procesar_archivos_en_carpeta(input_path, output_path, db_path, tipo_archivo, numero_bus, sesion)
     elif os.path.isfile(input_path):
         # Es un archivo individual
         if input_path.endswith('.log') and tipo_archivo in ['log', 'ambos']:
             print(f"Procesando archivo de log: {input_path}")
-            process_file(input_path, output_path, db_path)
+            process_file(input_path, output_path, db_path, sesion=sesion)
         elif input_path.endswith('.txt') and tipo_archivo in ['txt', 'ambos']:
             numero_bus = input("Introduce el número de bus: ")
             print(f"Procesando archivo de texto: {input_path}")
-            datos = sensor(input_path, numero_bus)  # Procesar archivo específico con número de bus
-            guardar_en_base_de_datos(datos, db_path, 'sensores')
+            procesar_archivo_sensor(input_path, db_path, numero_bus, sesion)  # Procesar archivo específico con número de bus
     else:
         print("Ruta de entrada no válida. Por favor, proporciona una carpeta o un archivo individual.")
 
 
-def procesar_archivos_en_carpeta(carpeta, output_path, db_path, tipo_archivo, numero_bus):
+def procesar_archivos_en_carpeta(carpeta, output_path, db_path, tipo_archivo, numero_bus, sesion=None):
     """
     Procesa todos los archivos .log o .txt dentro de una carpeta específica.
     """
@@ -54,13 +70,43 @@ def procesar_archivos_en_carpeta(carpeta, output_path, db_path, tipo_archivo, nu
     for archivo in archivos_log:
         ruta_archivo = os.path.join(carpeta, archivo)
         print(f"Procesando archivo de log: {ruta_archivo}")
-        process_file(ruta_archivo, output_path, db_path)
+        process_file(ruta_archivo, output_path, db_path, sesion=sesion)
 
     for archivo in archivos_txt:
         ruta_archivo = os.path.join(carpeta, archivo)
         print(f"Procesando archivo de texto: {ruta_archivo}")
-        datos = sensor(ruta_archivo, numero_bus)  # Proceso de archivos de texto para datos de sensores
-        guardar_en_base_de_datos(datos, db_path, 'sensores')
+        procesar_archivo_sensor(ruta_archivo, db_path, numero_bus, sesion)  # Proceso de archivos de texto para datos de sensores
+
+
+def procesar_archivo_sensor(ruta_archivo, db_path, numero_bus, sesion=None):
+    """
+    Guarda en la tabla 'sensores' las líneas completas de un .txt que aún no se ingirieron,
+    según el manifiesto de ingesta, y registra hasta qué byte se leyó.
+    """
+    offset, stat = plan_ingestion(db_path, ruta_archivo)
+    if offset is None:
+        print(f"Sin cambios desde la última ingesta: {ruta_archivo}")
+        return
+
+    conn = sesion.conn if sesion else None
+    filas = 0
+    fin = last_line_end(ruta_archivo, stat.st_size)
+    if fin > offset:
+        # Lectura por bloques: la memoria no depende del tamaño del archivo
+        filas = guardar_sensores_por_bloques(sensor_por_bloques(ruta_archivo, numero_bus, offset, fin), db_path, conn)
+        if not filas:
+            # None si falló a mitad del archivo: no se guardó nada y se reintentará completo
+            return
+
+    if sesion is None:
+        conn = sqlite3.connect(db_path)
+        ensure_schema(conn)
+    record_ingestion(conn, db_path, ruta_archivo, stat, max(fin, offset))
+    if sesion is None:
+        conn.commit()
+        conn.close()
+    else:
+        sesion.registrar_filas(filas)
 
 
 if __name__ == "__main__":
@@ -75,8 +121,107 @@ if __name__ == "__main__":
     parser.add_argument('--tipo_archivo', type=str, choices=['log', 'txt', 'ambos'], default='ambos',
                         help='Tipo de archivo a procesar: log (archivos .log), txt (archivos .txt), ambos (ambos '
                              'tipos).')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Número de procesos para analizar archivos en paralelo. Con 1 (por defecto) se procesa '
+                             'de forma secuencial.')
+    parser.add_argument('--follow', action='store_true',
+                        help='Sigue los archivos de la ruta de entrada e ingiere los registros que se les agregan.')
+    parser.add_argument('--intervalo', type=float, default=0.5,
+                        help='Segundos entre sondeos de los archivos en modo --follow.')
+    parser.add_argument('--lote_ms', type=int, default=1000,
+                        help='Milisegundos máximos entre confirmaciones en modo --follow.')
+    parser.add_argument('--lote_filas', type=int, default=2000,
+                        help='Filas máximas por confirmación en modo --follow.')
+    parser.add_argument('--perfil_sqlite', type=str, choices=list(SQLITE_PROFILES), default='normal',
+                        help='Perfil de PRAGMAs de la conexión de escritura (ver SQLITE_PROFILES en config.py). '
+                             'carga_masiva usa WAL, synchronous=NORMAL y cachés grandes para cargas históricas.')
+    parser.add_argument('--checkpoint_filas', type=int, default=CHECKPOINT_ROWS,
+                        help='Filas escritas entre confirmaciones; toda la ejecución usa una sola transacción '
+                             'que solo se confirma en estos checkpoints.')
+    parser.add_argument('--indices', type=str, choices=['al_inicio', 'al_final', 'no'], default='al_inicio',
+                        help='Cuándo crear los índices secundarios: al_inicio (se mantienen durante la carga), '
+                             'al_final (se eliminan y se reconstruyen al terminar, para cargas históricas) o no.')
+    parser.add_argument('--migrar_fechas', action='store_true',
+                        help='Antes de procesar, convierte las fechas guardadas en el formato original '
+                             '(dd/mm/YYYY) al formato de TIMESTAMP_MODE. Solo es necesario una vez por base de datos.')
+    parser.add_argument('--almacen_sensores', type=str, default=SENSOR_STORE_PATH,
+                        help='Carpeta de un almacén columnar (sensor_store.py) donde también se guardan los datos '
+                             'de sensores, particionados por bus y día, para leerlos con memoria mapeada.')
+    parser.add_argument('--tablas_strict', action=argparse.BooleanOptionalAction, default=SCHEMA_STRICT,
+                        help='Crea las tablas nuevas como STRICT, con tipos verificados por SQLite (ver schema.py); '
+                             '--no-tablas_strict las crea sin STRICT aunque SCHEMA_STRICT esté activo.')
+    parser.add_argument('--eventos', type=str, choices=['tablas', 'consolidada'], default=EVENT_STORAGE,
+                        help='Formato de los eventos y alarmas en una base nueva: una tabla por tipo, o la tabla '
+                             'Eventos con vistas de compatibilidad por tipo (ver events.py).')
+    parser.add_argument('--consolidar_eventos', action='store_true',
+                        help='Antes de procesar, pasa los eventos y alarmas de las tablas por tipo a la tabla '
+                             'Eventos y reemplaza esas tablas por vistas. Solo es necesario una vez por base de datos.')
+    parser.add_argument('--particiones_mensuales', action=argparse.BooleanOptionalAction, default=SHARD_BY_MONTH,
+                        help='Guarda las tramas y los sensores en un archivo por mes junto a la base de datos '
+                             '(<db_path>_meses/YYYY-MM.db); la base principal conserva dimensiones y catálogos.')
+    parser.add_argument('--cerrar_meses', type=str, default=None, metavar='YYYY-MM',
+                        help='Al terminar, compacta y deja de solo lectura las particiones mensuales anteriores a '
+                             'este mes, para archivarlas.')
+    parser.add_argument('--reconstruir_cobertura', action='store_true',
+                        help='Antes de procesar, recalcula la cobertura diaria del informe semanal desde las tramas '
+                             'P60 y los sensores de la base y de sus particiones mensuales.')
+    parser.add_argument('--reprocesar_cuarentena', action='store_true',
+                        help='Antes de procesar, reingresa las tramas de la tabla Cuarentena que ahora se pueden '
+                             'decodificar y tienen un tipo de HEADERS_SPECIFIC (por ejemplo, después de ampliarlo).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Mide el tiempo acumulado de cada etapa (UTF-16, LOG_PATTERN, json, filas, executemany, '
+                             '...) y cuenta filas por tipo de trama y errores; imprime un resumen al terminar.')
+    parser.add_argument('--cprofile', type=str, default=None,
+                        help='Con --profile, guarda además la salida de cProfile en este archivo.')
 
     args = parser.parse_args()
+    set_sensor_store(args.almacen_sensores)
+    set_strict_tables(args.tablas_strict)
+    set_event_storage(args.eventos)
+    set_monthly_shards(args.particiones_mensuales)
+    # Con --profile la ejecución se mide por etapas y al final se imprime el resumen
+    medicion = instrumentation.profiled(args.cprofile) if args.profile else nullcontext()
+    with medicion:
+        if args.migrar_fechas:
+            conn = create_connection(args.db_path)
+            migrate_timestamps(conn)
+            conn.close()
+
+        if args.consolidar_eventos:
+            conn = create_connection(args.db_path)
+            ensure_schema(conn)
+            consolidate_events(conn)
+            conn.close()
+
+        if args.reconstruir_cobertura:
+            with ShardReader(args.db_path) as lector:
+                dias = rebuild_coverage(lector.conn, lector.groups())
+                lector.conn.commit()
+            print(f"Cobertura diaria reconstruida: {dias} días (bus, fecha, fuente).")
+
+        if args.reprocesar_cuarentena:
+            replay_quarantine(args.db_path)
+
+        # Procesar archivos de acuerdo con los parámetros proporcionados
+        if args.jobs > 1 or args.follow:
+            if not os.path.exists(args.output_path):
+                os.makedirs(args.output_path)
+            numero_bus = None
+            if os.path.isfile(args.input_path) and args.input_path.endswith('.txt'):
+                numero_bus = input("Introduce el número de bus: ")
+            if args.follow:
+                SeguidorArchivos(args.input_path, args.db_path, args.tipo_archivo, numero_bus, intervalo=args.intervalo,
+                                 lote_ms=args.lote_ms, lote_filas=args.lote_filas, perfil=args.perfil_sqlite).ejecutar()
+            else:
+                procesar_en_paralelo(args.input_path, args.db_path, args.tipo_archivo, args.jobs, numero_bus,
+                                     perfil=args.perfil_sqlite, checkpoint_filas=args.checkpoint_filas,
+                                     indices=args.indices)
+        else:
+            with SesionCarga(args.db_path, args.perfil_sqlite, args.checkpoint_filas, args.indices) as sesion:
+                procesar_archivos(args.input_path, args.output_path, args.db_path, args.tipo_archivo, sesion)
+
+        if args.cerrar_meses:
+            seal_shards(args.db_path, args.cerrar_meses)
 
-    # Procesar archivos de acuerdo con los parámetros proporcionados
-    procesar_archivos(args.input_path, args.output_path, args.db_path, args.tipo_archivo)
+        # Rechazos de toda la ejecución que aún no se informaron
+        report_rejects()
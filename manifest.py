@@ -0,0 +1,96 @@
+# manifest.py
+
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+from config import manifiesto_headers, MANIFEST_HASH_BYTES
+
+MANIFEST_TABLE = "ManifiestoIngesta"
+
+# Manifiestos ya cargados, por ruta de base de datos (se leen una sola vez por ejecución)
+_manifiestos = {}
+
+
+def create_manifest_table(conn):
+    """Crea la tabla del manifiesto de ingesta si no existe."""
+    columns = ', '.join(f"{header} {dtype}" for header, dtype in manifiesto_headers)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} ({columns})")
+
+
+def load_manifest(db_path):
+    """
+    Devuelve el manifiesto de la base de datos como diccionario ruta -> (tamano, mtime_ns, hash, offset).
+    Se consulta la base solo la primera vez; después se usa la copia en memoria.
+    """
+    if db_path not in _manifiestos:
+        conn = sqlite3.connect(db_path)
+        try:
+            create_manifest_table(conn)
+            cursor = conn.execute(f"SELECT ruta, tamano, mtime_ns, hash_contenido, offset_bytes FROM {MANIFEST_TABLE}")
+            _manifiestos[db_path] = {row[0]: row[1:] for row in cursor}
+        finally:
+            conn.close()
+    return _manifiestos[db_path]
+
+
+def content_hash(ruta, length):
+    """SHA-256 de los primeros `length` bytes del archivo."""
+    with open(ruta, 'rb') as file:
+        return hashlib.sha256(file.read(min(length, MANIFEST_HASH_BYTES))).hexdigest()
+
+
+def plan_ingestion(db_path, ruta):
+    """
+    Decide cómo ingerir un archivo según el manifiesto.
+
+    Devuelve (offset, stat): offset es None si el archivo no cambió desde la última ingesta,
+    el último byte consumido si el archivo solo creció, o 0 si es nuevo o fue reemplazado.
+    """
+    stat = os.stat(ruta)
+    entrada = load_manifest(db_path).get(os.path.abspath(ruta))
+    if entrada is None:
+        return 0, stat
+
+    tamano, mtime_ns, hash_contenido, offset = entrada
+    if stat.st_size == tamano and stat.st_mtime_ns == mtime_ns:
+        return None, stat
+
+    # El archivo creció: retomar desde el offset si el inicio sigue siendo el mismo
+    if stat.st_size >= offset and content_hash(ruta, tamano) == hash_contenido:
+        return (None if stat.st_size == offset else offset), stat
+    return 0, stat
+
+
+def record_ingestion(conn, db_path, ruta, stat, offset):
+    """
+    Registra en el manifiesto que `ruta` se consumió hasta `offset`. No confirma la transacción,
+    para que el registro quede en la misma transacción que los datos insertados.
+    """
+    ruta = os.path.abspath(ruta)
+    hash_contenido = content_hash(ruta, stat.st_size)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {MANIFEST_TABLE} "
+        f"(ruta, tamano, mtime_ns, hash_contenido, offset_bytes, fecha_ingesta) VALUES (?, ?, ?, ?, ?, ?)",
+        (ruta, stat.st_size, stat.st_mtime_ns, hash_contenido, offset, datetime.now().isoformat(' ', 'seconds'))
+    )
+    if db_path in _manifiestos:
+        _manifiestos[db_path][ruta] = (stat.st_size, stat.st_mtime_ns, hash_contenido, offset)
+
+
+def last_line_end(ruta, tamano, bloque=64 * 1024):
+    """
+    Posición en bytes justo después del último salto de línea dentro de los primeros `tamano` bytes.
+    Sirve para no consumir una línea de un .txt que todavía se está escribiendo.
+    """
+    with open(ruta, 'rb') as file:
+        fin = tamano
+        while fin > 0:
+            inicio = max(0, fin - bloque)
+            file.seek(inicio)
+            posicion = file.read(fin - inicio).rfind(b'\n')
+            if posicion != -1:
+                return inicio + posicion + 1
+            fin = inicio
+    return 0
@@ -0,0 +1,223 @@
+# parallel_ingest.py
+
+import math
+import multiprocessing
+import os
+import queue
+import sqlite3
+import time
+from collections import namedtuple
+
+import instrumentation
+from bulk_load import SesionCarga
+from config import CHECKPOINT_ROWS
+from file_processor import iter_log_batches, write_batches, forget_written_keys
+from manifest import plan_ingestion, record_ingestion, last_line_end
+from quarantine import collect_rejects, merge_rejects, report_rejects, set_report_interval
+from save_to_database import guardar_sensores_por_bloques
+from sensor_data_processor import sensor_por_bloques
+
+# Unidad de trabajo del plan: un archivo .log o .txt con los bytes pendientes de leer, el número de bus
+# de su carpeta y el punto de partida según el manifiesto de ingesta
+TareaArchivo = namedtuple("TareaArchivo", ["ruta", "tamano", "tipo", "numero_bus", "offset", "stat"])
+
+# Cola compartida por los trabajadores del pool (se asigna en _inicializar_trabajador)
+_cola_resultados = None
+
+
+def construir_plan_trabajo(input_path, tipo_archivo, numero_bus=None, db_path=None):
+    """
+    Recorre la ruta de entrada con os.scandir y devuelve la lista de archivos a procesar,
+    ordenada de mayor a menor tamaño para que los archivos grandes empiecen primero.
+    Con `db_path` se consulta el manifiesto de ingesta: se omiten los archivos sin cambios y
+    los que crecieron se planifican desde su último offset.
+
+    Sigue las mismas reglas que `main.procesar_archivos`: si una carpeta tiene subcarpetas se
+    recorren solo las subcarpetas; si solo tiene archivos, el número de bus sale del nombre
+    de la carpeta.
+    """
+    extensiones = {'log': ('.log',), 'txt': ('.txt',), 'ambos': ('.log', '.txt')}[tipo_archivo]
+    plan = []
+
+    def agregar(ruta, tamano, bus):
+        tipo = os.path.splitext(ruta)[1][1:]
+        offset, stat = 0, None
+        if db_path is not None:
+            offset, stat = plan_ingestion(db_path, ruta)
+            if offset is None:
+                return
+            tamano = stat.st_size - offset
+        plan.append(TareaArchivo(ruta, tamano, tipo, bus, offset, stat))
+
+    def recorrer(carpeta):
+        with os.scandir(carpeta) as entries:
+            entries = list(entries)
+        subcarpetas = [e for e in entries if e.is_dir()]
+        if subcarpetas:
+            for subcarpeta in subcarpetas:
+                recorrer(subcarpeta.path)
+            return
+        bus = os.path.basename(carpeta).split('-')[0]
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(extensiones):
+                agregar(entry.path, entry.stat().st_size, bus)
+
+    if os.path.isdir(input_path):
+        recorrer(input_path)
+    elif os.path.isfile(input_path) and input_path.endswith(extensiones):
+        agregar(input_path, os.path.getsize(input_path), numero_bus)
+
+    plan.sort(key=lambda tarea: tarea.tamano, reverse=True)
+    return plan
+
+
+def _inicializar_trabajador(cola, medir=False):
+    global _cola_resultados
+    _cola_resultados = cola
+    instrumentation.enable(medir)
+    # Los rechazos los informa el escritor, que suma los de todos los trabajadores
+    set_report_interval(math.inf)
+
+
+def _procesar_tarea(tarea):
+    """
+    Se ejecuta en un proceso trabajador: analiza el archivo y envía las filas al escritor.
+    Siempre envía un mensaje "fin" para que el escritor pueda llevar la cuenta de tareas pendientes;
+    con un error en "fin" el escritor descarta los bloques de sensores que ya recibió de ese archivo.
+    """
+    inicio = time.perf_counter()
+    registros = 0
+    offset = tarea.offset
+    error = None
+    try:
+        if tarea.tipo == 'log':
+            for lotes in iter_log_batches(tarea.ruta, start_offset=tarea.offset):
+                registros += lotes["registros"]
+                offset = lotes["offset"]
+                _cola_resultados.put(("log", tarea.ruta, lotes))
+        else:
+            fin = last_line_end(tarea.ruta, tarea.stat.st_size) if tarea.stat else None
+            for bloque in sensor_por_bloques(tarea.ruta, tarea.numero_bus, tarea.offset, fin):
+                registros += len(bloque)
+                _cola_resultados.put(("txt", tarea.ruta, bloque))
+            if registros:
+                offset = fin
+            elif fin is not None and fin <= tarea.offset:
+                offset = tarea.offset
+            else:
+                error = "no se pudieron leer datos del archivo"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    rechazos = collect_rejects()
+    if rechazos:
+        _cola_resultados.put(("rechazos", rechazos))
+    if instrumentation.enabled:
+        # Las mediciones del trabajador se suman a las del escritor antes del mensaje "fin"
+        _cola_resultados.put(("perfil", instrumentation.snapshot()))
+        instrumentation.reset()
+    _cola_resultados.put(("fin", os.getpid(), tarea, registros, offset, time.perf_counter() - inicio, error))
+
+
+def procesar_en_paralelo(input_path, db_path, tipo_archivo, jobs, numero_bus=None, perfil="normal",
+                         checkpoint_filas=CHECKPOINT_ROWS, indices="al_inicio"):
+    """
+    Procesa la ruta de entrada con `jobs` procesos trabajadores. El análisis de los archivos
+    (iter_log_frames, decode_frame y prepare_batches) ocurre en los trabajadores, y este proceso
+    es el único que escribe en SQLite, de modo que no hay contención por el bloqueo de la base.
+
+    Los bloques de un .txt se acumulan hasta su mensaje "fin" y se guardan juntos con
+    `guardar_sensores_por_bloques`, dentro de un SAVEPOINT y sin checkpoints intermedios: un archivo que
+    falla a mitad de la lectura o de la escritura no deja filas ni entrada en el manifiesto (las filas de
+    sensores no tienen clave, y volver a leerlo las duplicaría). El costo es que el escritor retiene en
+    memoria los bloques de los .txt que se están leyendo. Cada lote de un .log se escribe en su propio
+    SAVEPOINT: si SQLite lo rechaza se deshace, se descartan los lotes siguientes del archivo y este no se
+    registra en el manifiesto (los lotes ya confirmados no se duplican al releerlo, ver INSERT OR IGNORE).
+    """
+    plan = construir_plan_trabajo(input_path, tipo_archivo, numero_bus, db_path)
+    if not plan:
+        print("No hay archivos nuevos o modificados para procesar.")
+        return {}
+
+    total_bytes = sum(tarea.tamano for tarea in plan)
+    print(f"Plan de trabajo: {len(plan)} archivos, {total_bytes / 1e6:.1f} MB, {jobs} trabajadores.")
+
+    sesion = SesionCarga(db_path, perfil, checkpoint_filas, indices)
+    conn = sesion.conn
+
+    resumen = {}
+    bloques_txt = {}  # ruta -> bloques de sensores recibidos de un .txt que todavía no terminó
+    fallidos = {}     # ruta -> error de SQLite al escribir un lote de un .log
+    inicio = time.perf_counter()
+    cola = multiprocessing.Queue(maxsize=jobs * 2)
+    with multiprocessing.Pool(jobs, initializer=_inicializar_trabajador,
+                              initargs=(cola, instrumentation.enabled)) as pool:
+        resultado = pool.map_async(_procesar_tarea, plan, chunksize=1)
+        pendientes = len(plan)
+        while pendientes:
+            try:
+                mensaje = cola.get(timeout=1)
+            except queue.Empty:
+                if resultado.ready() and not resultado.successful():
+                    resultado.get()  # Propaga el error del pool
+                continue
+
+            if mensaje[0] == "log":
+                _, ruta, lotes = mensaje
+                if ruta in fallidos:
+                    continue
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                conn.execute("SAVEPOINT lote_log")
+                try:
+                    write_batches(conn, lotes, sesion.dimensiones)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO lote_log")
+                    conn.execute("RELEASE lote_log")
+                    forget_written_keys(conn, sesion.dimensiones)
+                    fallidos[ruta] = f"{type(e).__name__}: {e}"
+                    continue
+                conn.execute("RELEASE lote_log")
+                sesion.registrar_filas(lotes["registros"])
+            elif mensaje[0] == "txt":
+                bloques_txt.setdefault(mensaje[1], []).append(mensaje[2])
+            elif mensaje[0] == "perfil":
+                instrumentation.merge(mensaje[1])
+            elif mensaje[0] == "rechazos":
+                merge_rejects(mensaje[1])
+            else:
+                _, pid, tarea, registros, offset, segundos, error = mensaje
+                pendientes -= 1
+                bloques = bloques_txt.pop(tarea.ruta, None)
+                error = error or fallidos.pop(tarea.ruta, None)
+                if not error and bloques and guardar_sensores_por_bloques(bloques, db_path, conn) is None:
+                    error = "no se pudieron guardar los sensores"
+                if error:
+                    print(f"Error al procesar el archivo {tarea.ruta}: {error}")
+                else:
+                    record_ingestion(conn, db_path, tarea.ruta, tarea.stat, offset)
+                    if bloques:
+                        sesion.registrar_filas(registros)
+                estadisticas = resumen.setdefault(pid, {"archivos": 0, "bytes": 0, "registros": 0, "segundos": 0.0})
+                estadisticas["archivos"] += 1
+                estadisticas["bytes"] += tarea.tamano
+                estadisticas["registros"] += registros
+                estadisticas["segundos"] += segundos
+        resultado.get()
+
+    sesion.cerrar()
+    report_rejects()
+
+    imprimir_resumen_trabajadores(resumen, time.perf_counter() - inicio)
+    return resumen
+
+
+def imprimir_resumen_trabajadores(resumen, segundos_totales):
+    """Imprime el rendimiento de cada trabajador y el total de la ejecución."""
+    print(f"{'Trabajador':>10} {'Archivos':>8} {'MB':>9} {'Registros':>10} {'Segundos':>9} {'Reg/s':>10} {'MB/s':>7}")
+    for pid, est in sorted(resumen.items()):
+        segundos = est["segundos"] or 1e-9
+        print(f"{pid:>10} {est['archivos']:>8} {est['bytes'] / 1e6:>9.1f} {est['registros']:>10} "
+              f"{est['segundos']:>9.1f} {est['registros'] / segundos:>10.0f} {est['bytes'] / 1e6 / segundos:>7.2f}")
+    registros = sum(est["registros"] for est in resumen.values())
+    print(f"Total: {registros} registros en {segundos_totales:.1f} s "
+          f"({registros / (segundos_totales or 1e-9):.0f} registros/s).")
@@ -1,13 +1,222 @@
 # processors/data_processor.py
 
+import math
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import STATS_CHUNK_ROWS, STATS_SKETCH_K, STATS_CACHE_SIZE
+from processors.quantile_sketch import QuantileSketch
+from schema import schema_catalog
+from shards import ShardReader
+
+# Tipos declarados que se resumen por defecto (BOOLEAN y los textos quedan fuera)
+_NUMERIC_TYPES = ("REAL", "INTEGER", "INT", "FLOAT")
+
+# Agrupaciones con nombre: columna o expresión según la columna que tenga la tabla (tramas, Eventos,
+# sensores o sus agregados). Las fechas de las tramas pueden ser texto ISO o milisegundos (TIMESTAMP_MODE)
+_GROUPINGS = {
+    "vehiculo": [("idVehiculo", "idVehiculo"), ("bus", "bus")],
+    "ruta": [("idRuta", "idRuta")],
+    "dia": [("fechaHoraLecturaDato", "CASE WHEN typeof(fechaHoraLecturaDato) = 'integer' "
+                                     "THEN date(fechaHoraLecturaDato / 1000, 'unixepoch') "
+                                     "ELSE substr(fechaHoraLecturaDato, 1, 10) END"),
+            ("time", "substr(time, 1, 10)"),
+            ("inicio", "substr(inicio, 1, 10)")],
+}
+
+
+def _catalog_types():
+    """Tipo declarado de cada columna de cada tabla del catálogo (incluidas Eventos y las tablas por tipo)."""
+    tipos = {}
+    for consolidada in (True, False):
+        for tabla, headers in schema_catalog(consolidada):
+            tipos.setdefault(tabla, {header: dtype for header, dtype in headers})
+    return tipos
+
+
+def _is_numeric(dtype):
+    palabras = dtype.split(maxsplit=1)
+    return bool(palabras) and palabras[0].upper() in _NUMERIC_TYPES
+
+
+def _empty_partials(columnas):
+    return [[0, None, None, 0.0, 0.0] for _ in columnas]
+
+
+def _merge_partial(parcial, n, minimo, maximo, suma, cuadrados):
+    """Suma a `parcial` ([count, min, max, total, total de cuadrados]) los agregados de otro esquema o bloque."""
+    if not n:
+        return
+    parcial[0] += n
+    parcial[1] = minimo if parcial[1] is None else min(parcial[1], minimo)
+    parcial[2] = maximo if parcial[2] is None else max(parcial[2], maximo)
+    parcial[3] += suma
+    parcial[4] += cuadrados
+
+
 class DataProcessor:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
+    """
+    Estadísticas descriptivas (las de DataFrame.describe) de una tabla de la base y de sus particiones
+    mensuales. count, min, max, media y desviación estándar salen de agregados parciales (count, min, max,
+    total y total de los cuadrados) que se combinan entre esquemas: sin cuantiles los calcula SQL; con
+    cuantiles se suman en la misma pasada por bloques de STATS_CHUNK_ROWS filas que alimenta un
+    QuantileSketch por columna y grupo. La memoria no depende del número de filas sino del de columnas
+    y grupos. Los resultados se guardan en caché con la versión de los datos (filas y rowid máximo de cada
+    esquema), así que se recalculan al cambiar la tabla.
+    """
 
-    def calcular_estadisticas(self, tabla, filtro):
+    def __init__(self, db_path, chunk_filas=STATS_CHUNK_ROWS, k=STATS_SKETCH_K):
+        self.db_path = db_path
+        self.chunk_filas = chunk_filas
+        self.k = k
+        self._cache = OrderedDict()
+
+    def calcular_estadisticas(self, tabla, filtro=None, params=(), desde=None, hasta=None, columnas=None,
+                              agrupar_por=None, cuantiles=(0.25, 0.5, 0.75)):
         """
         Calcula estadísticas como la media, mediana, etc., sobre una tabla dada con un filtro.
+        Lee la base principal y las particiones mensuales que se solapan con [desde, hasta]
+        (ver shards.ShardReader); el filtro por fecha dentro de cada mes va en `filtro`.
+
+        `columnas` son las columnas a resumir (por defecto las numéricas del catálogo, salvo los
+        identificadores). `agrupar_por` puede ser "vehiculo", "ruta", "dia" o el nombre de una columna:
+        sin agrupar el resultado tiene la forma de DataFrame.describe() y agrupado la de
+        groupby(...).describe(), una fila por grupo. Con `cuantiles` vacío no se recorren las filas.
+        """
+        with ShardReader(self.db_path) as lector:
+            esquema = next((esquema for esquemas in lector.groups() for esquema in esquemas
+                            if lector.has_table(esquema, tabla)), None)
+            if esquema is None:
+                return pd.DataFrame()
+            columnas = self._columnas(lector, esquema, tabla, columnas)
+            grupo = self._agrupacion(lector, esquema, tabla, agrupar_por)
+            if not columnas:
+                return pd.DataFrame()
+            clave = (tabla, filtro, tuple(params), desde, hasta, tuple(columnas), agrupar_por, tuple(cuantiles),
+                     self._version(lector, tabla, desde, hasta))
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave].copy()
+
+            if cuantiles:
+                agregados, resumenes = self._recorrer(lector, tabla, columnas, grupo, filtro, params, desde, hasta)
+            else:
+                agregados, resumenes = self._agregados(lector, tabla, columnas, grupo, filtro, params, desde, hasta), {}
+
+        resultado = self._describe(columnas, agregados, resumenes, cuantiles, agrupar_por)
+        self._cache[clave] = resultado
+        while len(self._cache) > STATS_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return resultado.copy()
+
+    def _columnas(self, lector, esquema, tabla, columnas):
+        info = {fila[1]: fila[2] for fila in lector.conn.execute(f'PRAGMA {esquema}.table_info("{tabla}")')}
+        if columnas is not None:
+            faltantes = [columna for columna in columnas if columna not in info]
+            if faltantes:
+                raise ValueError(f"Columnas que no están en {tabla}: {', '.join(faltantes)}")
+            return list(columnas)
+        # Las vistas de eventos no declaran tipos: se toman del catálogo
+        catalogo = _catalog_types().get(tabla, {})
+        return [columna for columna, dtype in info.items()
+                if _is_numeric(dtype or catalogo.get(columna, "")) and not columna.startswith("id")]
+
+    def _agrupacion(self, lector, esquema, tabla, agrupar_por):
+        """Expresión SQL del grupo, o None sin agrupar."""
+        if agrupar_por is None:
+            return None
+        columnas = {fila[1] for fila in lector.conn.execute(f'PRAGMA {esquema}.table_info("{tabla}")')}
+        for columna, expresion in _GROUPINGS.get(agrupar_por, [(agrupar_por, f'"{agrupar_por}"')]):
+            if columna in columnas:
+                return expresion
+        raise ValueError(f"No se puede agrupar {tabla} por {agrupar_por}")
+
+    def _version(self, lector, tabla, desde, hasta):
+        """Filas y rowid máximo de `tabla` en cada esquema (las vistas no tienen rowid: solo filas)."""
+        version = []
+        for esquemas in lector.groups(desde, hasta):
+            for esquema in esquemas:
+                if not lector.has_table(esquema, tabla):
+                    continue
+                try:
+                    fila = lector.conn.execute(f"SELECT count(*), max(rowid) FROM {esquema}.{tabla}").fetchone()
+                except sqlite3.OperationalError:
+                    fila = lector.conn.execute(f"SELECT count(*), NULL FROM {esquema}.{tabla}").fetchone()
+                version.append((esquema, *fila))
+        return tuple(version)
+
+    def _agregados(self, lector, tabla, columnas, grupo, filtro, params, desde, hasta):
         """
-        consulta = f"SELECT * FROM {tabla} WHERE {filtro}"
-        df = self.db_manager.consulta_sql(consulta)
-        return df.describe()
+        grupo -> [count, min, max, total, total de cuadrados] por columna, con un GROUP BY en SQL por esquema
+        (sin traer filas a Python) y sumando los esquemas aquí.
+        """
+        expresiones = [f"{grupo or 'NULL'} AS grupo"]
+        for columna in columnas:
+            expresiones += [f'count("{columna}")', f'min("{columna}")', f'max("{columna}")', f'total("{columna}")',
+                            f'total("{columna}" * "{columna}")']
+        agregados = {} if grupo else {None: _empty_partials(columnas)}
+        for sql, parametros in lector.queries(tabla, ", ".join(expresiones), filtro, params, desde, hasta,
+                                              group_by="grupo" if grupo else None):
+            for fila in lector.conn.execute(sql, parametros):
+                parciales = agregados.setdefault(fila[0], _empty_partials(columnas))
+                for parcial, i in zip(parciales, range(1, len(fila), 5)):
+                    _merge_partial(parcial, *fila[i:i + 5])
+        return agregados
+
+    def _recorrer(self, lector, tabla, columnas, grupo, filtro, params, desde, hasta):
+        """
+        Agregados como los de _agregados y grupo -> {columna: QuantileSketch}, en una sola pasada por las filas
+        en bloques de chunk_filas: los cuantiles obligan a leerlas, y sumarlas aquí con numpy evita recorrer
+        la tabla otra vez en SQL.
+        """
+        agregados = {} if grupo else {None: _empty_partials(columnas)}
+        resumenes = {}
+        seleccion = ", ".join([f"{grupo or 'NULL'} AS grupo"] + [f'"{columna}"' for columna in columnas])
+        for sql, parametros in lector.queries(tabla, seleccion, filtro, params, desde, hasta):
+            cursor = lector.conn.execute(sql, parametros)
+            while True:
+                bloque = cursor.fetchmany(self.chunk_filas)
+                if not bloque:
+                    break
+                df = pd.DataFrame.from_records(bloque, columns=["grupo"] + columnas)
+                for clave, parte in df.groupby("grupo", sort=False, dropna=False) if grupo else [(None, df)]:
+                    clave = None if pd.isna(clave) else clave
+                    parciales = agregados.setdefault(clave, _empty_partials(columnas))
+                    sketches = resumenes.setdefault(clave, {columna: QuantileSketch(self.k) for columna in columnas})
+                    for columna, parcial in zip(columnas, parciales):
+                        # Lo que no es número (texto en una columna REAL) se descarta
+                        valores = pd.to_numeric(parte[columna], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+                        valores = valores[~np.isnan(valores)]
+                        if len(valores):
+                            _merge_partial(parcial, len(valores), valores.min(), valores.max(), valores.sum(),
+                                           np.dot(valores, valores))
+                            sketches[columna].update(valores)
+        return agregados, resumenes
+
+    @staticmethod
+    def _describe(columnas, agregados, resumenes, cuantiles, agrupar_por):
+        etiquetas = ["count", "mean", "std", "min"] + [f"{q * 100:g}%" for q in cuantiles] + ["max"]
+        filas = {}
+        for clave, parciales in agregados.items():
+            fila = {}
+            for columna, (n, minimo, maximo, suma, cuadrados) in zip(columnas, parciales):
+                media = suma / n if n else math.nan
+                # Varianza muestral (ddof=1, como pandas) a partir de los totales; el redondeo puede dejarla negativa
+                std = math.sqrt(max((cuadrados - suma * suma / n) / (n - 1), 0.0)) if n > 1 else math.nan
+                sketch = resumenes.get(clave, {}).get(columna)
+                qs = sketch.quantiles(cuantiles) if sketch is not None else [math.nan] * len(cuantiles)
+                extremos = [math.nan, math.nan] if minimo is None else [float(minimo), float(maximo)]
+                for etiqueta, valor in zip(etiquetas, [float(n), media, std, extremos[0], *qs, extremos[1]]):
+                    fila[(columna, etiqueta)] = valor
+            filas[clave] = fila
+        if agrupar_por is None:
+            fila = filas[None]
+            return pd.DataFrame({columna: [fila[(columna, etiqueta)] for etiqueta in etiquetas] for columna in columnas},
+                                index=etiquetas)
+        resultado = pd.DataFrame.from_dict(filas, orient="index",
+                                           columns=pd.MultiIndex.from_product([columnas, etiquetas]))
+        resultado.index.name = agrupar_por
+        return resultado.sort_index()
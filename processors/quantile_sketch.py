@@ -0,0 +1,78 @@
+# processors/quantile_sketch.py
+
+import math
+import random
+
+import numpy as np
+
+_VACIO = np.empty(0)
+
+
+class QuantileSketch:
+    """
+    Resumen de cuantiles en flujo al estilo KLL: los valores entran al nivel 0 y, cuando un nivel supera su
+    capacidad, se ordena y la mitad de sus valores (los de posición par o impar, al azar) pasa al nivel
+    siguiente con el doble de peso. La memoria es del orden de 3·k valores sin importar cuántos se agreguen,
+    el error de rango es de alrededor de 1.7/k y dos resúmenes se pueden combinar (merge), por ejemplo
+    los de varias particiones. Mientras no se compacta nada los cuantiles son exactos.
+    """
+
+    def __init__(self, k=200, semilla=None):
+        self.k = k
+        self.n = 0
+        self.niveles = [_VACIO]
+        self.rng = random.Random(semilla)
+
+    def _capacidad(self, nivel):
+        profundidad = len(self.niveles) - nivel - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** profundidad)))
+
+    def update(self, valores):
+        """Agrega un arreglo de valores; los NaN se ignoran."""
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        if not len(valores):
+            return
+        self.n += len(valores)
+        self.niveles[0] = np.concatenate([self.niveles[0], valores])
+        self._compactar()
+
+    def _compactar(self):
+        # Como en KLL, solo se compacta mientras el total supera la suma de las capacidades, y siempre el
+        # nivel más bajo que está lleno: así el resumen conserva cerca de 3·k valores
+        while len(self) > sum(self._capacidad(nivel) for nivel in range(len(self.niveles))):
+            nivel = next(nivel for nivel, datos in enumerate(self.niveles) if len(datos) >= self._capacidad(nivel))
+            if nivel + 1 == len(self.niveles):
+                self.niveles.append(_VACIO)
+            datos = np.sort(self.niveles[nivel])
+            # Con un número impar de valores el último queda en este nivel
+            resto = datos[-1:] if len(datos) % 2 else _VACIO
+            pares = datos[:len(datos) - len(resto)]
+            self.niveles[nivel] = resto
+            self.niveles[nivel + 1] = np.concatenate([self.niveles[nivel + 1], pares[self.rng.randint(0, 1)::2]])
+
+    def merge(self, otro):
+        """Suma a este resumen los valores de `otro` (con el mismo k)."""
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(_VACIO)
+        for nivel, datos in enumerate(otro.niveles):
+            self.niveles[nivel] = np.concatenate([self.niveles[nivel], datos])
+        self.n += otro.n
+        self._compactar()
+        return self
+
+    def quantiles(self, qs):
+        """Cuantiles aproximados de los valores agregados para cada q en [0, 1]; NaN si está vacío."""
+        if not self.n:
+            return [math.nan] * len(qs)
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(datos), 2.0 ** nivel) for nivel, datos in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind="stable")
+        valores, acumulado = valores[orden], np.cumsum(pesos[orden])
+        # Interpolación lineal entre posiciones, como pandas.Series.quantile
+        posiciones = acumulado - pesos[orden] / 2
+        posiciones = (posiciones - posiciones[0]) / ((posiciones[-1] - posiciones[0]) or 1)
+        return [float(np.interp(q, posiciones, valores)) for q in qs]
+
+    def __len__(self):
+        return sum(len(datos) for datos in self.niveles)
@@ -0,0 +1,104 @@
+# quarantine.py
+
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from config import cuarentena_headers, QUARANTINE_REPORT_SECONDS
+
+QUARANTINE_TABLE = "Cuarentena"
+
+# Motivos de rechazo
+MOTIVO_JSON = "json_invalido"
+MOTIVO_TIPO = "tipo_desconocido"
+
+# Trama rechazada, con su origen para poder reingresarla
+Rechazo = namedtuple("Rechazo", ["archivo", "offset", "motivo", "tipo", "texto"])
+
+
+def create_quarantine_table(conn):
+    """Crea la tabla de cuarentena si no existe."""
+    columns = ', '.join(f"{header} {dtype}" for header, dtype in cuarentena_headers)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {QUARANTINE_TABLE} ({columns})")
+
+
+def record_rejects(conn, rechazos):
+    """
+    Guarda un lote de Rechazo con un solo executemany. La clave (archivo, offset) hace que volver a
+    leer un archivo no duplique sus tramas en cuarentena. No confirma la transacción.
+    """
+    if not rechazos:
+        return
+    create_quarantine_table(conn)
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {QUARANTINE_TABLE} (archivo, offset, motivo, tipo, texto, fecha_ingesta) "
+        f"VALUES (?, ?, ?, ?, ?, ?)",
+        [(r.archivo, r.offset, r.motivo, r.tipo, r.texto, ahora) for r in rechazos]
+    )
+
+
+class ReporteRechazos:
+    """
+    Mensajes de consola sobre tramas rechazadas: en lugar de una línea por trama, cuenta los rechazos
+    por motivo y tipo y los imprime agregados, como mucho una vez cada `intervalo` segundos.
+    """
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.pendientes = Counter()
+        self.total = 0
+        self.ultimo = time.monotonic()
+
+    def note(self, motivo, tipo=None, n=1):
+        self.pendientes[(motivo, tipo)] += n
+        self.total += n
+        if time.monotonic() - self.ultimo >= self.intervalo:
+            self.flush()
+
+    def flush(self):
+        """Imprime lo acumulado desde el último mensaje, si hay algo."""
+        self.ultimo = time.monotonic()
+        if not self.pendientes:
+            return
+        detalle = ', '.join(f"{motivo}{' ' + str(tipo) if tipo else ''}: {n}"
+                            for (motivo, tipo), n in self.pendientes.most_common(8))
+        if len(self.pendientes) > 8:
+            detalle += ', ...'
+        print(f"Tramas rechazadas: {sum(self.pendientes.values())} nuevas ({detalle}); {self.total} en total.")
+        self.pendientes.clear()
+
+
+_reporte = ReporteRechazos(QUARANTINE_REPORT_SECONDS)
+
+
+def note_reject(motivo, tipo=None):
+    """Cuenta un rechazo para el próximo mensaje agregado."""
+    _reporte.note(motivo, tipo)
+
+
+def report_rejects():
+    """Imprime los rechazos que aún no se informaron; se llama una vez, al final de la ejecución."""
+    _reporte.flush()
+
+
+def set_report_interval(segundos):
+    """Cada cuántos segundos se imprimen los rechazos acumulados (math.inf: solo con report_rejects)."""
+    _reporte.intervalo = segundos
+
+
+def collect_rejects():
+    """
+    Devuelve y olvida los rechazos contados que aún no se informaron, para que los informe otro proceso:
+    los trabajadores de parallel_ingest se los envían al escritor, que los suma con merge_rejects.
+    """
+    conteos = Counter(_reporte.pendientes)
+    _reporte.pendientes.clear()
+    _reporte.total -= sum(conteos.values())
+    return conteos
+
+
+def merge_rejects(conteos):
+    """Suma a los rechazos de este proceso los contados en otro (ver collect_rejects)."""
+    for (motivo, tipo), n in conteos.items():
+        _reporte.note(motivo, tipo, n)
@@ -0,0 +1,130 @@
+# queries.py
+
+import sqlite3
+import sys
+from datetime import datetime
+
+from config import HEADERS_SPECIFIC
+from events import EVENT_TABLE, event_types, uses_event_table, common_columns
+from data_extractor import get_timestamp_parser
+
+
+def valor_fecha(fecha):
+    """
+    Lleva un límite de consulta (datetime o texto 'dd/mm/YYYY HH:MM:SS.fff') al formato en que se
+    guardan las fechas de las tramas (TIMESTAMP_MODE). Otros valores se usan tal cual.
+    """
+    if isinstance(fecha, datetime):
+        fecha = fecha.strftime('%d/%m/%Y %H:%M:%S.%f')[:-3]
+    return get_timestamp_parser()(fecha)
+
+
+def consultar_vehiculo_rango(conn, tabla, id_vehiculo, desde, hasta, columnas="*"):
+    """
+    Registros de un vehículo en una tabla de tramas dentro de [desde, hasta], ordenados por fecha.
+    Los límites pueden ser datetime (ver valor_fecha). Usa el índice idx_<tabla>_vehiculo_fecha.
+    """
+    sql = (f"SELECT {columnas} FROM {tabla} "
+           f"WHERE idVehiculo = ? AND fechaHoraLecturaDato BETWEEN ? AND ? "
+           f"ORDER BY fechaHoraLecturaDato")
+    return conn.execute(sql, (id_vehiculo, valor_fecha(desde), valor_fecha(hasta))).fetchall()
+
+
+def consultar_por_ruta(conn, tabla, id_ruta, columnas="*"):
+    """Registros de una ruta en una tabla de tramas. Usa el índice idx_<tabla>_ruta."""
+    sql = f"SELECT {columnas} FROM {tabla} WHERE idRuta = ?"
+    return conn.execute(sql, (id_ruta,)).fetchall()
+
+
+def consultar_por_ruta_con_nombre(conn, tabla, id_ruta, columnas="t.*"):
+    """
+    Como consultar_por_ruta, con el código y el nombre de la ruta del catálogo (tabla Rutas) al final
+    de cada registro.
+    """
+    sql = (f"SELECT {columnas}, r.codigoRuta, r.nombreRuta FROM {tabla} AS t "
+           f"LEFT JOIN Rutas AS r ON r.idRuta = t.idRuta WHERE t.idRuta = ?")
+    return conn.execute(sql, (id_ruta,)).fetchall()
+
+
+def consultar_eventos_rango(conn, id_vehiculo, desde, hasta, codigos=None):
+    """
+    Eventos y alarmas de un vehículo dentro de [desde, hasta], de todos los tipos o de los de `codigos`,
+    ordenados por fecha: columnas comunes de las tramas, `codigo` y `datos` (campos propios del tipo en
+    JSON, solo con eventos consolidados). Con la tabla Eventos es una sola consulta sobre
+    idx_Eventos_vehiculo_fecha; con una tabla por tipo, un UNION ALL de sus índices vehiculo_fecha.
+    """
+    codigos = [codigo for codigo in (codigos or event_types()) if codigo in event_types()]
+    if not codigos:
+        return []
+    columnas = ', '.join(common_columns())
+    rango = "idVehiculo = ? AND fechaHoraLecturaDato BETWEEN ? AND ?"
+    params = (id_vehiculo, valor_fecha(desde), valor_fecha(hasta))
+    if uses_event_table(conn):
+        sql = (f"SELECT {columnas}, codigo, datos FROM {EVENT_TABLE} WHERE {rango} "
+               f"AND codigo IN ({', '.join('?' * len(codigos))}) ORDER BY fechaHoraLecturaDato")
+        return conn.execute(sql, params + tuple(codigos)).fetchall()
+    existentes = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    partes = [f"SELECT {columnas}, '{codigo}' AS codigo, NULL AS datos FROM {codigo} WHERE {rango}"
+              for codigo in codigos if codigo in existentes]
+    if not partes:
+        return []
+    sql = " UNION ALL ".join(partes) + " ORDER BY fechaHoraLecturaDato"
+    return conn.execute(sql, params * len(partes)).fetchall()
+
+
+def consultar_sensores_rango(conn, bus, desde, hasta, columnas="*"):
+    """Muestras de sensores de un bus dentro de [desde, hasta]. Usa el índice idx_sensores_bus_time."""
+    sql = f"SELECT {columnas} FROM sensores WHERE bus = ? AND time BETWEEN ? AND ? ORDER BY time"
+    return conn.execute(sql, (bus, desde, hasta)).fetchall()
+
+
+def plan_consulta(conn, sql, params=()):
+    """Devuelve las líneas de detalle de EXPLAIN QUERY PLAN para una consulta."""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def usa_indice(conn, sql, params, indice):
+    """Indica si SQLite resuelve la consulta con el índice dado (según EXPLAIN QUERY PLAN)."""
+    return any(indice in detalle for detalle in plan_consulta(conn, sql, params))
+
+
+def verificar_indices(conn):
+    """
+    Comprueba con EXPLAIN QUERY PLAN que las consultas de este módulo usan sus índices.
+    Devuelve una lista de (tabla, índice, usa_indice).
+    """
+    consultas = []
+    consolidada = uses_event_table(conn)
+    for tabla in HEADERS_SPECIFIC:
+        if consolidada and tabla in event_types():
+            continue
+        consultas.append((tabla, f"idx_{tabla}_vehiculo_fecha",
+                          f"SELECT * FROM {tabla} WHERE idVehiculo = ? AND fechaHoraLecturaDato BETWEEN ? AND ? "
+                          f"ORDER BY fechaHoraLecturaDato", (0, '', '')))
+        consultas.append((tabla, f"idx_{tabla}_ruta", f"SELECT * FROM {tabla} WHERE idRuta = ?", ('',)))
+    if consolidada:
+        consultas.append((EVENT_TABLE, f"idx_{EVENT_TABLE}_vehiculo_fecha",
+                          f"SELECT * FROM {EVENT_TABLE} WHERE idVehiculo = ? AND fechaHoraLecturaDato BETWEEN ? AND ? "
+                          f"ORDER BY fechaHoraLecturaDato", (0, '', '')))
+        consultas.append(("EV1", f"idx_{EVENT_TABLE}_codigo_fecha",
+                          "SELECT * FROM EV1 WHERE fechaHoraLecturaDato BETWEEN ? AND ?", ('', '')))
+    consultas.append(("Paradas", "idx_Paradas_nombre",
+                      "SELECT idRuta, orden FROM Paradas WHERE nombreParada = ?", ('',)))
+    consultas.append(("sensores", "idx_sensores_bus_time",
+                      "SELECT * FROM sensores WHERE bus = ? AND time BETWEEN ? AND ? ORDER BY time", ('', '', '')))
+
+    resultados = []
+    for tabla, indice, sql, params in consultas:
+        try:
+            resultados.append((tabla, indice, usa_indice(conn, sql, params, indice)))
+        except sqlite3.OperationalError:
+            pass  # La tabla no existe en esta base de datos
+    return resultados
+
+
+if __name__ == "__main__":
+    # Uso: python queries.py ruta_base_de_datos.db
+    conn = sqlite3.connect(sys.argv[1])
+    for tabla, indice, ok in verificar_indices(conn):
+        print(f"{tabla:<10} {indice:<30} {'OK' if ok else 'SIN ÍNDICE'}")
+    conn.close()
@@ -0,0 +1,62 @@
+# route_catalog.py
+
+from datetime import datetime
+
+from config import rutas_headers, paradas_headers
+
+RUTAS_TABLE = "Rutas"
+PARADAS_TABLE = "Paradas"
+
+_UPSERT_RUTA_SQL = (
+    f"INSERT INTO {RUTAS_TABLE} (idRuta, codigoRuta, nombreRuta, fecha_actualizacion) VALUES (?, ?, ?, ?) "
+    f"ON CONFLICT (idRuta) DO UPDATE SET codigoRuta = excluded.codigoRuta, nombreRuta = excluded.nombreRuta, "
+    f"fecha_actualizacion = excluded.fecha_actualizacion"
+)
+
+
+def create_route_tables(conn):
+    """Crea las tablas Rutas y Paradas si no existen, con el índice por nombre de parada."""
+    for tabla, headers in [(RUTAS_TABLE, rutas_headers), (PARADAS_TABLE, paradas_headers)]:
+        columns = ', '.join(f"{header} {dtype}" for header, dtype in headers)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {tabla} ({columns})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{PARADAS_TABLE}_nombre ON {PARADAS_TABLE} (nombreParada)")
+
+
+def upsert_routes(conn, rutas):
+    """
+    Guarda un lote de rutas [(idRuta, codigo, nombre, [(nombre_parada, direccion_parada), ...]), ...] en
+    una sola transacción: las rutas se combinan con UPSERT y las paradas de cada ruta se reemplazan
+    completas, conservando su orden. Devuelve el número de paradas escritas.
+    """
+    if not rutas:
+        return 0
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    paradas = [(str(id_ruta), orden, nombre, direccion)
+               for id_ruta, _, _, recorridos in rutas
+               for orden, (nombre, direccion) in enumerate(recorridos, start=1)]
+    with conn:
+        create_route_tables(conn)
+        conn.executemany(_UPSERT_RUTA_SQL, [(str(id_ruta), codigo, nombre, ahora) for id_ruta, codigo, nombre, _ in rutas])
+        conn.executemany(f"DELETE FROM {PARADAS_TABLE} WHERE idRuta = ?", [(str(r[0]),) for r in rutas])
+        conn.executemany(f"INSERT INTO {PARADAS_TABLE} (idRuta, orden, nombreParada, direccionParada) "
+                         f"VALUES (?, ?, ?, ?)", paradas)
+    return len(paradas)
+
+
+def route_names(conn, tabla):
+    """
+    idRuta distintos de una tabla de tramas con el código y el nombre de la ruta (None si la ruta no
+    está en el catálogo). El DISTINCT usa el índice idx_<tabla>_ruta y el join la clave de Rutas.
+    """
+    create_route_tables(conn)
+    sql = (f"SELECT t.idRuta, r.codigoRuta, r.nombreRuta "
+           f"FROM (SELECT DISTINCT idRuta FROM {tabla}) AS t "
+           f"LEFT JOIN {RUTAS_TABLE} AS r ON r.idRuta = t.idRuta ORDER BY t.idRuta")
+    return conn.execute(sql).fetchall()
+
+
+def route_stops(conn, id_ruta):
+    """Paradas de una ruta en el orden del recorrido: [(orden, nombre, dirección), ...]."""
+    sql = (f"SELECT orden, nombreParada, direccionParada FROM {PARADAS_TABLE} "
+           f"WHERE idRuta = ? ORDER BY orden")
+    return conn.execute(sql, (str(id_ruta),)).fetchall()
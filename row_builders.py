@@ -0,0 +1,107 @@
+# row_builders.py
+
+import functools
+from collections import namedtuple
+
+from config import HEADERS_SPECIFIC, COMMON_HEADERS, foreign_keys, vehiculos_headers, conductores_headers, \
+    versiones_trama_headers, TIMESTAMP_FIELDS, TRAMA_INSERT_CONFLICT
+from data_extractor import transform_data, get_timestamp_parser
+
+# Constructor de filas de una tabla: columnas en orden, sentencia INSERT y función obj -> tupla
+RowBuilder = namedtuple("RowBuilder", ["table", "columns", "insert_sql", "build_row"])
+
+# Resultado de compilar el esquema: un RowBuilder por tipo de trama y uno por tabla de dimensión
+CompiledSchema = namedtuple("CompiledSchema", ["tramas", "vehiculos", "conductores", "versiones"])
+
+# Campos anidados dentro de 'localizacionVehiculo'
+_NESTED_FIELDS = {"latitud", "longitud"}
+
+# Campos que pasan por transform_data antes de insertarse
+_TRANSFORMED_FIELDS = {"idVehiculo", "idConductor"}
+
+# Máximo de valores distintos recordados por cada transformación
+_TRANSFORM_CACHE_SIZE = 65536
+
+
+def _cached_transform(header):
+    """
+    Devuelve transform_data(header, valor) con memoria de resultados: los identificadores de vehículo
+    y conductor se repiten en casi todas las tramas de un archivo.
+    """
+    cache = {}
+
+    def transform(value):
+        try:
+            return cache[value]
+        except KeyError:
+            if len(cache) >= _TRANSFORM_CACHE_SIZE:
+                cache.clear()
+            result = cache[value] = transform_data(header, value)
+            return result
+        except TypeError:
+            # Valores no hashables (listas, diccionarios): sin memoria
+            return transform_data(header, value)
+
+    return transform
+
+
+def _column_expression(column):
+    """Expresión Python que obtiene el valor de `column` a partir de `get` (obj.get) y `loc`."""
+    if column in _NESTED_FIELDS:
+        return f"loc_get({column!r})"
+    if column in _TRANSFORMED_FIELDS:
+        return f"transform_{column}(get({column!r}))"
+    if column in TIMESTAMP_FIELDS:
+        return f"parse_timestamp(get({column!r}))"
+    return f"get({column!r})"
+
+
+def _compile_builder(table, columns, conflict="REPLACE"):
+    """
+    Genera una función especializada que devuelve la tupla de valores de `columns` para un objeto JSON,
+    sin diccionarios intermedios ni bucles sobre los encabezados.
+    """
+    lines = ["def build_row(obj):", "    get = obj.get"]
+    if _NESTED_FIELDS.intersection(columns):
+        lines.append("    loc_get = (get('localizacionVehiculo') or _EMPTY).get")
+    lines.append(f"    return ({', '.join(_column_expression(column) for column in columns)},)")
+
+    namespace = {f"transform_{field}": _cached_transform(field) for field in _TRANSFORMED_FIELDS}
+    namespace["parse_timestamp"] = get_timestamp_parser()
+    namespace["_EMPTY"] = {}
+    exec("\n".join(lines), namespace)
+
+    sql = f"INSERT OR {conflict} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    return RowBuilder(table, tuple(columns), sql, namespace["build_row"])
+
+
+def trama_columns(tipo):
+    """
+    Columnas de la tabla principal de un tipo de trama: las comunes sin las de las tablas relacionadas
+    (Vehiculos, Conductores, VersionesTrama), seguidas de las propias del tipo.
+    """
+    exclude_headers = {header for header, _ in vehiculos_headers + conductores_headers + versiones_trama_headers}
+    columns = [header for header, _ in COMMON_HEADERS if header not in exclude_headers]
+    columns += [header for header, _ in HEADERS_SPECIFIC[tipo]]
+    for fk_column, _ in foreign_keys:
+        column_name = fk_column.split('(')[1].split(')')[0]
+        if column_name not in columns:
+            columns.append(column_name)
+    return columns
+
+
+@functools.lru_cache(maxsize=None)
+def compile_schema():
+    """
+    Compila una sola vez por proceso COMMON_HEADERS, HEADERS_SPECIFIC y foreign_keys en constructores
+    de filas para cada tipo de trama y para las tablas Vehiculos, Conductores y VersionesTrama.
+    Las fechas de TIMESTAMP_FIELDS se normalizan según TIMESTAMP_MODE y las tramas se insertan con
+    INSERT OR TRAMA_INSERT_CONFLICT.
+    """
+    tramas = {tipo: _compile_builder(tipo, trama_columns(tipo), TRAMA_INSERT_CONFLICT) for tipo in HEADERS_SPECIFIC}
+    return CompiledSchema(
+        tramas,
+        _compile_builder("Vehiculos", [header for header, _ in vehiculos_headers], "IGNORE"),
+        _compile_builder("Conductores", [header for header, _ in conductores_headers], "IGNORE"),
+        _compile_builder("VersionesTrama", [header for header, _ in versiones_trama_headers], "IGNORE"),
+    )
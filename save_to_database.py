@@ -1,23 +1,183 @@
 ﻿# save_to_database.py
 
 import sqlite3
+import time
+
 import pandas as pd
 
+import instrumentation
+from coverage import update_sensor_coverage
+from route_catalog import route_names
+from sensor_rollups import update_rollups
+from sensor_store import get_sensor_store, commit_sensor_store
+from shards import get_shard_router, release_shard_router, monthly_shards_enabled
+
 
-def guardar_en_base_de_datos(df, db_path, nombre_tabla):
-    """Guarda un DataFrame en una base de datos SQLite."""
+def guardar_en_base_de_datos(df, db_path, nombre_tabla, conn=None):
+    """
+    Guarda un DataFrame en una base de datos SQLite.
+    Si se recibe `conn` se reutiliza esa conexión y no se cierra (escritor único).
+    """
     try:
-        conn = sqlite3.connect(db_path)
+        propia = conn is None
+        if propia:
+            conn = sqlite3.connect(db_path)
         df.to_sql(nombre_tabla, conn, if_exists='append', index=False)
-        conn.close()
+        if propia:
+            conn.close()
     except sqlite3.Error as e:
         print(f"Error al guardar en la base de datos: {e}")
 
 
-def obtener_id_ruta_unicos(db_path, nombre_tabla):
-    """Obtiene valores únicos de idRuta de una tabla específica en la base de datos."""
+def guardar_sensores(df, db_path, conn=None):
+    """
+    Guarda datos de sensores en la tabla 'sensores', actualiza sus agregados (SENSOR_ROLLUPS) y la
+    cobertura diaria y, si hay un almacén columnar activo (ver sensor_store.set_sensor_store),
+    también los guarda en sus particiones por bus y día.
+    """
+    if monthly_shards_enabled():
+        # Con particiones mensuales las filas se reparten por mes (ver insertar_bloque_sensores)
+        guardar_sensores_por_bloques([df], db_path, conn)
+        return
+    guardar_en_base_de_datos(df, db_path, 'sensores', conn=conn)
+    propia = conn is None
+    if propia:
+        conn = sqlite3.connect(db_path)
+    try:
+        update_rollups(conn, df)
+        update_sensor_coverage(conn, df)
+        if propia:
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error al actualizar los agregados y la cobertura de sensores: {e}")
+    finally:
+        if propia:
+            conn.close()
+    almacen = get_sensor_store()
+    if almacen is not None:
+        almacen.append(df)
+        if propia:
+            # Las filas ya se confirmaron en SQLite
+            almacen.commit()
+
+
+def _filas_para_sql(df):
+    """
+    Tuplas de un DataFrame con los mismos valores que escribe to_sql: las fechas como el texto de
+    datetime.isoformat(' ') (sin fracción cuando los microsegundos son cero) y None en lugar de NaN/NaT.
+    Las fechas se formatean por columna y no valor por valor.
+    """
+    columnas = []
+    for nombre in df.columns:
+        serie = df[nombre]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            texto = serie.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            sin_fraccion = (serie.dt.microsecond == 0).to_numpy()
+            if sin_fraccion.any():
+                texto = texto.where(~sin_fraccion, texto.str[:-7])
+            valores = texto.to_numpy(dtype=object)
+        else:
+            valores = serie.to_numpy(dtype=object)
+        nulos = serie.isna().to_numpy()
+        if nulos.any():
+            valores[nulos] = None
+        columnas.append(valores)
+    return list(zip(*columnas))
+
+
+def insertar_bloque_sensores(conn, bloque):
+    """
+    Inserta un DataFrame de sensores en la tabla 'sensores' con executemany, sin confirmar la transacción,
+    lo suma a los agregados de SENSOR_ROLLUPS y a la cobertura diaria y lo copia al almacén columnar si
+    hay uno activo (pendiente hasta que el llamador confirme, ver sensor_store.commit_sensor_store). Si la
+    tabla no existe la crea to_sql con un bloque vacío, para que tenga los mismos tipos que con
+    `guardar_sensores`. Con particiones mensuales (ver shards.py) las filas van a la tabla 'sensores' de la
+    partición de su mes y las de meses cerrados se descartan.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensores'").fetchone() is None:
+        bloque.head(0).to_sql('sensores', conn, if_exists='append', index=False)
+    columnas = ', '.join(f'"{columna}"' for columna in bloque.columns)
+    sql = f"INSERT INTO sensores ({columnas}) VALUES ({', '.join('?' * len(bloque.columns))})"
+    particiones = get_shard_router(conn)
+    with instrumentation.stage("sensor_insert"):
+        if particiones is None:
+            conn.executemany(sql, _filas_para_sql(bloque))
+        else:
+            partes = []
+            for esquema, parte in particiones.route_frame(bloque):
+                conn.executemany(particiones.qualify(sql, "sensores", esquema), _filas_para_sql(parte))
+                partes.append(parte)
+            if sum(len(parte) for parte in partes) < len(bloque):
+                # Las filas de meses cerrados se descartaron: tampoco van a los agregados ni a la cobertura
+                bloque = pd.concat(partes) if partes else bloque.head(0)
+    instrumentation.count("filas.sensores", len(bloque))
+    with instrumentation.stage("rollups"):
+        update_rollups(conn, bloque)
+    with instrumentation.stage("cobertura"):
+        update_sensor_coverage(conn, bloque)
+    almacen = get_sensor_store()
+    if almacen is not None:
+        with instrumentation.stage("almacen_sensores"):
+            almacen.append(bloque)
+
+
+def guardar_sensores_por_bloques(bloques, db_path, conn=None):
+    """
+    Guarda en la tabla 'sensores' los DataFrames de `sensor_data_processor.sensor_por_bloques` a
+    medida que se leen, en una sola transacción (la de `conn` si se recibe; si no, una conexión
+    propia que se confirma al final). El contenido de la tabla es el mismo que con `guardar_sensores`.
+    Todo queda dentro de un SAVEPOINT: si la lectura o la escritura falla a mitad del archivo se
+    descartan también los bloques ya insertados, en SQLite y en el almacén columnar, y se devuelve None,
+    para que el llamador no lo registre en el manifiesto. Informa las filas por segundo y devuelve el
+    número de filas escritas.
+    """
+    propia = conn is None
+    if propia:
+        conn = sqlite3.connect(db_path)
+    filas = 0
+    inicio = time.perf_counter()
+    almacen = get_sensor_store()
+    marca = almacen.mark() if almacen is not None else None
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("SAVEPOINT sensores_bloques")
+    try:
+        for bloque in bloques:
+            insertar_bloque_sensores(conn, bloque)
+            filas += len(bloque)
+        conn.execute("RELEASE sensores_bloques")
+        if propia:
+            conn.commit()
+            commit_sensor_store()
+    except Exception as e:
+        conn.execute("ROLLBACK TO sensores_bloques")
+        conn.execute("RELEASE sensores_bloques")
+        if marca is not None:
+            almacen.rollback_to(marca)
+        print(f"Error al guardar los sensores; se descartan las {filas} filas ya insertadas: {e}")
+        return None
+    finally:
+        if propia:
+            release_shard_router(conn)
+            conn.close()
+    segundos = time.perf_counter() - inicio
+    if filas:
+        print(f"Sensores: {filas} filas en {segundos:.2f} s ({filas / (segundos or 1e-9):.0f} filas/s).")
+    return filas
+
+
+def obtener_id_ruta_unicos(db_path, nombre_tabla, con_nombres=False):
+    """
+    Obtiene valores únicos de idRuta de una tabla específica en la base de datos. Con con_nombres=True
+    devuelve tuplas (idRuta, codigoRuta, nombreRuta) resueltas con el catálogo de rutas (ver
+    route_catalog.route_names).
+    """
     try:
         conn = sqlite3.connect(db_path)
+        if con_nombres:
+            resultados = route_names(conn, nombre_tabla)
+            conn.close()
+            return resultados
         cursor = conn.cursor()
         # Consulta para obtener valores únicos de idRuta
         cursor.execute(f"SELECT DISTINCT idRuta FROM {nombre_tabla}")
@@ -0,0 +1,245 @@
+# schema.py
+
+import functools
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+
+from config import HEADERS_SPECIFIC, COMMON_HEADERS, vehiculos_headers, conductores_headers, versiones_trama_headers, \
+    foreign_keys, manifiesto_headers, cobertura_headers, cuarentena_headers, rutas_headers, paradas_headers, \
+    informe_headers, SENSOR_ROLLUPS, SCHEMA_STRICT
+from coverage import COVERAGE_TABLE, rebuild_coverage
+from database import exclude_headers_and_add_foreign_keys
+from events import EVENT_TABLE, event_types, event_headers, create_event_views, copy_event_table, \
+    default_event_storage, forget_event_layout
+from manifest import MANIFEST_TABLE
+from quarantine import QUARANTINE_TABLE
+from route_catalog import RUTAS_TABLE, PARADAS_TABLE
+from sensor_data_processor import NOMBRES_COLUMNAS
+from sensor_rollups import ROLLUP_HEADERS
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+# Primeras palabras de las entradas de encabezados que son restricciones de tabla y no columnas
+_CONSTRAINTS = ("PRIMARY KEY", "FOREIGN KEY", "UNIQUE", "CHECK")
+
+# Tipos declarados -> tipo de una tabla STRICT. Las fechas pueden ser texto ISO o milisegundos enteros
+# según TIMESTAMP_MODE, así que quedan como ANY
+_STRICT_TYPES = {"INT": "INTEGER", "INTEGER": "INTEGER", "BOOLEAN": "INTEGER", "REAL": "REAL", "FLOAT": "REAL",
+                 "TEXT": "TEXT", "BLOB": "BLOB", "DATETIME": "ANY", "TIMESTAMP": "ANY"}
+
+_strict = SCHEMA_STRICT
+
+
+def set_strict_tables(activo):
+    """Define si las tablas que cree ensure_schema serán STRICT (por defecto SCHEMA_STRICT de config)."""
+    global _strict
+    _strict = activo
+
+
+@functools.lru_cache(maxsize=None)
+def schema_catalog(consolidada=False, particion=False):
+    """
+    Todas las tablas de la base de datos, como tupla de (tabla, encabezados) en orden de creación.
+    Los encabezados son pares (columna, tipo) o (restricción, definición), como en config. Con
+    `consolidada` los eventos y alarmas se guardan en la tabla Eventos en lugar de una tabla por tipo.
+    Con `particion` solo las tablas de una partición mensual (ver shards.py): tramas y sensores, sin
+    claves foráneas porque las dimensiones quedan en la base principal.
+    """
+    comunes = exclude_headers_and_add_foreign_keys(COMMON_HEADERS, foreign_keys, vehiculos_headers,
+                                                   conductores_headers, versiones_trama_headers)
+    catalogo = [
+        ("Vehiculos", vehiculos_headers),
+        ("Conductores", conductores_headers),
+        ("VersionesTrama", versiones_trama_headers),
+    ]
+    catalogo += [(tipo, headers + comunes) for tipo, headers in HEADERS_SPECIFIC.items()
+                 if not (consolidada and tipo in event_types())]
+    if consolidada:
+        catalogo.append((EVENT_TABLE, event_headers()))
+    # 'sensores' tiene los mismos tipos que le daba pandas con to_sql
+    catalogo.append(("sensores", [("time", "TIMESTAMP")] + [(c, "REAL") for c in NOMBRES_COLUMNAS[1:]]
+                     + [("bus", "TEXT")]))
+    catalogo += [(tabla, ROLLUP_HEADERS + [("PRIMARY KEY", "(bus, inicio)")]) for tabla, _ in SENSOR_ROLLUPS]
+    catalogo += [
+        (MANIFEST_TABLE, manifiesto_headers),
+        (COVERAGE_TABLE, cobertura_headers),
+        ("InformeCobertura", informe_headers),  # utils/genetate_resume.INFORME_TABLE
+        (QUARANTINE_TABLE, cuarentena_headers),
+        (RUTAS_TABLE, rutas_headers),
+        (PARADAS_TABLE, paradas_headers),
+    ]
+    if particion:
+        tramas = set(HEADERS_SPECIFIC) | {EVENT_TABLE, "sensores"}
+        catalogo = [(tabla, [header for header in headers if not header[0].startswith("FOREIGN KEY")])
+                    for tabla, headers in catalogo if tabla in tramas]
+    return tuple((tabla, tuple(tuple(header) for header in headers)) for tabla, headers in catalogo)
+
+
+@functools.lru_cache(maxsize=None)
+def schema_fingerprint(consolidada=False, particion=False):
+    """Huella del catálogo: cambia cuando se agrega una tabla o una columna en config."""
+    catalogo = schema_catalog(consolidada, particion)
+    if consolidada:
+        # Los campos propios de los eventos no son columnas, pero sí definen sus vistas
+        catalogo += tuple((tipo, tuple(tuple(header) for header in HEADERS_SPECIFIC[tipo])) for tipo in event_types())
+    return hashlib.sha1(json.dumps(catalogo, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _is_constraint(header):
+    return header.upper().startswith(_CONSTRAINTS)
+
+
+def _column_type(dtype, strict):
+    if not strict:
+        return dtype
+    palabras = dtype.split(maxsplit=1)
+    return " ".join([_STRICT_TYPES.get(palabras[0].upper(), "ANY")] + palabras[1:])
+
+
+def _create_sql(tabla, headers, strict):
+    columnas = ', '.join(f"{header} {dtype}" if _is_constraint(header) else f'"{header}" {_column_type(dtype, strict)}'
+                         for header, dtype in headers)
+    return f'CREATE TABLE IF NOT EXISTS "{tabla}" ({columnas}){" STRICT" if strict else ""}'
+
+
+def current_version(conn):
+    """(versión, huella) registradas en la base, o (0, None) si aún no tiene catálogo."""
+    try:
+        fila = conn.execute(f"SELECT version, huella FROM {SCHEMA_VERSION_TABLE} "
+                            f"ORDER BY version DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0, None
+    return fila or (0, None)
+
+
+def _strict_enabled(strict):
+    strict = _strict if strict is None else strict
+    if strict and sqlite3.sqlite_version_info < (3, 37, 0):
+        print(f"SQLite {sqlite3.sqlite_version} no admite tablas STRICT; se crean sin STRICT.")
+        return False
+    return strict
+
+
+def _tables(conn):
+    return {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def migrate_schema(conn, strict=None, consolidada=False, particion=False):
+    """
+    Lleva la base al catálogo con cambios aditivos: crea las tablas que faltan (por ejemplo, un tipo de
+    trama nuevo en HEADERS_SPECIFIC) y agrega con ALTER TABLE las columnas nuevas. Las columnas que
+    sobran o cambiaron de tipo no se tocan. Con `consolidada` además recrea las vistas de los eventos.
+    Devuelve la lista de cambios aplicados.
+    """
+    strict = _strict_enabled(strict)
+    existentes = _tables(conn)
+    cambios = []
+    for tabla, headers in schema_catalog(consolidada, particion):
+        if tabla not in existentes:
+            conn.execute(_create_sql(tabla, headers, strict))
+            cambios.append(f"+{tabla}")
+            continue
+        # SQLite compara los nombres de columna sin distinguir mayúsculas
+        columnas = {fila[1].lower() for fila in conn.execute(f'PRAGMA table_info("{tabla}")')}
+        tabla_strict = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (tabla,)).fetchone()[0] \
+            .rstrip().upper().endswith("STRICT")
+        for header, dtype in headers:
+            if _is_constraint(header) or header.lower() in columnas:
+                continue
+            if any(palabra in dtype.upper() for palabra in ("PRIMARY KEY", "UNIQUE")):
+                print(f"La columna {tabla}.{header} ({dtype}) no se puede agregar con ALTER TABLE; se omite.")
+                continue
+            conn.execute(f'ALTER TABLE "{tabla}" ADD COLUMN "{header}" {_column_type(dtype, tabla_strict)}')
+            cambios.append(f"{tabla}.{header}")
+    if consolidada:
+        create_event_views(conn)
+    return cambios
+
+
+def _event_layout(tablas):
+    """
+    Formato de eventos de una base: el que ya tiene si existe Eventos o alguna tabla por tipo, o el
+    configurado (events.set_event_storage) si es nueva. Devuelve True para el formato consolidado.
+    """
+    if EVENT_TABLE in tablas:
+        return True
+    if tablas.intersection(event_types()):
+        return False
+    return default_event_storage() == "consolidada"
+
+
+def _begin_version(conn):
+    propia = not conn.in_transaction
+    if propia:
+        conn.execute("BEGIN")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (version INTEGER PRIMARY KEY, huella TEXT, "
+                 f"fecha TEXT, cambios TEXT)")
+    return propia
+
+
+def _record_version(conn, version, consolidada, cambios, propia, particion=False):
+    conn.execute(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, huella, fecha, cambios) VALUES (?, ?, ?, ?)",
+                 (version + 1, schema_fingerprint(consolidada, particion), datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  ', '.join(cambios)))
+    if propia:
+        conn.commit()
+    forget_event_layout(conn)
+    if particion:
+        return
+    print(f"Esquema en la versión {version + 1}: {len(cambios)} cambios"
+          + (f" ({', '.join(cambios[:10])}{', ...' if len(cambios) > 10 else ''})." if cambios else "."))
+
+
+def ensure_schema(conn, strict=None, particion=False, consolidada=None):
+    """
+    Verifica con una sola consulta que la base esté en la versión del catálogo. Si no lo está (base nueva
+    o catálogo ampliado en config), aplica migrate_schema en una transacción y registra la nueva versión
+    en schema_version. El formato de eventos de una base existente no cambia (ver consolidate_events);
+    el de una base nueva es `consolidada` o, si es None, el configurado. Si la migración crea la tabla de
+    cobertura diaria en una base con datos, la calcula con coverage.rebuild_coverage. Con `particion` se
+    usa el catálogo de una partición mensual y no se informa en consola. Devuelve la lista de cambios
+    (vacía si ya estaba al día).
+    """
+    version, huella = current_version(conn)
+    if huella in (schema_fingerprint(False, particion), schema_fingerprint(True, particion)):
+        return []
+    propia = _begin_version(conn)
+    tablas = _tables(conn)
+    if consolidada is None or EVENT_TABLE in tablas or tablas.intersection(event_types()):
+        consolidada = _event_layout(tablas)
+    cambios = migrate_schema(conn, strict, consolidada, particion)
+    if f"+{COVERAGE_TABLE}" in cambios and tablas - {SCHEMA_VERSION_TABLE}:
+        # Base con datos de antes de la cobertura diaria: se calcula una vez con lo que ya tiene, en la
+        # misma transacción que la migración (las bases con particiones mensuales ya nacen con la tabla)
+        rebuild_coverage(conn)
+    _record_version(conn, version, consolidada, cambios, propia, particion)
+    return cambios
+
+
+def consolidate_events(conn, strict=None):
+    """
+    Migración única al formato consolidado de eventos: crea Eventos, copia las filas de las tablas por tipo
+    de eventos y alarmas, elimina esas tablas y crea en su lugar las vistas de compatibilidad, en una sola
+    transacción. Solo cambia el archivo de `conn`: las particiones mensuales (shards.py) conservan su formato.
+    Devuelve el número de filas copiadas.
+    """
+    tablas = _tables(conn)
+    if EVENT_TABLE in tablas and not tablas.intersection(event_types()):
+        print("Los eventos ya están consolidados.")
+        return 0
+    version, _ = current_version(conn)
+    propia = _begin_version(conn)
+    conn.execute(_create_sql(EVENT_TABLE, event_headers(), _strict_enabled(strict)))
+    copiadas = 0
+    cambios = [] if EVENT_TABLE in tablas else [f"+{EVENT_TABLE}"]
+    for tipo in event_types():
+        if tipo in tablas:
+            copiadas += copy_event_table(conn, tipo)
+            conn.execute(f"DROP TABLE {tipo}")
+            cambios.append(f"-{tipo}")
+    cambios += migrate_schema(conn, strict, True)
+    _record_version(conn, version, True, cambios, propia)
+    print(f"Eventos consolidados: {copiadas} filas copiadas a {EVENT_TABLE}.")
+    return copiadas
@@ -1,47 +1,112 @@
-﻿import os
+﻿import io
+import os
 
 import pandas as pd
 
+import instrumentation
+from config import SENSOR_CHUNK_ROWS
 
-def importar_datos(ruta_archivo, nombres_columnas, tipos_columnas, numero_bus):
+# Nombres de las columnas y tipos correspondientes
+NOMBRES_COLUMNAS = ["time", "ax", "ay", "az", "mx", "my", "mz", "gx", "gy", "gz", "orx", "oy", "or", "lat", "lon"]
+TIPOS_COLUMNAS = ["datetime", "float64", "float64", "float64", "float64", "float64", "float64",
+                  "float64", "float64", "float64", "float64", "float64", "float64", "float64", "float64"]
+
+
+class _RangoBytes(io.RawIOBase):
+    """Vista de solo lectura de los bytes [offset, fin) de un archivo abierto, sin cargarlos en memoria."""
+
+    def __init__(self, file, offset, fin):
+        self.file = file
+        self.file.seek(offset)
+        self.restantes = None if fin is None else fin - offset
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        limite = len(buffer) if self.restantes is None else min(len(buffer), self.restantes)
+        leidos = self.file.readinto(memoryview(buffer)[:limite])
+        if self.restantes is not None:
+            self.restantes -= leidos
+        return leidos
+
+
+def _leer_csv(origen, nombres_columnas, tipos_columnas, **kwargs):
+    # Leer el archivo sin especificar el tipo para la columna de tiempo
+    return pd.read_csv(
+        origen,
+        header=None,  # No hay encabezado en los archivos
+        names=nombres_columnas,  # Nombres de las columnas
+        dtype={col: dtype for col, dtype in zip(nombres_columnas, tipos_columnas) if dtype != 'datetime'},
+        **kwargs
+    )
+
+
+def _completar_datos(df, numero_bus):
+    # Convertir la columna de tiempo a datetime
+    df['time'] = pd.to_datetime(df['time'], format='%Y-%m-%d %H:%M:%S.%f')
+
+    # Agregar la columna 'bus' con el número de bus
+    df['bus'] = numero_bus
+    return df
+
+
+def importar_datos(ruta_archivo, nombres_columnas, tipos_columnas, numero_bus, offset=0, fin=None):
     """
     Importa datos desde un archivo de texto.
+    Si se indican `offset` y/o `fin` solo se leen los bytes de ese rango (ingesta incremental).
     """
     try:
-        # Leer el archivo sin especificar el tipo para la columna de tiempo
-        df = pd.read_csv(
-            ruta_archivo,
-            header=None,  # No hay encabezado en los archivos
-            names=nombres_columnas,  # Nombres de las columnas
-            dtype={col: dtype for col, dtype in zip(nombres_columnas, tipos_columnas) if dtype != 'datetime'},
-        )
+        origen = ruta_archivo
+        if offset or fin is not None:
+            with open(ruta_archivo, 'rb') as file:
+                file.seek(offset)
+                origen = io.BytesIO(file.read() if fin is None else file.read(fin - offset))
 
-        # Convertir la columna de tiempo a datetime
-        df['time'] = pd.to_datetime(df['time'], format='%Y-%m-%d %H:%M:%S.%f')
+        return _completar_datos(_leer_csv(origen, nombres_columnas, tipos_columnas), numero_bus)
+    except Exception as e:
+        print(f"Error al procesar el archivo {os.path.basename(ruta_archivo)}: {e}")
+        return None
 
-        # Agregar la columna 'bus' con el número de bus
-        df['bus'] = numero_bus
 
-        return df
+def importar_datos_por_bloques(ruta_archivo, nombres_columnas, tipos_columnas, numero_bus, offset=0, fin=None,
+                               filas_por_bloque=SENSOR_CHUNK_ROWS):
+    """
+    Igual que `importar_datos`, pero genera DataFrames de hasta `filas_por_bloque` filas a medida que
+    lee el archivo, de modo que la memoria no depende de su tamaño. El rango [offset, fin) se lee
+    directamente del archivo, sin copiarlo. Un error de lectura se informa y se propaga, porque los
+    bloques anteriores ya se entregaron: quien los guarda debe descartarlos (ver
+    save_to_database.guardar_sensores_por_bloques).
+    """
+    try:
+        with open(ruta_archivo, 'rb') as file:
+            origen = io.BufferedReader(_RangoBytes(file, offset, fin))
+            with _leer_csv(origen, nombres_columnas, tipos_columnas, chunksize=filas_por_bloque) as lector:
+                bloques = iter(lector)
+                while True:
+                    with instrumentation.stage("sensor_csv"):
+                        bloque = next(bloques, None)
+                        if bloque is None:
+                            break
+                        bloque = _completar_datos(bloque, numero_bus)
+                    yield bloque
     except Exception as e:
         print(f"Error al procesar el archivo {os.path.basename(ruta_archivo)}: {e}")
-        return None
+        raise
 
 
-def sensor(input_path, numero_bus=None):
+def sensor(input_path, numero_bus=None, offset=0, fin=None):
     """
     Procesa un archivo de texto o todos los archivos de texto en una carpeta y los concatena en un solo DataFrame.
+    Para un archivo individual, `offset` y `fin` limitan la lectura a ese rango de bytes.
     """
     datos = []  # Lista para almacenar los DataFrames
-
-    # Nombres de las columnas y tipos correspondientes
-    nombres_columnas = ["time", "ax", "ay", "az", "mx", "my", "mz", "gx", "gy", "gz", "orx", "oy", "or", "lat", "lon"]
-    tipos_columnas = ["datetime", "float64", "float64", "float64", "float64", "float64", "float64",
-                      "float64", "float64", "float64", "float64", "float64", "float64", "float64", "float64"]
+    nombres_columnas = NOMBRES_COLUMNAS
+    tipos_columnas = TIPOS_COLUMNAS
 
     # Si es un archivo individual
     if os.path.isfile(input_path) and input_path.endswith('.txt'):
-        df = importar_datos(input_path, nombres_columnas, tipos_columnas, numero_bus)
+        df = importar_datos(input_path, nombres_columnas, tipos_columnas, numero_bus, offset, fin)
         if df is not None:
             datos.append(df)
 
@@ -63,6 +128,24 @@ def sensor(input_path, numero_bus=None):
         return pd.DataFrame()  # Retornar un DataFrame vacío si no hay datos
 
 
+def sensor_por_bloques(input_path, numero_bus=None, offset=0, fin=None, filas_por_bloque=SENSOR_CHUNK_ROWS):
+    """
+    Versión en streaming de `sensor`: genera bloques de hasta `filas_por_bloque` filas de un archivo
+    de texto o de todos los de una carpeta, sin concatenarlos. Para un archivo individual, `offset` y
+    `fin` limitan la lectura a ese rango de bytes.
+    """
+    if os.path.isfile(input_path) and input_path.endswith('.txt'):
+        rutas = [(input_path, offset, fin)]
+    elif os.path.isdir(input_path):
+        rutas = [(os.path.join(input_path, f), 0, None) for f in os.listdir(input_path) if f.endswith('.txt')]
+    else:
+        rutas = []
+
+    for ruta_archivo, inicio, final in rutas:
+        yield from importar_datos_por_bloques(ruta_archivo, NOMBRES_COLUMNAS, TIPOS_COLUMNAS, numero_bus,
+                                              inicio, final, filas_por_bloque)
+
+
 if __name__ == "__main__":
     # Ejemplo de uso: Procesar un archivo específico o carpeta con un número de bus proporcionado
     ruta_de_entrada = "ruta_de_entrada"
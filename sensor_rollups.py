@@ -0,0 +1,139 @@
+# sensor_rollups.py
+
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+from config import SENSOR_ROLLUPS
+
+# Variables agregadas: las tres aceleraciones y la magnitud de la aceleración
+VARIABLES = ["ax", "ay", "az", "mag"]
+
+# Columnas de cada tabla de agregados, en el orden de la sentencia INSERT
+ROLLUP_HEADERS = [
+    ("bus", "TEXT"),
+    ("inicio", "TEXT"),              # Inicio del intervalo, 'YYYY-mm-dd HH:MM:SS'
+    ("n", "INTEGER"),                # Muestras en el intervalo
+] + [
+    (f"{variable}_{medida}", dtype) for variable in VARIABLES
+    for medida, dtype in [("n", "INTEGER"), ("min", "REAL"), ("max", "REAL"), ("suma", "REAL")]
+] + [
+    ("t_primero", "TEXT"),           # Instante de la primera y la última muestra del intervalo
+    ("lat_primero", "REAL"),
+    ("lon_primero", "REAL"),
+    ("t_ultimo", "TEXT"),
+    ("lat_ultimo", "REAL"),
+    ("lon_ultimo", "REAL"),
+]
+
+
+def _merge_expression(column):
+    """
+    Cómo se combina `column` de una fila existente con la de una fila nueva (excluded). En un UPDATE
+    todas las expresiones ven los valores anteriores de la fila, así que el orden no importa.
+    """
+    nuevo = f"excluded.{column}"
+    if column == "n" or column.endswith("_n"):
+        return f"{column} + {nuevo}"
+    if column.endswith("_suma"):
+        return f"coalesce({column}, 0) + coalesce({nuevo}, 0)"
+    if column.endswith("_min") or column.endswith("_max") or column in ("t_primero", "t_ultimo"):
+        funcion = "min" if column.endswith("_min") or column == "t_primero" else "max"
+        return f"{funcion}(coalesce({column}, {nuevo}), coalesce({nuevo}, {column}))"
+    if column.endswith("_primero"):
+        return f"CASE WHEN excluded.t_primero < t_primero THEN {nuevo} ELSE {column} END"
+    return f"CASE WHEN excluded.t_ultimo > t_ultimo THEN {nuevo} ELSE {column} END"
+
+
+def create_rollup_tables(conn):
+    """Crea las tablas de SENSOR_ROLLUPS que falten, con clave primaria (bus, inicio)."""
+    columns = ', '.join(f"{header} {dtype}" for header, dtype in ROLLUP_HEADERS)
+    for tabla, _ in SENSOR_ROLLUPS:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {tabla} ({columns}, PRIMARY KEY (bus, inicio))")
+
+
+def _upsert_sql(tabla):
+    columnas = [header for header, _ in ROLLUP_HEADERS]
+    asignaciones = ', '.join(f"{c} = {_merge_expression(c)}" for c in columnas[2:])
+    return (f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) "
+            f"ON CONFLICT (bus, inicio) DO UPDATE SET {asignaciones}")
+
+
+def compute_rollup(df, frecuencia):
+    """
+    Agrega un DataFrame de `sensor_data_processor` por bus e intervalo de `frecuencia` (alias de pandas,
+    por ejemplo '1s' o '1min'). Todo el cálculo es vectorizado; devuelve un DataFrame con las
+    columnas de ROLLUP_HEADERS.
+    """
+    datos = df[["time", "bus", "ax", "ay", "az", "lat", "lon"]].copy()
+    datos["bus"] = datos["bus"].astype(str)
+    datos["mag"] = np.sqrt(datos["ax"] ** 2 + datos["ay"] ** 2 + datos["az"] ** 2)
+    datos["inicio"] = datos["time"].dt.floor(frecuencia)
+    datos = datos.reset_index(drop=True)
+
+    grupos = datos.groupby(["bus", "inicio"], sort=False)
+    agregados = grupos.agg(
+        n=("time", "size"),
+        **{f"{v}_{medida}": (v, funcion) for v in VARIABLES
+           for medida, funcion in [("n", "count"), ("min", "min"), ("max", "max"), ("suma", "sum")]}
+    )
+    primeros = datos.loc[grupos["time"].idxmin().to_numpy(), ["time", "lat", "lon"]].to_numpy()
+    ultimos = datos.loc[grupos["time"].idxmax().to_numpy(), ["time", "lat", "lon"]].to_numpy()
+    agregados = agregados.reset_index()
+
+    agregados["inicio"] = agregados["inicio"].dt.strftime('%Y-%m-%d %H:%M:%S')
+    for prefijo, valores in [("primero", primeros), ("ultimo", ultimos)]:
+        agregados[f"t_{prefijo}"] = pd.to_datetime(valores[:, 0]).strftime('%Y-%m-%d %H:%M:%S.%f')
+        agregados[f"lat_{prefijo}"] = valores[:, 1].astype(float)
+        agregados[f"lon_{prefijo}"] = valores[:, 2].astype(float)
+    return agregados[[header for header, _ in ROLLUP_HEADERS]]
+
+
+def update_rollups(conn, df):
+    """
+    Suma un DataFrame de sensores a todas las tablas de SENSOR_ROLLUPS. Los intervalos que ya existen
+    se combinan con UPSERT (conteos y sumas se suman, mínimos y máximos se comparan y los valores
+    primero/último se toman de la muestra más temprana/tardía), así que los archivos pueden llegar en
+    cualquier orden y partidos en bloques. No confirma la transacción.
+    """
+    if df is None or df.empty or not SENSOR_ROLLUPS:
+        return
+    create_rollup_tables(conn)
+    for tabla, frecuencia in SENSOR_ROLLUPS:
+        agregados = compute_rollup(df, frecuencia)
+        filas = agregados.astype(object).where(agregados.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(_upsert_sql(tabla), filas)
+
+
+def consultar_rollup(conn, tabla, bus, desde, hasta):
+    """
+    Agregados de un bus con inicio en [desde, hasta] (texto 'YYYY-mm-dd HH:MM:SS'), con las medias
+    ya calculadas (suma / muestras válidas).
+    """
+    medias = ', '.join(f"{v}_suma / nullif({v}_n, 0) AS {v}_media" for v in VARIABLES)
+    sql = f"SELECT *, {medias} FROM {tabla} WHERE bus = ? AND inicio BETWEEN ? AND ? ORDER BY inicio"
+    return pd.read_sql_query(sql, conn, params=(str(bus), desde, hasta))
+
+
+def rebuild_rollups(conn, filas_por_bloque=500000):
+    """Vacía y recalcula las tablas de agregados a partir de toda la tabla 'sensores'."""
+    create_rollup_tables(conn)
+    for tabla, _ in SENSOR_ROLLUPS:
+        conn.execute(f"DELETE FROM {tabla}")
+    filas = 0
+    for bloque in pd.read_sql_query("SELECT time, bus, ax, ay, az, lat, lon FROM sensores", conn,
+                                    chunksize=filas_por_bloque):
+        bloque["time"] = pd.to_datetime(bloque["time"], format='ISO8601')
+        update_rollups(conn, bloque)
+        filas += len(bloque)
+    conn.commit()
+    print(f"Agregados recalculados a partir de {filas} muestras.")
+
+
+if __name__ == "__main__":
+    # Uso: python sensor_rollups.py ruta_base_de_datos.db
+    conn = sqlite3.connect(sys.argv[1])
+    rebuild_rollups(conn)
+    conn.close()
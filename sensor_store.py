@@ -0,0 +1,187 @@
+# sensor_store.py
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import SENSOR_STORE_PATH, SENSOR_STORE_COLUMNS
+
+# Índice de particiones dentro de la raíz del almacén
+META_FILE = "meta.json"
+
+
+class SensorStore:
+    """
+    Almacén columnar de los datos de sensores (.txt), particionado por bus y día.
+
+    Cada partición es una carpeta <raíz>/<bus>/<YYYY-MM-DD> con un archivo binario contiguo por columna
+    (<columna>.bin, con el dtype de SENSOR_STORE_COLUMNS). meta.json, en la raíz, guarda por partición
+    el número de filas, el primer y el último instante (ns desde 1970) y si la columna time está
+    ordenada. Las lecturas usan np.memmap, así que una partición se abre sin copiarla a memoria y un
+    rango de tiempo se resuelve con búsqueda binaria sobre time.
+
+    Se escribe desde un solo proceso (el escritor de la ingesta); el número de filas de meta.json es
+    la referencia, de modo que los bytes que un corte haya dejado al final de una columna se descartan
+    en la siguiente escritura. Las filas agregadas quedan pendientes, como en una transacción: `commit`
+    guarda meta.json y se llama después de confirmar la transacción de SQLite con las mismas filas;
+    `rollback` y `rollback_to` vuelven a los tamaños registrados. Si el proceso se corta antes de
+    confirmar, el almacén queda como la base y el archivo se reingiere sin duplicar sus muestras.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.meta_path = os.path.join(root, META_FILE)
+        self.meta = {"columnas": dict(SENSOR_STORE_COLUMNS), "particiones": {}}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as file:
+                self.meta = json.load(file)
+
+    def _partition_dir(self, bus, day):
+        return os.path.join(self.root, str(bus), day)
+
+    def _save_meta(self):
+        temporal = self.meta_path + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as file:
+            json.dump(self.meta, file, indent=1)
+        os.replace(temporal, self.meta_path)
+
+    def append(self, df):
+        """
+        Agrega un DataFrame de `sensor_data_processor.sensor` (columna time como datetime y columna bus)
+        a las particiones que correspondan, pendiente hasta `commit`. Devuelve el número de filas escritas.
+        """
+        if df is None or df.empty:
+            return 0
+        columnas = self.meta["columnas"]
+        dias = df["time"].dt.strftime("%Y-%m-%d")
+        with self.lock:
+            for (bus, day), grupo in df.groupby([df["bus"].astype(str), dias], sort=False):
+                tiempos = grupo["time"].to_numpy(dtype="datetime64[ns]").view("int64")
+                clave = f"{bus}/{day}"
+                info = self.meta["particiones"].get(clave, {"filas": 0, "desde": None, "hasta": None, "ordenado": True})
+                carpeta = self._partition_dir(bus, day)
+                os.makedirs(carpeta, exist_ok=True)
+                for columna, dtype in columnas.items():
+                    datos = tiempos if columna == "time" else grupo[columna].to_numpy(dtype=dtype)
+                    with open(os.path.join(carpeta, f"{columna}.bin"), "ab") as file:
+                        file.truncate(info["filas"] * np.dtype(dtype).itemsize)
+                        file.write(np.ascontiguousarray(datos, dtype=dtype).tobytes())
+
+                ordenado = info["ordenado"] and bool(np.all(tiempos[1:] >= tiempos[:-1]))
+                if info["hasta"] is not None and tiempos[0] < info["hasta"]:
+                    ordenado = False
+                info["ordenado"] = ordenado
+                info["desde"] = int(tiempos.min()) if info["desde"] is None else min(info["desde"], int(tiempos.min()))
+                info["hasta"] = int(tiempos.max()) if info["hasta"] is None else max(info["hasta"], int(tiempos.max()))
+                info["filas"] += len(grupo)
+                self.meta["particiones"][clave] = info
+        return len(df)
+
+    def mark(self):
+        """Tamaños actuales de las particiones, para volver a ellos con `rollback_to` (como un SAVEPOINT)."""
+        with self.lock:
+            return {clave: dict(info) for clave, info in self.meta["particiones"].items()}
+
+    def rollback_to(self, marca):
+        """Descarta lo agregado después de `mark`; los bytes sobrantes se truncan en la siguiente escritura."""
+        with self.lock:
+            self.meta["particiones"] = marca
+
+    def commit(self):
+        """Guarda en meta.json las filas agregadas desde el último commit."""
+        with self.lock:
+            self._save_meta()
+
+    def rollback(self):
+        """Descarta lo agregado desde el último commit, volviendo a los tamaños de meta.json."""
+        with self.lock:
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, encoding="utf-8") as file:
+                    self.meta = json.load(file)
+            else:
+                self.meta = {"columnas": dict(SENSOR_STORE_COLUMNS), "particiones": {}}
+
+    def partitions(self, bus=None):
+        """Lista de (bus, día, info) de las particiones, opcionalmente de un solo bus."""
+        resultado = []
+        for clave, info in sorted(self.meta["particiones"].items()):
+            bus_particion, day = clave.split("/")
+            if bus is None or bus_particion == str(bus):
+                resultado.append((bus_particion, day, info))
+        return resultado
+
+    def read_partition(self, bus, day, columns=None):
+        """
+        Devuelve {columna: np.memmap} de una partición, sin copiar los datos. La columna time se
+        entrega como datetime64[ns].
+        """
+        info = self.meta["particiones"][f"{bus}/{day}"]
+        columnas = self.meta["columnas"]
+        arreglos = {}
+        for columna in columns or list(columnas):
+            arreglo = np.memmap(os.path.join(self._partition_dir(bus, day), f"{columna}.bin"),
+                                dtype=columnas[columna], mode="r", shape=(info["filas"],))
+            arreglos[columna] = arreglo.view("datetime64[ns]") if columna == "time" else arreglo
+        return arreglos
+
+    def read_range(self, bus, start, end, columns=None):
+        """
+        DataFrame con las muestras de un bus en [start, end], leídas de las particiones que se solapan
+        con el rango. En particiones ordenadas el corte es una búsqueda binaria sobre time.
+        """
+        desde = pd.Timestamp(start).value
+        hasta = pd.Timestamp(end).value
+        columnas = ["time"] + [c for c in (columns or self.meta["columnas"]) if c != "time"]
+        partes = []
+        for bus_particion, day, info in self.partitions(bus):
+            if info["hasta"] < desde or info["desde"] > hasta:
+                continue
+            arreglos = self.read_partition(bus_particion, day, columnas)
+            tiempos = arreglos["time"].view("int64")
+            if info["ordenado"]:
+                corte = slice(np.searchsorted(tiempos, desde, "left"), np.searchsorted(tiempos, hasta, "right"))
+            else:
+                corte = (tiempos >= desde) & (tiempos <= hasta)
+            partes.append(pd.DataFrame({columna: arreglo[corte] for columna, arreglo in arreglos.items()}, copy=False))
+        if not partes:
+            return pd.DataFrame({columna: np.empty(0, dtype="datetime64[ns]" if columna == "time"
+                                                   else self.meta["columnas"][columna]) for columna in columnas})
+        return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+_stores = {}
+_store_path = SENSOR_STORE_PATH
+
+
+def set_sensor_store(path):
+    """Activa (o con None desactiva) la copia de los datos de sensores en el almacén columnar."""
+    global _store_path
+    _store_path = path
+
+
+def get_sensor_store():
+    """Devuelve el SensorStore activo, o None si no se configuró ninguna ruta."""
+    if not _store_path:
+        return None
+    if _store_path not in _stores:
+        _stores[_store_path] = SensorStore(_store_path)
+    return _stores[_store_path]
+
+
+def commit_sensor_store():
+    """SensorStore.commit del almacén activo, si hay uno (después de confirmar la transacción de SQLite)."""
+    almacen = get_sensor_store()
+    if almacen is not None:
+        almacen.commit()
+
+
+def rollback_sensor_store():
+    """SensorStore.rollback del almacén activo, si hay uno (al descartar la transacción de SQLite)."""
+    almacen = get_sensor_store()
+    if almacen is not None:
+        almacen.rollback()
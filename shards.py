@@ -0,0 +1,350 @@
+# shards.py
+
+import os
+import re
+import sqlite3
+import stat
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import SHARD_BY_MONTH, SHARD_MAX_ATTACHED
+from database import create_indexes
+from events import uses_event_table
+from schema import ensure_schema
+
+# Archivo de una partición dentro de la carpeta de particiones: 'YYYY-MM.db'
+_SHARD_FILE = re.compile(r"^(\d{4}-\d{2})\.db$")
+
+_activo = SHARD_BY_MONTH
+
+# Enrutadores de escritura por conexión: id(conn) -> (conn, ShardRouter). Las conexiones de sqlite3 no
+# admiten referencias débiles, así que se guarda la conexión para comprobar que el id no se reutilizó
+_routers = {}
+
+
+def set_monthly_shards(activo):
+    """Activa o desactiva la escritura en particiones mensuales (por defecto SHARD_BY_MONTH de config)."""
+    global _activo
+    _activo = activo
+
+
+def monthly_shards_enabled():
+    return _activo
+
+
+def shard_dir(db_path):
+    """Carpeta de las particiones de una base: <db_path sin extensión>_meses."""
+    return os.path.splitext(os.path.abspath(db_path))[0] + "_meses"
+
+
+def shard_path(db_path, mes):
+    return os.path.join(shard_dir(db_path), f"{mes}.db")
+
+
+def schema_name(mes):
+    """Nombre con el que se adjunta la partición de `mes` ('2024-05' -> m_2024_05)."""
+    return "m_" + mes.replace("-", "_")
+
+
+def list_shards(db_path):
+    """Particiones existentes de una base, como diccionario ordenado mes -> ruta."""
+    carpeta = shard_dir(db_path)
+    if not os.path.isdir(carpeta):
+        return {}
+    meses = {}
+    for nombre in sorted(os.listdir(carpeta)):
+        coincidencia = _SHARD_FILE.match(nombre)
+        if coincidencia:
+            meses[coincidencia.group(1)] = os.path.join(carpeta, nombre)
+    return meses
+
+
+def month_of(valor):
+    """
+    Mes 'YYYY-MM' de una fecha guardada (texto ISO o milisegundos según TIMESTAMP_MODE), de un datetime o
+    de un límite de consulta en texto. None si no se puede determinar.
+    """
+    if isinstance(valor, str):
+        return valor[:7] if len(valor) >= 7 and valor[4] == '-' else None
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m')
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        # TIMESTAMP_MODE = "epoch_ms" guarda la hora local como si fuera UTC
+        return datetime.fromtimestamp(valor / 1000, timezone.utc).strftime('%Y-%m')
+    return None
+
+
+def is_sealed(ruta):
+    """Indica si una partición está cerrada (archivo sin permiso de escritura, ver seal_shards)."""
+    # Se miran los bits del archivo y no os.access, que para root siempre permite escribir
+    return os.path.exists(ruta) and not os.stat(ruta).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def prepare_shard(ruta, consolidada):
+    """Crea (o lleva al catálogo actual) el archivo de una partición con sus tablas e índices."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    conn = sqlite3.connect(ruta)
+    try:
+        if ensure_schema(conn, particion=True, consolidada=consolidada):
+            create_indexes(conn)
+    finally:
+        conn.close()
+
+
+class ShardLimitError(RuntimeError):
+    """Hace falta adjuntar otra partición y no se puede soltar ninguna sin confirmar la transacción abierta."""
+
+
+class ShardRouter:
+    """
+    Reparte las filas de tramas y sensores de una conexión de escritura entre las particiones mensuales.
+
+    Las particiones se adjuntan (ATTACH) a la conexión la primera vez que llega una fila de su mes, así
+    que sus inserciones forman parte de la misma transacción que las de la base principal. Se mantienen
+    como mucho `max_adjuntas` a la vez. SQLite no permite DETACH con una transacción abierta y el enrutador
+    nunca confirma por su cuenta (rompería la atomicidad de cada archivo con el manifiesto): si hace falta
+    otra partición con el máximo adjunto dentro de una transacción se lanza ShardLimitError. Quien lleva
+    la transacción suelta las particiones en sus puntos de confirmación cuando `crowded()` lo indica
+    (bulk_load.SesionCarga, follow.py). Las filas sin fecha van a la base principal; las de meses cuyo
+    archivo es de solo lectura (ver seal_shards) se descartan y se cuentan en `rechazadas`, porque
+    guardarlas en la base principal las duplicaría al reingerir el archivo.
+    """
+
+    def __init__(self, conn, db_path, max_adjuntas=SHARD_MAX_ATTACHED):
+        self.conn = conn
+        self.db_path = db_path
+        self.max_adjuntas = max_adjuntas
+        self.consolidada = uses_event_table(conn)
+        self.adjuntas = OrderedDict()   # mes -> esquema, de la menos a la más usada
+        self.cerradas = set()
+        self.sentencias = {}
+        self.filas = {}
+        self.rechazadas = {}
+
+    def schema_for(self, mes):
+        """Esquema donde se escriben las filas de `mes` ("main" si no tiene fecha, None si el mes está cerrado)."""
+        if mes is None:
+            return "main"
+        if mes in self.cerradas:
+            return None
+        esquema = self.adjuntas.get(mes)
+        if esquema is not None:
+            self.adjuntas.move_to_end(mes)
+            return esquema
+        ruta = shard_path(self.db_path, mes)
+        if is_sealed(ruta):
+            print(f"La partición {mes} está cerrada; se descartan sus filas (para agregarlas hay que volver a "
+                  f"darle permiso de escritura al archivo).")
+            self.cerradas.add(mes)
+            return None
+        if len(self.adjuntas) >= self.max_adjuntas:
+            if self.conn.in_transaction:
+                raise ShardLimitError(f"No se puede adjuntar la partición {mes}: ya hay {len(self.adjuntas)} "
+                                      f"adjuntas con cambios sin confirmar (máximo {self.max_adjuntas}).")
+            _, anterior = self.adjuntas.popitem(last=False)
+            self.conn.execute(f"DETACH DATABASE {anterior}")
+        prepare_shard(ruta, self.consolidada)
+        esquema = schema_name(mes)
+        self.conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+        self.adjuntas[mes] = esquema
+        return esquema
+
+    def crowded(self):
+        """Indica si hay más de la mitad de `max_adjuntas` adjuntas: conviene confirmar y soltarlas (detach_all)."""
+        return len(self.adjuntas) > self.max_adjuntas // 2
+
+    def qualify(self, sql, tabla, esquema):
+        """La sentencia INSERT `sql` sobre `tabla`, dirigida a la tabla del mismo nombre en `esquema`."""
+        if esquema == "main":
+            return sql
+        clave = (sql, esquema)
+        if clave not in self.sentencias:
+            self.sentencias[clave] = sql.replace(f" INTO {tabla} (", f" INTO {esquema}.{tabla} (", 1)
+        return self.sentencias[clave]
+
+    def route(self, filas, i_fecha):
+        """
+        Agrupa `filas` por el mes de la columna `i_fecha` y genera (esquema, filas) por mes, sin los meses
+        cerrados. Es un generador para que cada grupo se escriba antes de adjuntar la partición del siguiente.
+        """
+        por_mes = {}
+        for fila in filas:
+            por_mes.setdefault(month_of(fila[i_fecha]), []).append(fila)
+        for mes, grupo in por_mes.items():
+            esquema = self._contar(mes, len(grupo))
+            if esquema is not None:
+                yield esquema, grupo
+
+    def route_frame(self, df, columna="time"):
+        """Como `route`, para un DataFrame con una columna datetime (los bloques de sensores)."""
+        meses = df[columna].dt.strftime('%Y-%m')
+        for mes, parte in df.groupby(meses, sort=True, dropna=False):
+            esquema = self._contar(mes if isinstance(mes, str) else None, len(parte))
+            if esquema is not None:
+                yield esquema, parte
+
+    def _contar(self, mes, n):
+        esquema = self.schema_for(mes)
+        contador = self.filas if esquema is not None else self.rechazadas
+        contador[mes] = contador.get(mes, 0) + n
+        return esquema
+
+    def resumen(self):
+        meses = sorted(mes for mes in self.filas if mes is not None)
+        texto = f"{len(meses)} meses ({meses[0]} a {meses[-1]})" if meses else "sin meses"
+        if self.filas.get(None):
+            texto += f", {self.filas[None]} filas sin fecha en la base principal"
+        if self.rechazadas:
+            texto += (f", {sum(self.rechazadas.values())} filas descartadas de meses cerrados "
+                      f"({', '.join(sorted(self.rechazadas))})")
+        return texto
+
+    def detach_all(self):
+        """Suelta las particiones adjuntas; si hay cambios sin confirmar quedan adjuntas hasta cerrar la conexión."""
+        for esquema in list(self.adjuntas.values()):
+            try:
+                self.conn.execute(f"DETACH DATABASE {esquema}")
+            except sqlite3.Error:
+                pass
+        self.adjuntas.clear()
+
+
+def get_shard_router(conn):
+    """
+    Enrutador de particiones de la conexión de escritura `conn`, creándolo la primera vez, o None si las
+    particiones mensuales no están activas o la base está en memoria.
+    """
+    if not _activo:
+        return None
+    entrada = _routers.get(id(conn))
+    if entrada is not None and entrada[0] is conn:
+        return entrada[1]
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not db_path:
+        return None
+    router = ShardRouter(conn, db_path)
+    _routers[id(conn)] = (conn, router)
+    return router
+
+
+def release_shard_router(conn):
+    """Olvida el enrutador de `conn` y suelta sus particiones (antes de cerrar la conexión). Devuelve el enrutador."""
+    entrada = _routers.pop(id(conn), None)
+    if entrada is None or entrada[0] is not conn:
+        return None
+    entrada[1].detach_all()
+    return entrada[1]
+
+
+class ShardReader:
+    """
+    Conexión de lectura a una base con particiones mensuales. Para cada consulta adjunta, en modo de solo
+    lectura, únicamente las particiones de los meses que se solapan con [desde, hasta], en grupos de como
+    mucho `max_adjuntas`; la base principal (dimensiones, catálogos y filas sin partición) siempre se
+    incluye. Sin particiones se comporta como una conexión normal a la base.
+
+        with ShardReader(db_path) as lector:
+            for fila in lector.rows("P60", "idVehiculo, velocidadVehiculo", "idVehiculo = ?", (1200,),
+                                    desde="2024-05-01", hasta="2024-06-30"):
+                ...
+
+    Los límites solo descartan particiones; el filtro por fecha dentro de cada mes va en `where`.
+    """
+
+    def __init__(self, db_path, max_adjuntas=SHARD_MAX_ATTACHED):
+        self.db_path = db_path
+        self.max_adjuntas = max_adjuntas
+        # Con URI para poder adjuntar las particiones con mode=ro
+        self.conn = sqlite3.connect(Path(db_path).absolute().as_uri(), uri=True)
+        self.particiones = list_shards(db_path)
+        self.adjuntas = []
+
+    def months(self, desde=None, hasta=None):
+        """Meses con partición que se solapan con [desde, hasta] (límites abiertos si son None)."""
+        inicio, fin = month_of(desde), month_of(hasta)
+        return [mes for mes in self.particiones
+                if (inicio is None or mes >= inicio) and (fin is None or mes <= fin)]
+
+    def groups(self, desde=None, hasta=None):
+        """
+        Genera listas de esquemas adjuntos ("main" en la primera): mientras el llamador consulta un grupo,
+        sus particiones siguen adjuntas; al pedir el siguiente se sueltan y se adjuntan las que siguen.
+        Lo que el llamador haya escrito en la base principal se confirma al cambiar de grupo.
+        """
+        meses = self.months(desde, hasta)
+        yield ["main"] + self._attach(meses[:self.max_adjuntas])
+        for i in range(self.max_adjuntas, len(meses), self.max_adjuntas):
+            yield self._attach(meses[i:i + self.max_adjuntas])
+        self._detach()
+
+    def _attach(self, meses):
+        self._detach()
+        esquemas = []
+        for mes in meses:
+            esquema = schema_name(mes)
+            uri = Path(self.particiones[mes]).absolute().as_uri() + "?mode=ro"
+            self.conn.execute(f"ATTACH DATABASE ? AS {esquema}", (uri,))
+            esquemas.append(esquema)
+        self.adjuntas = esquemas
+        return esquemas
+
+    def _detach(self):
+        if self.adjuntas and self.conn.in_transaction:
+            # SQLite no suelta una base adjunta mientras hay una transacción abierta
+            self.conn.commit()
+        for esquema in self.adjuntas:
+            self.conn.execute(f"DETACH DATABASE {esquema}")
+        self.adjuntas = []
+
+    def has_table(self, esquema, tabla):
+        return self.conn.execute(f"SELECT 1 FROM {esquema}.sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+                                 (tabla,)).fetchone() is not None
+
+    def queries(self, tabla, columnas="*", where=None, params=(), desde=None, hasta=None, group_by=None):
+        """
+        Genera (sql, parámetros) de un UNION ALL de `tabla` en los esquemas de cada grupo, para ejecutarlos
+        con self.conn antes de pedir el siguiente (las particiones del grupo están adjuntas mientras tanto).
+        Con `group_by` cada esquema se agrupa por separado: el llamador combina las filas de cada grupo.
+        """
+        filtro = (f" WHERE {where}" if where else "") + (f" GROUP BY {group_by}" if group_by else "")
+        for esquemas in self.groups(desde, hasta):
+            partes = [f"SELECT {columnas} FROM {esquema}.{tabla}{filtro}" for esquema in esquemas
+                      if self.has_table(esquema, tabla)]
+            if partes:
+                yield " UNION ALL ".join(partes), tuple(params) * len(partes)
+
+    def rows(self, tabla, columnas="*", where=None, params=(), desde=None, hasta=None):
+        """Filas de `tabla` en la base principal y en las particiones de [desde, hasta]."""
+        for sql, parametros in self.queries(tabla, columnas, where, params, desde, hasta):
+            yield from self.conn.execute(sql, parametros)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def seal_shards(db_path, antes_de):
+    """
+    Cierra las particiones de los meses anteriores a `antes_de` ('YYYY-MM'): las deja en modo de diario
+    DELETE (un solo archivo, sin -wal), las compacta con VACUUM y las marca como de solo lectura, así que
+    se pueden copiar o archivar tal cual. Las filas que lleguen después para esos meses se descartan
+    (ver ShardRouter). Devuelve los meses cerrados.
+    """
+    cerrados = []
+    for mes, ruta in list_shards(db_path).items():
+        if mes >= antes_de or is_sealed(ruta):
+            continue
+        conn = sqlite3.connect(ruta)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("VACUUM")
+        conn.close()
+        os.chmod(ruta, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        cerrados.append(mes)
+    print(f"Particiones cerradas: {', '.join(cerrados) if cerrados else 'ninguna'}.")
+    return cerrados
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Los módulos del proyecto se importan desde la raíz del repositorio (como en main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
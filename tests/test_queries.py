@@ -0,0 +1,119 @@
+# tests/test_queries.py
+
+import re
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from database import create_indexes, drop_indexes
+from events import EVENT_TABLE, event_types
+from queries import (consultar_vehiculo_rango, consultar_por_ruta, consultar_por_ruta_con_nombre,
+                     consultar_eventos_rango, consultar_sensores_rango, plan_consulta, verificar_indices)
+from schema import ensure_schema
+
+DESDE = datetime(2024, 5, 1)
+HASTA = datetime(2024, 5, 31, 23, 59, 59)
+
+
+def _crear_base(ruta, consolidada):
+    """Base nueva con el catálogo completo, los índices declarados y algunas filas en las tablas consultadas."""
+    conn = sqlite3.connect(ruta)
+    ensure_schema(conn, consolidada=consolidada)
+    create_indexes(conn)
+    tablas = ["P60"] + ([EVENT_TABLE] if consolidada else ["EV1"])
+    for tabla in tablas:
+        columnas = {fila[1] for fila in conn.execute(f'PRAGMA table_info("{tabla}")')}
+        datos = {"idRegistro": None, "idVehiculo": 1200, "idRuta": 7, "fechaHoraLecturaDato": "2024-05-02 10:00:00.000"}
+        if "codigo" in columnas:
+            datos["codigo"] = "EV1"
+        nombres = [nombre for nombre in datos if nombre in columnas]
+        conn.executemany(f"INSERT INTO {tabla} ({', '.join(nombres)}) VALUES ({', '.join('?' * len(nombres))})",
+                         [tuple(i if n == "idRegistro" else datos[n] for n in nombres) for i in range(1, 51)])
+    conn.execute("INSERT INTO sensores (time, bus) VALUES ('2024-05-02 10:00:00', '1200')")
+    conn.commit()
+    return conn
+
+
+@pytest.fixture(params=[False, True], ids=["tablas", "consolidada"])
+def conn(request, tmp_path):
+    conexion = _crear_base(str(tmp_path / "consultas.db"), request.param)
+    yield conexion
+    conexion.close()
+
+
+def _sentencias(conn, consulta):
+    """
+    Ejecuta `consulta(conn)` y devuelve las sentencias SELECT que llegaron a SQLite, con sus parámetros,
+    sin las consultas al catálogo (sqlite_master) con que se detecta el formato de eventos.
+    """
+    sentencias = []
+    conn.set_trace_callback(sentencias.append)
+    try:
+        consulta(conn)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in sentencias if sql.lstrip().upper().startswith("SELECT") and "sqlite_master" not in sql]
+
+
+def _comprobar_plan(conn, sql, indice):
+    """El plan de `sql` busca con `indice` y no recorre ninguna tabla completa."""
+    plan = plan_consulta(conn, sql)
+    assert any(re.search(rf"USING (COVERING )?INDEX {indice}\b", detalle) for detalle in plan), plan
+    assert not any(detalle.startswith("SCAN") for detalle in plan), plan
+
+
+def test_verificar_indices_con_los_indices_declarados(conn):
+    resultados = verificar_indices(conn)
+    assert resultados
+    assert [(tabla, indice) for tabla, indice, ok in resultados if not ok] == []
+    indices = {indice for _, indice, _ in resultados}
+    assert {"idx_P60_vehiculo_fecha", "idx_P60_ruta", "idx_Paradas_nombre", "idx_sensores_bus_time"} <= indices
+
+
+def test_verificar_indices_sin_indices(conn):
+    drop_indexes(conn)
+    assert not any(ok for _, _, ok in verificar_indices(conn))
+
+
+def test_consultar_vehiculo_rango_usa_indice(conn):
+    sentencias = _sentencias(conn, lambda c: consultar_vehiculo_rango(c, "P60", 1200, DESDE, HASTA))
+    assert len(sentencias) == 1
+    _comprobar_plan(conn, sentencias[0], "idx_P60_vehiculo_fecha")
+    assert "TEMP B-TREE" not in " ".join(plan_consulta(conn, sentencias[0]))
+    assert len(consultar_vehiculo_rango(conn, "P60", 1200, DESDE, HASTA)) == 50
+
+
+def test_consultar_por_ruta_usa_indice(conn):
+    sentencias = _sentencias(conn, lambda c: consultar_por_ruta(c, "P60", 7))
+    assert len(sentencias) == 1
+    _comprobar_plan(conn, sentencias[0], "idx_P60_ruta")
+    assert len(consultar_por_ruta(conn, "P60", 7)) == 50
+
+
+def test_consultar_por_ruta_con_nombre_usa_indice(conn):
+    sentencias = _sentencias(conn, lambda c: consultar_por_ruta_con_nombre(c, "P60", 7))
+    assert len(sentencias) == 1
+    _comprobar_plan(conn, sentencias[0], "idx_P60_ruta")
+
+
+def test_consultar_eventos_rango_usa_indice(conn):
+    sentencias = _sentencias(conn, lambda c: consultar_eventos_rango(c, 1200, DESDE, HASTA))
+    assert len(sentencias) == 1
+    if EVENT_TABLE in {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}:
+        _comprobar_plan(conn, sentencias[0], f"idx_{EVENT_TABLE}_vehiculo_fecha")
+    else:
+        # Un UNION ALL con una búsqueda por el índice vehiculo_fecha de cada tipo
+        plan = plan_consulta(conn, sentencias[0])
+        for tipo in event_types():
+            assert any(f"INDEX idx_{tipo}_vehiculo_fecha" in detalle for detalle in plan), (tipo, plan)
+        assert not any(detalle.startswith("SCAN") for detalle in plan), plan
+    assert len(consultar_eventos_rango(conn, 1200, DESDE, HASTA)) == 50
+
+
+def test_consultar_sensores_rango_usa_indice(conn):
+    consulta = lambda c: consultar_sensores_rango(c, "1200", "2024-05-01", "2024-05-31 23:59:59")
+    sentencias = _sentencias(conn, consulta)
+    assert len(sentencias) == 1
+    _comprobar_plan(conn, sentencias[0], "idx_sensores_bus_time")
+    assert len(consulta(conn)) == 1
@@ -0,0 +1,159 @@
+# tests/test_web_scraping.py
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from utils.web_scraping import CacheHttp, crear_sesion, descargar_pagina, descargar_rutas
+
+PAGINA = ('<div class="infoRutaCodigo"><div class="codigoRuta">{id}</div>'
+          '<h4 class="rutaEstacionesNombre">Ruta {id}</h4></div>')
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Manejador)
+        self.lock = threading.Lock()
+        self.solicitudes = []       # (ruta, If-None-Match)
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.fallos = {}            # ruta -> respuestas 503 que quedan por dar
+        self.espera = 0.0
+
+    def url(self, ruta):
+        return f"http://127.0.0.1:{self.server_address[1]}{ruta}"
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    """/ruta/<id>: página con ETag "v<id>", 304 si llega ese ETag; 503 las veces indicadas en `fallos`."""
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.solicitudes.append((self.path, self.headers.get("If-None-Match")))
+            servidor.en_curso += 1
+            servidor.max_en_curso = max(servidor.max_en_curso, servidor.en_curso)
+            fallar = servidor.fallos.get(self.path, 0) > 0
+            if fallar:
+                servidor.fallos[self.path] -= 1
+        try:
+            time.sleep(servidor.espera)
+            id_ruta = self.path.rsplit("/", 1)[-1]
+            etag = f'"v{id_ruta}"'
+            if fallar:
+                self._responder(503, b"")
+            elif self.headers.get("If-None-Match") == etag:
+                self._responder(304, None, {"ETag": etag})
+            else:
+                self._responder(200, PAGINA.format(id=id_ruta).encode("utf-8"), {"ETag": etag})
+        finally:
+            with servidor.lock:
+                servidor.en_curso -= 1
+
+    def _responder(self, estado, cuerpo, encabezados=None):
+        self.send_response(estado)
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        if cuerpo is not None:
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    servidor = _Servidor()
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_descargar_rutas_en_paralelo(servidor):
+    servidor.espera = 0.2
+    inicio = time.perf_counter()
+    resultados = list(descargar_rutas(range(1, 9), url_base=servidor.url("/ruta/{idRuta}"), concurrencia=4))
+    segundos = time.perf_counter() - inicio
+    assert sorted(id_ruta for id_ruta, _, _ in resultados) == list(range(1, 9))
+    assert all(cambio for _, _, cambio in resultados)
+    assert all(contenido == PAGINA.format(id=id_ruta).encode("utf-8") for id_ruta, contenido, _ in resultados)
+    # Ocho solicitudes de 0.2 s con cuatro hilos: unas dos rondas, no ocho
+    assert servidor.max_en_curso > 1
+    assert segundos < 8 * servidor.espera
+
+
+def test_reintenta_despues_de_503(servidor):
+    servidor.fallos["/ruta/5"] = 2
+    sesion = crear_sesion(1, reintentos=3, espera_base=0.01)
+    contenido, cambio = descargar_pagina(sesion, servidor.url("/ruta/5"))
+    sesion.close()
+    assert cambio
+    assert contenido == PAGINA.format(id=5).encode("utf-8")
+    assert [ruta for ruta, _ in servidor.solicitudes] == ["/ruta/5"] * 3
+
+
+def test_503_agota_los_reintentos(servidor):
+    servidor.fallos["/ruta/6"] = 10
+    sesion = crear_sesion(1, reintentos=1, espera_base=0.01)
+    with pytest.raises(requests.RequestException):
+        descargar_pagina(sesion, servidor.url("/ruta/6"))
+    sesion.close()
+    assert len(servidor.solicitudes) == 2
+
+
+def test_304_reutiliza_la_cache(servidor, tmp_path):
+    cache = CacheHttp(str(tmp_path / "cache"))
+    sesion = crear_sesion(1)
+    url = servidor.url("/ruta/7")
+    primera = descargar_pagina(sesion, url, cache)
+    segunda = descargar_pagina(sesion, url, cache)
+    sesion.close()
+    assert primera == (PAGINA.format(id=7).encode("utf-8"), True)
+    assert segunda == (PAGINA.format(id=7).encode("utf-8"), False)
+    assert servidor.solicitudes == [("/ruta/7", None), ("/ruta/7", '"v7"')]
+    # Solo el cuerpo y los encabezados: ningún temporal queda en la carpeta
+    assert sorted(os.path.splitext(nombre)[1] for nombre in os.listdir(cache.carpeta)) == [".html", ".json"]
+
+
+def test_304_sin_cuerpo_guardado_descarga_completa(servidor, tmp_path):
+    cache = CacheHttp(str(tmp_path / "cache"))
+    sesion = crear_sesion(1)
+    url = servidor.url("/ruta/8")
+    descargar_pagina(sesion, url, cache)
+    os.remove(cache._ruta(url) + ".html")
+    contenido, cambio = descargar_pagina(sesion, url, cache)
+    sesion.close()
+    assert (contenido, cambio) == (PAGINA.format(id=8).encode("utf-8"), True)
+    assert servidor.solicitudes == [("/ruta/8", None), ("/ruta/8", '"v8"'), ("/ruta/8", None)]
+    assert cache.leer(url) == contenido
+
+
+def test_guardar_interrumpido_no_deja_encabezados(servidor, tmp_path, monkeypatch):
+    cache = CacheHttp(str(tmp_path / "cache"))
+    sesion = crear_sesion(1)
+    url = servidor.url("/ruta/9")
+    descargar_pagina(sesion, url, cache)
+
+    def fallar(origen, destino):
+        raise OSError("disco lleno")
+
+    # Falla al reemplazar el cuerpo: no quedan encabezados que provoquen un 304 con el cuerpo anterior
+    monkeypatch.setattr(os, "replace", fallar)
+    with pytest.raises(OSError):
+        cache.guardar(url, sesion.get(url))
+    monkeypatch.undo()
+    sesion.close()
+    assert cache.encabezados(url) == {}
+    assert not [nombre for nombre in os.listdir(cache.carpeta) if nombre.endswith(".tmp")]
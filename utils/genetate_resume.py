@@ -1,133 +1,192 @@
-﻿import pandas as pd
-import sqlite3
-from openpyxl import load_workbook
+﻿import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill
 
-def obtener_datos_por_semana(db_path):
+from config import informe_headers
+from coverage import COVERAGE_TABLE, create_coverage_table, rebuild_coverage
+from shards import ShardReader
+
+# Orden de las columnas de días de la semana
+DIAS_ORDENADOS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Definir colores de relleno (un solo objeto por color para todo el libro)
+COLOR_NARANJA = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")  # Solo TXT
+COLOR_AMARILLO = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")  # Solo LOG
+COLOR_VERDE = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")  # TXT y LOG
+
+# Filas del informe ya calculadas, una por bus, día y fuente; se recalculan solo las semanas con datos nuevos
+INFORME_TABLE = "InformeCobertura"
+
+
+def _columnas_informe(cobertura):
+    """Año, semana, día de la semana e 'info' de cada fila de cobertura, con accesores .dt vectorizados."""
+    fechas = pd.to_datetime(cobertura['fecha'], format='%Y-%m-%d')
+    informe = pd.DataFrame({
+        'Año': fechas.dt.strftime('%Y'),
+        'Semana': fechas.dt.strftime('%U'),
+        'DíaSemana': fechas.dt.day_name(),
+        'bus': cobertura['bus'],
+        'source': cobertura['fuente'],
+        'HoraInicio': cobertura['desde'],
+        'HoraFin': cobertura['hasta'],
+    })
+    # Crear columna combinada para mostrar la información en cada celda sin repetir el bus
+    informe['info'] = np.where(
+        informe['source'] == 'TXT',
+        '(' + informe['HoraInicio'].str[11:16] + ' - ' + informe['HoraFin'].str[11:16] + ') [TXT]',
+        '[LOG]',
+    )
+    informe['fecha'] = cobertura['fecha']
+    return informe
+
+
+def actualizar_informe(conn):
     """
-    Consulta la base de datos SQLite para obtener los datos de los registros de los buses organizados por semana.
+    Recalcula en INFORME_TABLE las semanas que tienen días pendientes en la cobertura diaria y
+    desmarca esos días. Devuelve el número de semanas recalculadas.
     """
-    # Conectar a la base de datos
-    conn = sqlite3.connect(db_path)
-
-    # Query para obtener datos de sensores
-    query_sensores = """
-    SELECT time, bus
-    FROM sensores
-    ORDER BY time
+    pendientes = pd.read_sql_query(f"SELECT DISTINCT fecha FROM {COVERAGE_TABLE} WHERE pendiente = 1", conn)
+    if pendientes.empty:
+        return 0
+    fechas = pd.to_datetime(pendientes['fecha'], format='%Y-%m-%d')
+    semanas = set(zip(fechas.dt.strftime('%Y'), fechas.dt.strftime('%U')))
+
+    # Días de domingo a sábado que rodean a las fechas pendientes; luego se filtra por (año, semana)
+    desde = (fechas - pd.to_timedelta((fechas.dt.dayofweek + 1) % 7, unit='D')).min()
+    hasta = (fechas + pd.to_timedelta(6 - (fechas.dt.dayofweek + 1) % 7, unit='D')).max()
+    cobertura = pd.read_sql_query(
+        f"SELECT bus, fecha, fuente, desde, hasta FROM {COVERAGE_TABLE} WHERE fecha BETWEEN ? AND ?",
+        conn, params=(desde.strftime('%Y-%m-%d'), hasta.strftime('%Y-%m-%d')))
+    informe = _columnas_informe(cobertura)
+    informe = informe[pd.Series(list(zip(informe['Año'], informe['Semana'])), index=informe.index).isin(semanas)]
+
+    columnas = ', '.join(f'"{header}" {dtype}' for header, dtype in informe_headers)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {INFORME_TABLE} ({columnas})")
+    conn.executemany(f"DELETE FROM {INFORME_TABLE} WHERE \"Año\" = ? AND Semana = ?", list(semanas))
+    informe.to_sql(INFORME_TABLE, conn, if_exists='append', index=False)
+    conn.execute(f"UPDATE {COVERAGE_TABLE} SET pendiente = 0 WHERE pendiente = 1")
+    conn.commit()
+    return len(semanas)
+
+
+def obtener_datos_por_semana(db_path, reconstruir=False):
     """
+    Obtiene de la base de datos SQLite los datos de los registros de los buses organizados por semana.
 
-    # Query para obtener datos de P60
-    query_P60 = """
-    SELECT fechaHoraLecturaDato AS time, substr(idVehiculo, -4, 4) AS bus
-    FROM P60
-    ORDER BY fechaHoraLecturaDato
+    Parte de la cobertura diaria (primer y último registro por bus, día y fuente) que se mantiene
+    durante la ingesta y que la migración del esquema calcula en las bases anteriores. Con `reconstruir`
+    se recalcula antes desde las tramas y los sensores, con un GROUP BY en SQLite que también recorre las
+    particiones mensuales si las hay (shards.ShardReader). Solo se recalculan las semanas con datos nuevos
+    desde el último informe.
     """
+    # Conectar a la base de datos
+    with ShardReader(db_path) as lector:
+        conn = lector.conn
+        create_coverage_table(conn)
+        if reconstruir:
+            rebuild_coverage(conn, lector.groups())
+        semanas = actualizar_informe(conn)
+
+        grouped = pd.read_sql_query(
+            f"SELECT \"Año\", Semana, \"DíaSemana\", bus, source, HoraInicio, HoraFin, info FROM {INFORME_TABLE} "
+            f"ORDER BY \"Año\", Semana, \"DíaSemana\", bus, source", conn)
+
+    grouped['HoraInicio'] = pd.to_datetime(grouped['HoraInicio'], format='%Y-%m-%d %H:%M:%S')
+    grouped['HoraFin'] = pd.to_datetime(grouped['HoraFin'], format='%Y-%m-%d %H:%M:%S')
+    print(f"Informe: {semanas} semanas recalculadas.")
+    return grouped
 
-    # Leer los datos de ambas tablas
-    df_sensores = pd.read_sql_query(query_sensores, conn)
-    df_P60 = pd.read_sql_query(query_P60, conn)
-
-    conn.close()
-
-    # Convertir las columnas de fecha a tipo datetime
-    df_sensores['time'] = pd.to_datetime(df_sensores['time'], format='mixed')
-    df_P60['time'] = pd.to_datetime(df_P60['time'], format='mixed')
-
-    # Extraer los últimos 4 dígitos del bus para alinearlo con idVehiculo
-    df_sensores['bus'] = df_sensores['bus'].astype(str).str[-4:]
-
-    # Agregar columna de semana, año y día de la semana a ambos DataFrames
-    for df in [df_sensores, df_P60]:
-        df['Semana'] = df['time'].apply(lambda x: x.strftime('%U'))
-        df['Año'] = df['time'].apply(lambda x: x.strftime('%Y'))
-        df['DíaSemana'] = df['time'].apply(lambda x: x.strftime('%A'))
-
-    # Agregar etiquetas para identificar la fuente de los datos
-    df_sensores['source'] = 'TXT'
-    df_P60['source'] = 'LOG'
-
-    # Concatenar ambos DataFrames
-    combined_df = pd.concat([df_sensores, df_P60])
-
-    # Agrupar por Año, Semana, Día de la semana, y bus
-    grouped = combined_df.groupby(['Año', 'Semana', 'DíaSemana', 'bus', 'source']).agg(
-        HoraInicio=('time', 'min'),
-        HoraFin=('time', 'max')
-    ).reset_index()
-
-    # Crear columna combinada para mostrar la información en cada celda sin repetir el bus
-    def format_info(row):
-        if row['source'] == 'TXT':
-            return f"({row['HoraInicio'].strftime('%H:%M')} - {row['HoraFin'].strftime('%H:%M')}) [TXT]"
-        else:  # source is 'LOG'
-            return "[LOG]"
-
-    grouped['info'] = grouped.apply(format_info, axis=1)
 
-    return grouped
+def _escribir_hoja(hoja, datos_año):
+    """Escribe en una hoja de solo escritura la tabla semana/bus x día de la semana de un año."""
+    # Crear una tabla pivotada donde las filas son combinaciones de semana y bus
+    pivot_table = pd.pivot_table(
+        datos_año,
+        index=['Semana', 'bus'],  # Índice combinado de semana y bus
+        columns='DíaSemana',
+        values='info',  # Usar la columna combinada 'info'
+        aggfunc=lambda x: '\n'.join(x),  # Combinar múltiples entradas por día
+        fill_value=''  # Rellenar valores vacíos con cadenas vacías
+    )
+
+    # Ordenar columnas de días de la semana
+    pivot_table = pivot_table.reindex(columns=DIAS_ORDENADOS)
+
+    # Eliminar semanas sin datos (no se dejarán en blanco)
+    pivot_table.dropna(how='all', inplace=True)
+
+    hoja.append(['Semana', 'bus'] + DIAS_ORDENADOS)
+    fila = 1
+    inicio_semana, semana_actual = None, None
+    for (semana, bus), *valores in pivot_table.itertuples(name=None):
+        fila += 1
+        if semana != semana_actual:
+            # La semana se escribe una vez y se combina con las filas siguientes, como en to_excel
+            if inicio_semana is not None and fila - 1 > inicio_semana:
+                hoja.merged_cells.add(f"A{inicio_semana}:A{fila - 1}")
+            inicio_semana, semana_actual = fila, semana
+            celda_semana = semana
+        else:
+            celda_semana = None
+        celdas = [celda_semana, bus]
+        for valor in valores:
+            if not isinstance(valor, str) or not valor:
+                celdas.append(None)
+                continue
+            relleno = _relleno(valor)
+            if relleno is None:
+                celdas.append(valor)
+            else:
+                celda = WriteOnlyCell(hoja, value=valor)
+                celda.fill = relleno
+                celdas.append(celda)
+        hoja.append(celdas)
+    if inicio_semana is not None and fila > inicio_semana:
+        hoja.merged_cells.add(f"A{inicio_semana}:A{fila}")
+
+
+def _relleno(valor):
+    """Color de una celda según la presencia de datos de 'sensores' ([TXT]) y 'P60' ([LOG])."""
+    contains_txt = '[TXT]' in valor
+    contains_log = '[LOG]' in valor
+    if contains_txt and contains_log:
+        return COLOR_VERDE
+    elif contains_txt:
+        return COLOR_NARANJA
+    elif contains_log:
+        return COLOR_AMARILLO
+    return None
+
+
+def escribir_informe_excel(datos, output_file):
+    """
+    Escribe el informe (salida de `obtener_datos_por_semana`) con una hoja por año, en una sola pasada
+    y en modo de solo escritura: las filas se serializan a medida que se agregan y los colores se
+    asignan al escribir cada celda, con rellenos compartidos por todo el libro.
+    """
+    workbook = Workbook(write_only=True)
+    for año, datos_año in datos.groupby('Año', sort=False):
+        _escribir_hoja(workbook.create_sheet(str(año)), datos_año)
+    if not workbook.worksheets:
+        workbook.create_sheet()
+    workbook.save(output_file)
 
 
-def crear_informe_excel(db_path, output_file):
+def crear_informe_excel(db_path, output_file, reconstruir=False):
     """
     Crea un informe en Excel a partir de los datos de la base de datos SQLite.
+    Con `reconstruir` recalcula antes la cobertura diaria (ver obtener_datos_por_semana).
     """
-    datos = obtener_datos_por_semana(db_path)
-
-    # Crear un archivo de Excel con hojas por cada año
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        for año in datos['Año'].unique():
-            datos_año = datos[datos['Año'] == año]
-
-            # Crear una tabla pivotada donde las filas son combinaciones de semana y bus
-            pivot_table = pd.pivot_table(
-                datos_año,
-                index=['Semana', 'bus'],  # Índice combinado de semana y bus
-                columns='DíaSemana',
-                values='info',  # Usar la columna combinada 'info'
-                aggfunc=lambda x: '\n'.join(x),  # Combinar múltiples entradas por día
-                fill_value=''  # Rellenar valores vacíos con cadenas vacías
-            )
-
-            # Ordenar columnas de días de la semana
-            dias_ordenados = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            pivot_table = pivot_table.reindex(columns=dias_ordenados)
-
-            # Eliminar semanas sin datos (no se dejarán en blanco)
-            pivot_table.dropna(how='all', inplace=True)
-
-            # Guardar cada tabla en una hoja de Excel
-            pivot_table.to_excel(writer, sheet_name=str(año))
-
-    # Cargar el archivo Excel guardado para aplicar estilos de color
-    workbook = load_workbook(output_file)
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        # Definir colores de relleno
-        color_naranja = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")  # Naranja
-        color_amarillo = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")  # Amarillo
-        color_verde = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")  # Verde
-
-        # Aplicar color a las celdas basadas en la presencia de datos en 'sensores' y 'P60'
-        for row in sheet.iter_rows(min_row=2, min_col=2):
-            for cell in row:
-                if cell.value:  # Solo colorear celdas no vacías
-                    contains_txt = '[TXT]' in cell.value
-                    contains_log = '[LOG]' in cell.value
-                    if contains_txt and contains_log:
-                        cell.fill = color_verde
-                    elif contains_txt:
-                        cell.fill = color_naranja
-                    elif contains_log:
-                        cell.fill = color_amarillo
-
-    # Guardar los cambios en el archivo
-    workbook.save(output_file)
+    datos = obtener_datos_por_semana(db_path, reconstruir)
+    escribir_informe_excel(datos, output_file)
 
     print(f"Informe guardado en {output_file} con celdas coloreadas.")
 
 
 if __name__ == "__main__":
+    # Ejecutar desde la raíz del proyecto: python -m utils.genetate_resume
     db_path = "C:\\Users\\rrtc2\\Documents\\mi_base_de_datos.db"  # Ruta de tu base de datos
     output_file = "C:\\Users\\rrtc2\\Documents\\informe_semanal.xlsx"  # Ruta donde se guardará el informe
 
@@ -1,14 +1,41 @@
-﻿import requests
-from bs4 import BeautifulSoup
+﻿import argparse
 import csv
+import hashlib
+import json
 import os
 import re  # Importar para expresiones regulares
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def extraer_codigo_nombre_ruta(html_content):
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from database import create_connection
+from route_catalog import upsert_routes
+
+# Solo se construye el árbol de los bloques de la página que se usan: el encabezado de la ruta y el
+# recorrido. El resto del documento (menús, scripts, pie) se descarta mientras se analiza.
+BLOQUES_RUTA = SoupStrainer("div", class_=["infoRutaCodigo", "recorrido1"])
+
+
+def analizar_pagina(html_content):
+    """Analiza una página de ruta una sola vez, conservando solo BLOQUES_RUTA."""
+    return BeautifulSoup(html_content, "html.parser", parse_only=BLOQUES_RUTA)
+
+
+def _soup(pagina):
+    return pagina if isinstance(pagina, BeautifulSoup) else analizar_pagina(pagina)
+
+
+def extraer_codigo_nombre_ruta(pagina):
     """
-    Extrae el código y nombre de la ruta desde el contenido HTML.
+    Extrae el código y nombre de la ruta desde el contenido HTML o desde el resultado de analizar_pagina.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    soup = _soup(pagina)
     ruta_info = soup.find("div", class_="infoRutaCodigo")
 
     if ruta_info:
@@ -18,11 +45,11 @@ def extraer_codigo_nombre_ruta(html_content):
     return None, None
 
 
-def extraer_recorridos(html_content):
+def extraer_recorridos(pagina):
     """
-    Extrae los recorridos de la ruta desde el contenido HTML.
+    Extrae los recorridos de la ruta desde el contenido HTML o desde el resultado de analizar_pagina.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    soup = _soup(pagina)
     recorridos_div = soup.find("div", class_="recorrido1")  # Extrayendo los recorridos en un sentido
 
     recorridos = []
@@ -38,6 +65,14 @@ def extraer_recorridos(html_content):
     return recorridos
 
 
+def extraer_ruta(html_content):
+    """Código, nombre y paradas de una página, analizándola una sola vez."""
+    soup = analizar_pagina(html_content)
+    codigo_ruta, nombre_ruta = extraer_codigo_nombre_ruta(soup)
+    recorridos = extraer_recorridos(soup) if codigo_ruta and nombre_ruta else []
+    return codigo_ruta, nombre_ruta, recorridos
+
+
 def formatear_nombre_archivo(codigo_ruta, nombre_ruta):
     """
     Formatea el nombre del archivo reemplazando espacios en blanco y guiones con guiones bajos.
@@ -69,33 +104,206 @@ def guardar_en_csv(codigo_ruta, nombre_ruta, recorridos, output_folder):
         print(f"Error al guardar el archivo {output_file}: {e}")
 
 
-def main():
-    # Rango de idRuta a iterar
-    start_id = 128
-    end_id = 1275
+# Página de cada ruta; {idRuta} se reemplaza por el identificador
+URL_BASE = ("https://www.transmilenio.gov.co/loader.php?lServicio=Rutas&lTipo=busqueda&lFuncion=rutaZonal"
+            "&idRuta={idRuta}&rastro=ruta")
+
+# Respuestas que se reintentan con espera exponencial
+ESTADOS_REINTENTO = (429, 500, 502, 503, 504)
+
+
+def crear_sesion(concurrencia, reintentos=3, espera_base=0.5):
+    """
+    Sesión HTTP compartida por todos los hilos: un pool de hasta `concurrencia` conexiones reutilizables
+    y reintentos con espera exponencial (espera_base * 2^n) ante errores de conexión y ESTADOS_REINTENTO.
+    """
+    reintento = Retry(total=reintentos, backoff_factor=espera_base, status_forcelist=ESTADOS_REINTENTO,
+                      allowed_methods=["GET"], respect_retry_after_header=True)
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=concurrencia, max_retries=reintento)
+    sesion = requests.Session()
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+class LimitadorTasa:
+    """Limita las solicitudes a `por_segundo` por segundo entre todos los hilos (0 o None: sin límite)."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self.siguiente = time.monotonic()
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self.lock:
+            ahora = time.monotonic()
+            turno = max(self.siguiente, ahora)
+            self.siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
 
-    # Solicitar la carpeta de destino al usuario
-    output_folder = input("Ingrese la carpeta de destino para guardar los archivos CSV: ")
 
-    for idRuta in range(start_id, end_id + 1):
-        # Construir la URL con el idRuta actual
-        url = f"https://www.transmilenio.gov.co/loader.php?lServicio=Rutas&lTipo=busqueda&lFuncion=rutaZonal&idRuta={idRuta}&rastro=ruta"
+class CacheHttp:
+    """
+    Caché en disco de las páginas descargadas: por cada URL guarda el cuerpo y los encabezados ETag y
+    Last-Modified, y los envía en la siguiente descarga (If-None-Match / If-Modified-Since) para que el
+    servidor responda 304 si la página no cambió. Los dos archivos se escriben en temporales que se
+    renombran, y los encabezados van al final: si la escritura se interrumpe, la URL queda sin encabezados
+    condicionales y se descarga completa, nunca un 304 que reutilice un cuerpo a medio escribir.
+    """
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _ruta(self, url):
+        return os.path.join(self.carpeta, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def encabezados(self, url):
+        """Encabezados condicionales para `url`, si está en la caché."""
+        try:
+            with open(self._ruta(url) + ".json", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        encabezados = {}
+        if meta.get("etag"):
+            encabezados["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            encabezados["If-Modified-Since"] = meta["last_modified"]
+        return encabezados
+
+    def leer(self, url):
+        """Cuerpo guardado de `url`, o None si no está."""
+        try:
+            with open(self._ruta(url) + ".html", "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def guardar(self, url, respuesta):
+        ruta = self._ruta(url)
+        # Sin encabezados mientras se reemplaza el cuerpo, para que no se pidan con el cuerpo anterior
+        try:
+            os.remove(ruta + ".json")
+        except FileNotFoundError:
+            pass
+        self._escribir(ruta + ".html", respuesta.content)
+        meta = {"url": url, "etag": respuesta.headers.get("ETag"),
+                "last_modified": respuesta.headers.get("Last-Modified")}
+        self._escribir(ruta + ".json", json.dumps(meta).encode("utf-8"))
+
+    def _escribir(self, destino, contenido):
+        descriptor, temporal = tempfile.mkstemp(dir=self.carpeta, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(contenido)
+            os.replace(temporal, destino)
+        except BaseException:
+            os.remove(temporal)
+            raise
+
+
+def descargar_pagina(sesion, url, cache=None, limitador=None, timeout=15):
+    """
+    Descarga una página con la sesión compartida. Devuelve (contenido, cambió): con caché, una respuesta
+    304 devuelve el contenido guardado y cambió=False (si el cuerpo ya no está se vuelve a pedir completo).
+    """
+    encabezados = cache.encabezados(url) if cache else {}
+    if limitador:
+        limitador.esperar()
+    respuesta = sesion.get(url, headers=encabezados, timeout=timeout)
+    if respuesta.status_code == 304 and cache:
+        contenido = cache.leer(url)
+        if contenido is not None:
+            return contenido, False
+        if limitador:
+            limitador.esperar()
+        respuesta = sesion.get(url, timeout=timeout)
+    respuesta.raise_for_status()
+    if cache:
+        cache.guardar(url, respuesta)
+    return respuesta.content, True
+
+
+def descargar_rutas(ids_ruta, url_base=URL_BASE, concurrencia=8, por_segundo=None, reintentos=3, timeout=15,
+                    carpeta_cache=None):
+    """
+    Descarga las páginas de `ids_ruta` con `concurrencia` hilos y genera (idRuta, contenido, cambió) a
+    medida que terminan. Las rutas que fallan después de los reintentos se informan y se omiten.
+    """
+    sesion = crear_sesion(concurrencia, reintentos)
+    cache = CacheHttp(carpeta_cache) if carpeta_cache else None
+    limitador = LimitadorTasa(por_segundo)
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        futuros = {
+            executor.submit(descargar_pagina, sesion, url_base.format(idRuta=id_ruta), cache, limitador, timeout): id_ruta
+            for id_ruta in ids_ruta
+        }
+        for futuro in as_completed(futuros):
+            id_ruta = futuros[futuro]
+            try:
+                contenido, cambio = futuro.result()
+            except requests.RequestException as e:
+                print(f"Error al descargar idRuta={id_ruta}: {e}")
+                continue
+            yield id_ruta, contenido, cambio
+    sesion.close()
 
-        # Obtener contenido HTML
-        response = requests.get(url)
-        html_content = response.content
 
-        # Extraer código y nombre de ruta
-        codigo_ruta, nombre_ruta = extraer_codigo_nombre_ruta(html_content)
+def main():
+    parser = argparse.ArgumentParser(description="Descarga el catálogo de rutas zonales (rutas y paradas en orden).")
+    parser.add_argument('--db', type=str, default=None, help='Base de datos SQLite donde guardar las tablas Rutas y Paradas.')
+    parser.add_argument('--csv', type=str, default=None, help='Carpeta donde guardar además un CSV por ruta.')
+    parser.add_argument('--desde', type=int, default=128, help='Primer idRuta a descargar.')
+    parser.add_argument('--hasta', type=int, default=1275, help='Último idRuta a descargar.')
+    parser.add_argument('--url_base', type=str, default=URL_BASE,
+                        help='URL de la página de una ruta, con {idRuta} donde va el identificador.')
+    parser.add_argument('--concurrencia', type=int, default=8, help='Descargas simultáneas.')
+    parser.add_argument('--por_segundo', type=float, default=5.0,
+                        help='Máximo de solicitudes por segundo (0 para no limitar).')
+    parser.add_argument('--reintentos', type=int, default=3, help='Reintentos por página con espera exponencial.')
+    parser.add_argument('--timeout', type=float, default=15.0, help='Segundos máximos de espera por solicitud.')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Carpeta de la caché HTTP; las páginas sin cambios no se vuelven a descargar.')
+    parser.add_argument('--lote', type=int, default=200, help='Rutas por transacción al guardar en la base de datos.')
+    args = parser.parse_args()
+    if not args.db and not args.csv:
+        parser.error("Indique --db, --csv o ambos.")
 
-        # Extraer recorridos solo si se obtiene el código y nombre de la ruta
-        if codigo_ruta and nombre_ruta:
-            recorridos = extraer_recorridos(html_content)
+    conn = create_connection(args.db) if args.db else None
+    inicio = time.perf_counter()
+    paginas = sin_cambios = paradas = 0
+    lote = []
+    for idRuta, html_content, cambio in descargar_rutas(range(args.desde, args.hasta + 1), args.url_base,
+                                                         args.concurrencia, args.por_segundo, args.reintentos,
+                                                         args.timeout, args.cache):
+        paginas += 1
+        sin_cambios += not cambio
 
-            # Guardar en CSV
-            guardar_en_csv(codigo_ruta, nombre_ruta, recorridos, output_folder)
-        else:
+        # Extraer código, nombre y recorridos con un solo análisis de la página
+        codigo_ruta, nombre_ruta, recorridos = extraer_ruta(html_content)
+        if not (codigo_ruta and nombre_ruta):
             print(f"No se pudo extraer el código o el nombre de la ruta para idRuta={idRuta}.")
+            continue
+
+        if args.csv:
+            guardar_en_csv(codigo_ruta, nombre_ruta, recorridos, args.csv)
+        if conn:
+            lote.append((idRuta, codigo_ruta, nombre_ruta, recorridos))
+            if len(lote) >= args.lote:
+                paradas += upsert_routes(conn, lote)
+                lote = []
+    if conn:
+        paradas += upsert_routes(conn, lote)
+        conn.close()
+        print(f"Catálogo guardado en {args.db}: {paradas} paradas.")
+
+    print(f"{paginas} páginas en {time.perf_counter() - inicio:.1f} s ({sin_cambios} sin cambios según la caché).")
+
 
 if __name__ == "__main__":
+    # Uso: python -m utils.web_scraping --db base.db [--csv carpeta] (desde la raíz del proyecto)
     main()